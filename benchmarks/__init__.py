@@ -0,0 +1,8 @@
+import time
+
+
+def timed(function) -> float:
+    # In ms
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
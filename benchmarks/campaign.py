@@ -0,0 +1,75 @@
+import argparse
+import random
+from typing import Sequence, Tuple
+
+from model import Event, History, Period, Scene
+from storage import save_as
+
+
+# Made up campaigns for testing with: the same seed and sizes always give the same game, down to the text. Every card
+# has the fields a real one does, with text a few words to a few sentences long strung together from a vocabulary of
+# the sort of thing people write on Microscope cards, the common words turning up much more often than the rest.
+#
+#   python -m benchmarks.campaign game.mscope --periods 25 --events 19 --scenes 20
+# writes one out for the server or the window to open.
+
+WORDS = ("the", "the", "the", "a", "a", "of", "of", "and", "and", "to", "in", "is", "was", "who", "why", "does", "her",
+         "his", "their", "king", "queen", "empire", "colony", "ship", "fleet", "war", "peace", "plague", "harvest",
+         "machine", "god", "temple", "river", "city", "wall", "falls", "rises", "dies", "wakes", "burns", "signs",
+         "betrays", "remembers", "forgets", "last", "first", "old", "new", "dark", "golden", "hidden", "broken",
+         "treaty", "heir", "prophet", "council", "rebellion", "exile", "dragon", "mountain", "sea", "stars", "signal",
+         "archive", "child", "mother", "stranger", "crown", "oath", "storm", "winter", "bridge", "gate", "song")
+
+PERIOD_WORDS = (2, 8)
+EVENT_WORDS = (4, 16)
+SCENE_WORDS = (4, 24)  # For each of question, setting and answer
+DARK = .4  # Chance of a card being dark
+
+
+def text(rng: random.Random, length: Tuple[int, int], words: Sequence[str] = WORDS) -> str:
+    # Zipf-ish: earlier words are picked much more often
+    picked = [words[int(len(words) * rng.random() ** 2)] for _ in range(rng.randint(*length))]
+    picked[0] = picked[0].capitalize()
+    return " ".join(picked)
+
+
+def generate(seed: int, periods: int, events: int, scenes: int, period_words: Tuple[int, int] = PERIOD_WORDS,
+             event_words: Tuple[int, int] = EVENT_WORDS, scene_words: Tuple[int, int] = SCENE_WORDS,
+             words: Sequence[str] = WORDS) -> History:
+    # periods periods of events events, each with scenes scenes. Word counts are (fewest, most) for each field, and
+    # the text is made from words, the most common first.
+    rng = random.Random(seed)
+    history = History()
+    for p in range(periods):
+        history.insert_period(p, Period(text(rng, period_words, words), rng.random() < DARK, [
+            Event(text(rng, event_words, words), rng.random() < DARK, [
+                Scene(text(rng, scene_words, words) + "?", text(rng, scene_words, words), text(rng, scene_words, words),
+                      rng.random() < DARK)
+                for _ in range(scenes)])
+            for _ in range(events)]))
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write out a made up campaign")
+    parser.add_argument("game", help="file to save it to (an SQLite database if it ends in .db, .sqlite or .sqlite3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--periods", type=int, default=10)
+    parser.add_argument("--events", type=int, default=10, help="per period")
+    parser.add_argument("--scenes", type=int, default=10, help="per event")
+    parser.add_argument("--period-words", type=int, nargs=2, default=PERIOD_WORDS, metavar=("FEWEST", "MOST"),
+                        help="words in a period's text (default: %(default)s)")
+    parser.add_argument("--event-words", type=int, nargs=2, default=EVENT_WORDS, metavar=("FEWEST", "MOST"),
+                        help="words in an event's text (default: %(default)s)")
+    parser.add_argument("--scene-words", type=int, nargs=2, default=SCENE_WORDS, metavar=("FEWEST", "MOST"),
+                        help="words in each of a scene's question, setting and answer (default: %(default)s)")
+    args = parser.parse_args()
+
+    history = generate(args.seed, args.periods, args.events, args.scenes, tuple(args.period_words),
+                       tuple(args.event_words), tuple(args.scene_words))
+    save_as(history, args.game)
+    print("{} cards".format(len(history.cards)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import ops
+from benchmarks.campaign import EVENT_WORDS, SCENE_WORDS, generate, text
+from client import Client
+from storage import save_as
+
+
+# Load test for hosting: a server.py of its own, on a made up campaign (see benchmarks.campaign), and dozens of bots
+# joining it and making inserts and edits at a steady rate, like players would but a lot faster. Bots are spread over a
+# few processes so that applying everyone's changes doesn't make them the bottleneck. It reports
+#   throughput  changes the server made a second, and changes delivered to bots a second
+#   fan-out     how long from a bot making a change to each of the other bots having it, as percentiles
+#   round trip  how long from a bot making a change to the server's answer getting back to it
+#   memory      the server's resident size before anyone's joined, and at its peak
+#
+#   python -m benchmarks.load --bots 40 --rate 5 --seconds 20
+#
+# Every change's text ends with a tag unique to it, which is how the bots that get it know which change it was. Times
+# are from time.monotonic, which is the same clock in every process.
+
+BOTS = 32
+PROCESSES = 4
+RATE = 4.0  # Changes per bot per second
+SECONDS = 15.0
+SETTLE = 3.0  # s after the bots stop for the last changes to get round
+SHAPE = (20, 10, 10)  # Periods, events per period, scenes per event
+
+Key = Tuple[int, str]  # A change's card id and its tagged text
+
+
+def key(op: ops.Op) -> Key:
+    return op.card, op.fields.get("text", op.fields.get("question"))
+
+
+def change(rng: random.Random, history, ids: List[int], tag: str) -> ops.Op:
+    # An insert half the time and an edit the other half. The change's text ends with tag.
+    card = history.cards.get(rng.choice(ids))
+    if card is None:
+        card = history.periods[0]
+    level = ops.level_of(card)
+    if rng.random() < .5 and level < 3:
+        children = ops.siblings(history, card)
+        if level == 2:
+            fields = {"question": text(rng, SCENE_WORDS) + " " + tag, "setting": text(rng, SCENE_WORDS),
+                      "answer": text(rng, SCENE_WORDS), "is_dark": False}
+        else:
+            fields = {"text": text(rng, EVENT_WORDS) + " " + tag, "is_dark": False}
+        return ops.insert_op(history, card, rng.randint(0, len(children)), fields)
+    name = "question" if level == 3 else "text"
+    return ops.edit_op(card, {name: text(rng, EVENT_WORDS) + " " + tag})
+
+
+async def bot(number: int, port: int, start: float, seconds: float, rate: float, sent: Dict[Key, float],
+              received: List[Tuple[Key, float]], acked: List[Tuple[Key, float]]):
+    rng = random.Random(number)
+    client = Client()
+
+    def on_op(op: ops.Op, sender: int):
+        (acked if sender == client.id else received).append((key(op), time.monotonic()))
+
+    for message in await client.connect("127.0.0.1", port):
+        client.receive(message)
+    client.on_op = on_op
+    running = asyncio.ensure_future(client.run())
+
+    ids = list(client.history.cards)
+    await asyncio.sleep(max(0., start - time.monotonic()))
+    end = start + seconds
+    made = 0
+    next_change = time.monotonic()
+    while next_change < end:
+        await asyncio.sleep(max(0., next_change - time.monotonic()))
+        op = change(rng, client.history, ids, "#{}.{}".format(number, made))
+        sent[key(op)] = time.monotonic()
+        client.submit(op)
+        made += 1
+        if made % 50 == 0:
+            ids = list(client.history.cards)
+        next_change += rng.expovariate(rate)
+
+    await asyncio.sleep(max(0., end + SETTLE - time.monotonic()))
+    await client.close()
+    await running
+
+
+def run_bots(numbers: List[int], port: int, start: float, seconds: float, rate: float):
+    # One process's worth
+    sent = {}
+    received = []
+    acked = []
+
+    async def main():
+        await asyncio.gather(*(bot(number, port, start, seconds, rate, sent, received, acked) for number in numbers))
+
+    asyncio.run(main())
+    return sent, received, acked
+
+
+def memory(pid: int) -> Dict[str, int]:
+    # In KiB, from Linux's /proc
+    sizes = {}
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    sizes[name] = int(value.split()[0])
+    except OSError:
+        pass
+    return sizes
+
+
+def wait_for(port: int, server: subprocess.Popen, timeout: float = 60):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if server.poll() is not None:
+            raise RuntimeError("the server exited with {}".format(server.returncode))
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(.1)
+    raise RuntimeError("the server didn't start listening")
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def percentiles(times: List[float]) -> dict:
+    times = sorted(times)
+    if not times:
+        return {}
+    return {"count": len(times), **{"p{}_ms".format(p): times[min(len(times) - 1, len(times) * p // 100)] * 1000
+                                    for p in (50, 90, 99)}, "max_ms": times[-1] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a game server with bots")
+    parser.add_argument("--bots", type=int, default=BOTS)
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="to run the bots in")
+    parser.add_argument("--rate", type=float, default=RATE, help="changes per bot per second")
+    parser.add_argument("--seconds", type=float, default=SECONDS)
+    parser.add_argument("--shape", type=int, nargs=3, default=SHAPE, metavar=("PERIODS", "EVENTS", "SCENES"),
+                        help="of the campaign the server starts with (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", metavar="FILE", help="write the results to FILE as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "load.mscope")
+        history = generate(args.seed, *args.shape)
+        save_as(history, path)
+
+        port = free_port()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        server = subprocess.Popen([sys.executable, os.path.join(root, "server.py"), "--host", "127.0.0.1",
+                                   "--port", str(port), path])
+        try:
+            wait_for(port, server)
+            start_size = memory(server.pid)
+
+            # Everyone starts at once, after enough time for all of them to join
+            start = time.monotonic() + 2 + .05 * args.bots
+            groups = [list(range(i, args.bots, args.processes)) for i in range(min(args.processes, args.bots))]
+            with multiprocessing.Pool(len(groups)) as pool:
+                results = pool.starmap(run_bots, [(group, port, start, args.seconds, args.rate) for group in groups])
+            peak = memory(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    sent = {}
+    for group_sent, _, _ in results:
+        sent.update(group_sent)
+    fan_out = [at - sent[change] for _, received, _ in results for change, at in received if change in sent]
+    round_trip = [at - sent[change] for _, _, acked in results for change, at in acked if change in sent]
+    made = sum(len(acked) for _, _, acked in results)
+
+    report = {"bots": args.bots, "processes": len(groups), "rate": args.rate, "seconds": args.seconds,
+              "cards": len(history.cards), "changes_sent": len(sent), "changes_made": made,
+              "changes_per_second": made / args.seconds, "deliveries": len(fan_out),
+              "deliveries_per_second": len(fan_out) / args.seconds,
+              "fan_out": percentiles(fan_out), "round_trip": percentiles(round_trip),
+              "server_memory_kib": {"start": start_size.get("VmRSS"), "peak": peak.get("VmHWM"),
+                                    "end": peak.get("VmRSS")}}
+
+    print("{bots} bots at {rate}/s for {seconds}s on {cards} cards".format(**report))
+    print("changes:     {} sent, {} made, {:.0f}/s".format(len(sent), made, report["changes_per_second"]))
+    print("deliveries:  {} ({:.0f}/s)".format(len(fan_out), report["deliveries_per_second"]))
+    for name in ("fan_out", "round_trip"):
+        result = report[name]
+        if result:
+            print("{:<12} p50 {p50_ms:7.1f}ms  p90 {p90_ms:7.1f}ms  p99 {p99_ms:7.1f}ms  max {max_ms:7.1f}ms".format(
+                name.replace("_", "-") + ":", **result))
+    sizes = report["server_memory_kib"]
+    if sizes["start"] is not None:
+        print("server:      {} KiB at the start, {} KiB peak".format(sizes["start"], sizes["peak"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
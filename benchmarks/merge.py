@@ -0,0 +1,55 @@
+import random
+import time
+
+import ops
+from model import History
+from ops import Op
+
+
+# How fast ops apply, on a game built up from random changes. The same random changes are what tests/test_merge.py
+# fuzzes concurrent orderings with.
+#
+#   python -m benchmarks.merge
+
+CHANGES = 5000
+
+
+def random_change(rng: random.Random, history: History, edits: float = 0) -> Op:
+    # An insert, a delete a quarter of the time, or an edit the edits of the time. Edits pick from a handful of values,
+    # so they often change a field to what it already is.
+    cards = list(history.cards.values())
+    roll = rng.random()
+    if cards and roll < .25:
+        return ops.delete_op(rng.choice(cards))
+    if cards and roll < .25 + edits:
+        card = rng.choice(cards)
+        names = [name for name in ops.FIELDS[ops.level_of(card)] if rng.random() < .5] or ["is_dark"]
+        return ops.edit_op(card, {name: rng.random() < .5 if name == "is_dark" else str(rng.randrange(4))
+                                  for name in names})
+
+    parents = [None] + [card for card in cards if ops.level_of(card) < 3]
+    parent = rng.choice(parents)
+    index = rng.randint(0, len(ops.siblings(history, parent)))
+    level = ops.level_of(parent) + 1 if parent is not None else 1
+    fields = {name: rng.random() < .5 if name == "is_dark" else str(rng.randrange(100))
+              for name in ops.FIELDS[level]}
+    return ops.insert_op(history, parent, index, fields)
+
+
+def main():
+    rng = random.Random(1)
+    history = History()
+    changes = []
+    for _ in range(CHANGES):
+        changes.append(random_change(rng, history))
+        ops.apply(history, changes[-1])
+    history = History()
+    start = time.perf_counter()
+    for op in changes:
+        ops.apply(history, op)
+    print("apply: {:,.0f} ops/s, ending with {} cards".format(len(changes) / (time.perf_counter() - start),
+                                                              len(history.cards)))
+
+
+if __name__ == "__main__":
+    main()
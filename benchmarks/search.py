@@ -0,0 +1,78 @@
+import random
+
+import ops
+from benchmarks import timed
+from benchmarks.campaign import generate, text
+from model import History
+from search import SearchIndex
+
+
+# How long a search takes on a big game, and what keeping the index up to date costs the changes that have to do it.
+# The game is about 10,000 cards (see benchmarks.campaign) of text made up from a few thousand words, so some are in a
+# lot of cards and most are in a few. Searches are for one word, two words and the start of a word, like they come in
+# while someone's typing.
+#
+#   python -m benchmarks.search
+
+PERIODS = 40
+EVENTS = 25
+SCENES = 9
+WORDS = 3000
+SEARCHES = 500
+
+
+def report(name: str, times: list):
+    times = sorted(times)
+    print("{:<12} median {:6.3f}ms  99% {:6.3f}ms  max {:6.3f}ms".format(
+        name, times[len(times) // 2], times[len(times) * 99 // 100], times[-1]))
+
+
+def main():
+    rng = random.Random(21)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+                  for _ in range(WORDS)]
+    game = generate(21, PERIODS, EVENTS, SCENES, (4, 4), (8, 8), (6, 10), vocabulary)
+    history = History()
+    history.index = SearchIndex()
+
+    def build_index():
+        for op in ops.snapshot(game):
+            ops.apply(history, op)
+
+    build = timed(build_index)
+    print("{} cards, {} words indexed, built by inserting in {:.0f}ms".format(
+        len(history.cards), len(history.index.postings), build))
+
+    index = history.index
+    common = vocabulary[:20]
+    queries = {
+        "common word": lambda: rng.choice(common),
+        "rare word": lambda: rng.choice(vocabulary[WORDS // 2:]),
+        "two words": lambda: rng.choice(common) + " " + rng.choice(vocabulary),
+        "prefix": lambda: rng.choice(vocabulary)[:rng.randint(1, 3)],
+    }
+    for name, query in queries.items():
+        report(name, [timed(lambda: index.search(query())) for _ in range(SEARCHES)])
+
+    cards = list(history.cards.values())
+    edit_times = []
+    for _ in range(SEARCHES):
+        card = rng.choice(cards)
+        name = "question" if ops.level_of(card) == 3 else "text"
+        op = ops.edit_op(card, {name: text(rng, (8, 8), vocabulary)})
+        edit_times.append(timed(lambda: ops.apply(history, op)))
+    report("edit", edit_times)
+
+    periods = list(history.periods)
+    delete_times = [timed(lambda: ops.apply(history, ops.delete_op(period))) for period in periods[:10]]
+    report("delete period", delete_times)
+
+    # Everything that's left has to still be findable, and nothing that's gone
+    for card in rng.sample(list(history.cards.values()), 200):
+        name = "question" if ops.level_of(card) == 3 else "text"
+        assert card.id in index.search(getattr(card, name), len(index)), "lost a card"
+    assert len(index) == len(history.cards), "index has deleted cards"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+import ops
+import storage
+from benchmarks import timed
+from benchmarks.campaign import generate
+from model import History
+
+
+# Compares the two ways a game can be saved (see storage): a snapshot file with journals, and an SQLite database. For
+# made up campaigns (see benchmarks.campaign) of a few sizes it times
+#   save      writing out the whole game
+#   open      opening it, which only reads the periods
+#   events    reading one period's events, like scrolling it into view
+#   scenes    reading one event's scenes, like selecting it
+#   all       reading everything
+#   edits     saving a burst of 1000 edits
+#
+#   python -m benchmarks.storage
+
+SIZES = ((10, 10, 10), (20, 25, 20), (40, 25, 100))  # Periods, events per period, scenes per event
+
+
+def measure(history: History, path: str) -> dict:
+    results = {"save": timed(lambda: storage.save_as(history, path))}
+    size = os.path.getsize(path)
+
+    loaded = History()
+    game = storage.open_game(path)
+    results["open"] = timed(lambda: game.load(loaded))
+    middle = loaded.periods[len(loaded.periods) // 2]
+    results["events"] = timed(lambda: middle.events.load())
+    event = middle.events[len(middle.events) // 2]
+    results["scenes"] = timed(lambda: event.scenes.load())
+    results["all"] = timed(lambda: ops.snapshot(loaded))
+
+    cards = list(loaded.cards.values())
+
+    def edits():
+        for i in range(1000):
+            card = cards[i * 7919 % len(cards)]
+            name = "question" if ops.level_of(card) == 3 else "text"
+            op = ops.edit_op(card, {name: "Edit {}".format(i)})
+            game.record(ops.trimmed(op, ops.apply(loaded, op)))
+        game.close()  # Which waits for them to be written
+
+    results["edits"] = timed(edits)
+    results["size"] = size
+    return results
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        print("{:>7} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "cards", "format", "save", "open", "events", "scenes", "all", "edits", "size"))
+        for periods, events, scenes in SIZES:
+            history = generate(0, periods, events, scenes)
+            for name, suffix in (("file", ".mscope"), ("sqlite", ".db")):
+                path = os.path.join(directory, "{}-{}{}".format(name, len(history.cards), suffix))
+                results = measure(history, path)
+                results["size"] /= 1024
+                print("{:>7} {:>8} {save:>7.1f}ms {open:>7.1f}ms {events:>7.2f}ms {scenes:>7.2f}ms {all:>7.1f}ms "
+                      "{edits:>7.1f}ms {size:>8.0f}K".format(len(history.cards), name, **results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tkinter
+from typing import Callable, Dict, List
+
+import ops
+from benchmarks.campaign import generate
+from gui import MainWindow
+from model import History
+
+
+# Times what the player does to the timelines, on a real window, for games of 10 to 10,000 cards: inserting at the
+# head, middle and tail of each strip, editing, deleting, switching the selection, bringing up an event's scenes for
+# the first time and scrolling. Every step waits for Tk to finish drawing before the clock stops. Results go to a JSON
+# file, with the commit they're for, so runs from before and after a change can be compared.
+#
+# It needs a display. On a machine without one, run it under a virtual X server:
+#   xvfb-run -s "-screen 0 1600x1000x24" python -m benchmarks.timeline --output results.json
+# --canvas times the canvas drawn cards instead of the widget ones.
+
+# Cards: (periods, events per period, scenes per event)
+SHAPES = {10: (1, 3, 2), 100: (4, 4, 5), 1000: (10, 9, 10), 10000: (25, 19, 20)}
+RUNS = 20
+GEOMETRY = "1400x900"
+
+
+def timed(mw: MainWindow, step: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    step()
+    mw.update_idletasks()
+    return (time.perf_counter() - start) * 1000
+
+
+def summary(times: List[float]) -> dict:
+    times = sorted(times)
+    return {"runs": len(times), "median_ms": times[len(times) // 2], "max_ms": times[-1],
+            "mean_ms": sum(times) / len(times)}
+
+
+def window(history: History, canvas_cards: bool) -> MainWindow:
+    mw = MainWindow(canvas_cards=canvas_cards)
+    mw.geometry(GEOMETRY)
+    with mw.batch():
+        for op in ops.snapshot(history):
+            mw.apply_op(op)
+    mw.history.last_id = history.last_id
+    mw.update()
+    return mw
+
+
+def measure(mw: MainWindow, runs: int) -> Dict[str, dict]:
+    rng = random.Random(24)
+    history = mw.history
+    results = {}
+
+    def positions(cards) -> Dict[str, int]:
+        return {"head": 0, "middle": len(cards) // 2, "tail": len(cards)}
+
+    # Each insert is followed by deleting what went in, so the game stays the same size throughout
+    middle_period = history.periods[len(history.periods) // 2]
+    middle_event = middle_period.events[len(middle_period.events) // 2]
+    if mw.is_minimized:
+        mw.minimize_control()  # So the scene timeline is showing
+    mw.e_selection(2 * middle_period.events.index(middle_event) + 1, middle_period)
+    mw.update()
+    levels = (("period", None, {"text": "New Period", "is_dark": False}),
+              ("event", middle_period, {"text": "New Event", "is_dark": False}),
+              ("scene", middle_event, {"question": "New Scene Question", "setting": "New Scene Setting",
+                                       "answer": "New Scene Answer", "is_dark": False}))
+    for level, parent, fields in levels:
+        deletes = []
+        for where, index in positions(ops.siblings(history, parent)).items():
+            times = []
+            for _ in range(runs):
+                op = ops.insert_op(history, parent, index, fields)
+                times.append(timed(mw, lambda: mw.submit(op)))
+                deletes.append(timed(mw, lambda: mw.submit(ops.delete_op(history.cards[op.card]))))
+            results["insert_{}_{}".format(level, where)] = summary(times)
+        results["delete_" + level] = summary(deletes)
+
+        cards = list(ops.siblings(history, parent))
+        name = "question" if level == "scene" else "text"
+        results["edit_" + level] = summary([
+            timed(mw, lambda: mw.submit(ops.edit_op(rng.choice(cards), {name: "Edit {}".format(i)})))
+            for i in range(runs)])
+
+    # Selecting cards all over the game, which also scrolls to them
+    cards = list(history.cards.values())
+    results["select"] = summary([timed(mw, lambda: mw.go_to(rng.choice(cards).id)) for _ in range(runs)])
+
+    # An event's scenes the first time it's selected: every event in the game is a different one, so nothing's cached
+    events = [event for period in history.periods for event in period.events]
+    rng.shuffle(events)
+    results["scene_strip"] = summary([
+        timed(mw, lambda: mw.e_selection(2 * event.period.events.index(event) + 1, event.period))
+        for event in events[:runs]])
+
+    results["scroll_horizontal"] = summary([timed(mw, lambda: mw.horizontal_scroll("moveto", rng.random()))
+                                            for _ in range(runs)])
+
+    def scroll_down():
+        mw.event_timeline.yview_moveto(rng.random())
+        mw.update_event_strips()
+
+    results["scroll_vertical"] = summary([timed(mw, scroll_down) for _ in range(runs)])
+    results["scroll_scenes"] = summary([timed(mw, lambda: mw.scene_timeline_scroll("moveto", rng.random()))
+                                        for _ in range(runs)])
+    return results
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time timeline operations on a real window")
+    parser.add_argument("--output", metavar="FILE", help="write the results to FILE as JSON")
+    parser.add_argument("--canvas", action="store_true", help="canvas drawn cards instead of widgets")
+    parser.add_argument("--sizes", type=int, nargs="+", choices=sorted(SHAPES), default=sorted(SHAPES),
+                        metavar="CARDS", help="game sizes to run (default: all of %(default)s)")
+    parser.add_argument("--runs", type=int, default=RUNS, help="times to do each thing (default: %(default)s)")
+    args = parser.parse_args()
+
+    report = {"commit": commit(), "python": platform.python_version(), "tk": tkinter.TkVersion,
+              "canvas_cards": args.canvas, "runs": args.runs, "results": {}}
+    for size in args.sizes:
+        history = generate(size, *SHAPES[size])
+        start = time.perf_counter()
+        mw = window(history, args.canvas)
+        results = {"load": {"runs": 1, "median_ms": (time.perf_counter() - start) * 1000}}
+        results.update(measure(mw, args.runs))
+        mw.destroy()
+        report["results"][str(len(history.cards))] = results
+
+        print("{} cards".format(len(history.cards)))
+        for name, result in results.items():
+            print("  {:<22} median {:8.2f}ms  max {:8.2f}ms".format(
+                name, result["median_ms"], result.get("max_ms", result["median_ms"])))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
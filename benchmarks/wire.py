@@ -0,0 +1,110 @@
+import json
+import random
+import time
+from typing import List
+
+import protocol
+from ops import DELETE, EDIT, INSERT, Op
+
+
+# Throughput of the wire protocol: how many operations a second can be encoded and decoded, for single messages and for
+# batches the size an Outbox would build up during a burst. That frames decode to what went in is checked by
+# tests/test_protocol.py, which uses the random messages from here.
+#
+#   python -m benchmarks.wire
+
+WORDS = ("the", "empire", "falls", "a", "dragon", "wakes", "under", "mountain", "New Event", "New Period", "why",
+         "does", "the", "king", "die", "ñandú", "雪")
+
+
+def random_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12)))
+
+
+def random_id(rng: random.Random) -> int:
+    return rng.randint(1, 64) << 32 | rng.randrange(1, 1 << rng.randint(1, 20))
+
+
+def random_op(rng: random.Random) -> Op:
+    level = rng.randint(1, 3)
+    card = random_id(rng)
+    kind = rng.choice((INSERT, EDIT, DELETE))
+    if kind == DELETE:
+        return Op(kind, level, card)
+
+    if level == 3:
+        fields = {"question": random_text(rng), "setting": random_text(rng), "answer": random_text(rng),
+                  "is_dark": rng.random() < .5}
+    else:
+        fields = {"text": random_text(rng), "is_dark": rng.random() < .5}
+    if kind == EDIT:
+        return Op(kind, level, card, {name: value for name, value in fields.items() if rng.random() < .5})
+    key = [rng.randint(-1 << 30, 1 << 30)] + [rng.randrange(1, 1 << 16) for _ in range(rng.randint(0, 3))]
+    return Op(kind, level, card, fields, random_id(rng) if level > 1 else None, key)
+
+
+def random_messages(rng: random.Random, count: int) -> List[dict]:
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < .8:
+            message = {"type": "op", "op": random_op(rng), "seq": rng.randint(0, 1 << 20),
+                       "version": rng.randint(0, 1 << 30)}
+            if rng.random() < .5:
+                message["client"] = rng.randint(1, 1000)
+        elif roll < .85:
+            message = {"type": "snapshot", "client": rng.randint(1, 1000), "version": rng.randint(0, 1 << 30),
+                       "acked": rng.randint(0, 1 << 20), "ops": [random_op(rng) for _ in range(rng.randint(0, 50))]}
+        elif roll < .88:
+            message = {"type": "hello", "client": rng.randint(0, 1000), "version": rng.randint(0, 1 << 30)}
+        elif roll < .9:
+            message = {"type": "resume", "client": rng.randint(1, 1000), "acked": rng.randint(0, 1 << 20)}
+        else:
+            message = {"type": "error", "message": random_text(rng), "seq": rng.randint(0, 1 << 20)}
+        messages.append(message)
+    return messages
+
+
+def json_size(messages: List[dict]) -> int:
+    def op_json(value):
+        return [value.kind, value.level, value.card, value.fields, value.parent, value.key]
+    return len(json.dumps(messages, separators=(",", ":"), default=op_json).encode())
+
+
+def bench(rng: random.Random, batch: int, seconds: float = 1):
+    frames = []
+    for _ in range(max(1, 4096 // batch)):
+        frames.append([{"type": "op", "op": random_op(rng), "client": 1, "seq": i, "version": 1000 + i}
+                       for i in range(batch)])
+    encoded = [protocol.encode(messages)[4:] for messages in frames]
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for messages in frames:
+            protocol.encode(messages)
+        count += len(frames) * batch
+    encode_rate = count / (time.perf_counter() - start)
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for body in encoded:
+            protocol.decode(body)
+        count += len(frames) * batch
+    decode_rate = count / (time.perf_counter() - start)
+
+    wire = sum(len(body) + 4 for body in encoded) / (len(frames) * batch)
+    as_json = sum(json_size(messages) for messages in frames) / (len(frames) * batch)
+    print("batch {:>4}: encode {:>9,.0f} ops/s  decode {:>9,.0f} ops/s  {:6.1f} bytes/op (JSON {:6.1f})"
+          .format(batch, encode_rate, decode_rate, wire, as_json))
+
+
+def main():
+    rng = random.Random(1)
+    for batch in (1, 16, 256):
+        bench(rng, batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import asyncio
+import queue
+import threading
+from typing import Callable, List, Tuple
+
+import ops
+import protocol
+from model import History
+from ops import Op
+
+
+# The player's end of a connection to a GameServer. It keeps its own copy of the history, built from the snapshot it's
+# sent on joining and kept up to date by applying the changes the server sends out. If the connection drops, connecting
+# again picks up from the last version it got (see GameServer).
+#
+# The player's own changes don't wait for the server. They're applied straight away, numbered and sent, and kept as
+# pending until the server answers for them, which it does for each one in order. Anything else that arrives in the
+# meantime happened before our pending changes as far as the server is concerned. Since changes to different things
+# come out the same in either order (see ops), it can just be applied on top, except for edits to fields we've got
+# pending edits of our own to: ours went in after, so ours win. An error for one of ours undoes it.
+
+
+class Client:
+    history: History
+    id: int = None  # Given out by the server
+
+    # Applies an op and returns the ops that undo it, like ops.apply. The window swaps in its own so that the changes
+    # show up on screen.
+    apply: Callable[[Op], List[Op]]
+
+    version: int = 0  # The history's, as of the last change from the server
+    seq: int = 0
+    pending: List[Tuple[int, Op, List[Op]]]  # (seq, op, undo) for our changes the server hasn't answered for yet
+
+    reader: asyncio.StreamReader = None
+    writer: asyncio.StreamWriter = None
+    outbox: protocol.Outbox = None
+    loop: asyncio.AbstractEventLoop = None
+    synced: bool = False  # Whether the server's told us what it's got since we connected, see post
+    posted: int = 0  # The last seq sent on this connection
+
+    # Called with each change the server sends once it's been applied, and with each error the server sends back
+    on_op: Callable[[Op, int], None] = None
+    on_error: Callable[[str], None] = None
+
+    def __init__(self, history: History = None, apply: Callable[[Op], List[Op]] = None):
+        self.history = history if history is not None else History()
+        self.apply = apply if apply is not None else lambda op: ops.apply(self.history, op)
+        self.pending = []
+
+    async def connect(self, host: str, port: int = protocol.DEFAULT_PORT) -> List[dict]:
+        # Returns the server's first frame, without receiving it: a snapshot, or the changes missed since last time
+        # followed by a resume
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.loop = asyncio.get_running_loop()
+        protocol.write_message(self.writer, {"type": "hello", "client": self.id or 0, "version": self.version})
+        messages = await protocol.read_messages(self.reader)
+        if not messages or messages[-1]["type"] not in ("snapshot", "resume"):
+            raise protocol.ProtocolError("expected a snapshot or a resume")
+        self.synced = False
+        self.outbox = protocol.Outbox(self.writer.write)
+        return messages
+
+    def submit(self, op: Op) -> List[Op]:
+        # Makes a change here and now and asks the server to make it too. Gives back the ops that undo it, like
+        # ops.apply. Raises OpError if it doesn't fit.
+        undo = self.apply(op)
+        if op.kind == ops.EDIT and not undo:
+            return undo
+        op = ops.trimmed(op, undo)
+        self.seq += 1
+        self.pending.append((self.seq, op, undo))
+        self.send({"type": "op", "op": op, "seq": self.seq})
+        return undo
+
+    def send(self, message: dict):
+        self.call(self.post, message)
+
+    def call(self, function: Callable, *args):
+        # Runs function on the connection's thread. Safe to call from outside it.
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def post(self, message: dict):
+        # Changes have to reach the server in the order they're numbered, or it'll think the ones that haven't got there
+        # yet never will. So while there's no connection, or there's a new one and the server hasn't said yet what it's
+        # got (see resend), they just stay pending. Ones already sent on this connection aren't sent again.
+        if self.outbox is None or not self.synced:
+            return
+        seq = message.get("seq", 0)
+        if message["type"] == "op" and seq:
+            if seq <= self.posted:
+                return
+            self.posted = seq
+        self.outbox.add(message)
+
+    def resend(self):
+        self.call(self.post_pending)
+
+    def post_pending(self):
+        self.synced = True
+        self.posted = 0
+        for seq, op, _ in self.pending:
+            self.post({"type": "op", "op": op, "seq": seq})
+
+    async def run(self, handle: Callable[[dict], None] = None):
+        # Hands whatever the server sends to handle (receive, unless it's given) until the connection closes
+        handle = handle if handle is not None else self.receive
+        while True:
+            messages = await protocol.read_messages(self.reader)
+            if messages is None:
+                break
+            for message in messages:
+                handle(message)
+
+    def receive(self, message: dict):
+        kind = message["type"]
+        if kind == "snapshot":
+            if message["client"] != self.id:
+                # The server doesn't know us (or we're new), so nothing we've got pending ever got there, and cards made
+                # from here on are from a new site
+                self.pending = []
+                self.id = self.history.site = message["client"]
+                self.history.last_id = 0
+                self.seq = 0
+            self.version = message["version"]
+            for period in list(self.history.periods):
+                self.apply(ops.delete_op(period))
+            for op in message["ops"]:
+                self.apply(op)
+            self.pending = [(seq, op, self.apply(op)) for seq, op, _ in self.pending if seq > message["acked"]]
+            self.resend()
+        elif kind == "resume":
+            # The changes we missed came first. Any of ours the server got that they didn't answer for didn't do
+            # anything, and the rest never got there.
+            self.pending = [entry for entry in self.pending if entry[0] > message["acked"]]
+            self.resend()
+        elif kind == "op":
+            version = message.get("version", 0)
+            if version:
+                if version <= self.version:
+                    return  # Got it already, before the connection dropped
+                self.version = version
+
+            seq = message.get("seq")
+            if message.get("client") == self.id and any(entry[0] == seq for entry in self.pending):
+                # Any of ours from before it were answered while we weren't connected, and didn't do anything
+                while self.pending.pop(0)[0] != seq:
+                    pass
+            else:
+                self.apply(self.unshadowed(message["op"]))
+            if self.on_op is not None:
+                self.on_op(message["op"], message.get("client"))
+        elif kind == "error":
+            if self.pending and self.pending[0][0] == message.get("seq"):
+                _, _, undo = self.pending.pop(0)
+                for op in undo:
+                    self.apply(op)
+            if self.on_error is not None:
+                self.on_error(message["message"])
+
+    def unshadowed(self, op: Op) -> Op:
+        # op without the fields our pending edits are going to overwrite
+        if op.kind != ops.EDIT:
+            return op
+        shadowed = set()
+        for _, pending, _ in self.pending:
+            if pending.kind == ops.EDIT and pending.card == op.card:
+                shadowed.update(pending.fields)
+        if not shadowed:
+            return op
+        return Op(ops.EDIT, op.level, op.card, {name: value for name, value in op.fields.items()
+                                                if name not in shadowed})
+
+    async def close(self):
+        writer = self.writer
+        if writer is None:
+            return
+        if self.outbox is not None:
+            self.outbox.flush()
+        self.writer = None
+        self.outbox = None
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class ClientThread(threading.Thread):
+    # Runs a client's connection on an event loop of its own, for when the main thread is busy running something else
+    # (a window). Messages are queued up for the main thread to pass to client.receive, with a None each time the
+    # connection drops. It keeps trying to get back in after that, waiting longer each time.
+    client: Client
+    host: str
+    port: int
+    messages: queue.Queue
+    error: Exception = None  # Why the last connection ended, if it didn't end cleanly
+
+    retry: float = .5  # s
+    max_retry: float = 15
+
+    def __init__(self, client: Client, host: str, port: int = protocol.DEFAULT_PORT):
+        super().__init__(daemon=True)
+        self.client = client
+        self.host = host
+        self.port = port
+        self.messages = queue.Queue()
+
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        delay = self.retry
+        while True:
+            try:
+                for message in await self.client.connect(self.host, self.port):
+                    self.messages.put(message)
+                delay = self.retry
+                self.error = None
+                await self.client.run(self.messages.put)
+            except (OSError, protocol.ProtocolError) as e:
+                self.error = e
+            finally:
+                await self.client.close()
+            self.messages.put(None)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry)
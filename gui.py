@@ -1,5 +1,22 @@
+import queue
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count
 from tkinter import *
-from typing import List, Union
+from typing import Callable, Dict, List, Union
+
+import ops
+from client import Client, ClientThread
+from layout import ColumnExtents, StripLayout
+from model import Event, History, Period, Scene, Sequence
+from ops import Op
+from profiling import Profiler
+from search import SearchIndex
+import storage
+from storage import Autosave
+from undo import UndoLog
 
 
 bg_color = "#303030"
@@ -65,135 +82,86 @@ class Container(Frame):
     depressed_bg_color: str = "#282828"
 
     id: int  # For use with canvas
-    index: int  # For use with MainWindow
+    index: int = None  # For use with MainWindow
+    item: Union[Period, Event, Scene, None] = None
+    span: tuple = None  # Where it was last placed along its strip, so unchanged cards aren't moved again
+    is_pressed: bool = False
+    shown: dict  # What each child widget is currently displaying
 
     mw: "MainWindow"
 
     def __init__(self, parent, mw: "MainWindow"):
         super().__init__(parent, **frame_style)
         self.mw = mw
+        self.shown = {}
         self.config(borderwidth=5, relief=RAISED)
 
-    def register_event(self, trigger: str, callback, add=TRUE):
-        self.bind(trigger, callback, add)
+    def draw(self, state: str):
+        self.id = self.master.create_window(0, 0, window=self, state=state)
+
+    def resize(self, script: "TclScript", width: float, height: float):
+        script.configure(self, width=width, height=height)
+
+    def discard(self):
+        self.master.delete(self.id)
+        self.destroy()
+
+    def set_card(self, index: int, item):
+        # Containers are pooled, so this is how one gets pointed at a different card
+        self.index = index
+        self.item = item
+
+    def show(self, widget: Misc, **options):
+        # Only hand Tk the options that are different from what the widget already shows. Edits and rebinding go
+        # through here, so changing a card's text doesn't also reset its tone image and vice versa.
+        changed = {}
+        for key, value in options.items():
+            if self.shown.get((id(widget), key)) != value:
+                self.shown[(id(widget), key)] = value
+                changed[key] = value
+        if changed:
+            widget.config(**changed)
+
+    def set_pressed(self, pressed: bool):
+        if pressed and not self.is_pressed:
+            self.press()
+        elif not pressed and self.is_pressed:
+            self.release()
 
     def press(self, _=None):
+        self.is_pressed = True
         self.config(background=self.depressed_bg_color, relief=SUNKEN)
 
     def release(self, _=None):
+        self.is_pressed = False
         self.config(background=self.bg_color, relief=RAISED)
 
 
-class Divider(Container):
-    plus: Label
-
-    def __init__(self, parent, mw):
-        super().__init__(parent, mw)
-
-        self.config(borderwidth=1)
-
-        self.plus = Label(self, **label_style)
-        self.plus.config(image=insert_img, borderwidth=4, relief=RAISED)
-        self.plus.place(rely=.5, relx=.5, anchor=CENTER)
-
-        self.register_event("<ButtonPress-1>", self.click_down)
-        self.register_event("<ButtonRelease-1>", self.click_up)
-
-    def click_down(self, _=None):
-        self.press()
-
-    def click_up(self, _=None):
-        pass
-
-    def register_event(self, trigger: str, callback, add=TRUE):
-        super().register_event(trigger, callback, add)
-        self.plus.bind(trigger, callback, add)
-
-    def press(self, _=None):
-        super().press()
-        self.config(background=self.depressed_bg_color)
-        self.plus.config(background=self.depressed_bg_color)
-
-    def release(self, _=None):
-        super().release()
-        self.config(background=self.bg_color)
-        self.plus.config(background=self.bg_color)
-
-
-class PeriodDivider(Divider):
-    def __init__(self, parent, mw):
-        super().__init__(parent, mw)
-
-    def click_up(self, _=None):
-        self.mw.p_selection(self.index)
-        self.release()
-
-
-class EventDivider(Divider):
-    parent_period: "MPeriod"
-
-    def __init__(self, parent, parent_period: "MPeriod", mw: "MainWindow"):
-        super().__init__(parent, mw)
-        self.parent_period = parent_period
-
-    def click_up(self, _=None):
-        self.mw.e_selection(self.index, self.parent_period)
-        self.release()
-
-
-class SceneDivider(Divider):
-    parent_event: "MEvent"
-
-    def __init__(self, parent, parent_event: "MEvent", mw: "MainWindow"):
-        super().__init__(parent, mw)
-        self.parent_event = parent_event
-
-    def click_up(self, _=None):
-        self.mw.s_selection(self.index, self.parent_event)
-        self.release()
-
-
 class MPeriod(Container):
-    text: str
-    is_dark: bool
+    period: Period
 
     tone: Label
     label: Label
 
-    event_items: List[Union["MEvent", EventDivider]]
-
-    def __init__(self, parent, text: str, is_dark: bool, mw):
+    def __init__(self, parent, mw):
         super().__init__(parent, mw)
 
-        self.text = text
-        self.is_dark = is_dark
-        self.event_items = [EventDivider(self.mw.event_timeline, self, self.mw)]
-        self.event_items[0].index = 0
-
         self.tone = Label(self, **label_style)
         self.tone.config(width=50, height=50)
-        if self.is_dark:
-            self.tone.config(image=dark_img)
-        else:
-            self.tone.config(image=light_img)
         self.tone.place(rely=.85, relx=.5, anchor=CENTER)
 
         self.label = Label(self, **label_style)
-        self.label.config(text=self.text, wraplength=210)
+        self.label.config(wraplength=210)
         self.label.place(rely=.35, relx=.5, anchor=CENTER)
 
-        self.register_event("<ButtonPress-1>", self.on_click)
-
-    def on_click(self, _=None):
-        self.mw.p_selection(self.index)
-
-    def register_event(self, trigger: str, callback, add=TRUE):
-        super().register_event(trigger, callback, add)
-        self.tone.bind(trigger, callback, add)
-        self.label.bind(trigger, callback, add)  # It was at this point that I realized I should probably have a list
-        # of child elements that I can just iterate through
-
-        # ...eh
+    def set_card(self, index: int, item: Period):
+        super().set_card(index, item)
+        self.period = item
+        if self.period.is_dark:
+            self.show(self.tone, image=dark_img)
+        else:
+            self.show(self.tone, image=light_img)
+        self.show(self.label, text=self.period.text)
 
     def press(self, _=None):
         super().press()
@@ -207,53 +175,36 @@ class MPeriod(Container):
 
 
 class MEvent(Container):  # This is the reason for the "M" prefix (M=Microscope). "Event" is already a class from tk.
-    text: str
-    is_dark: bool
-
-    parent_period: MPeriod
+    event: Event
 
     tone: Label
     label: Label
     scene_count: Label
+    is_count_placed: bool = False
 
-    scene_items: List[Union["MScene", SceneDivider]]
-
-    def __init__(self, parent, text: str, is_dark: bool, parent_period: Union[MPeriod, None], mw):
+    def __init__(self, parent, mw):
         super().__init__(parent, mw)
 
-        self.text = text
-        self.is_dark = is_dark
-        self.parent_period = parent_period
-
         self.tone = Label(self, **label_style)
         self.tone.config(width=50, height=50)
-        if self.is_dark:
-            self.tone.config(image=dark_img)
-        else:
-            self.tone.config(image=light_img)
         self.tone.place(rely=.85, relx=.125, anchor=CENTER)
 
         self.scene_count = Label(self, **label_style)
         self.scene_count.config(font=large_font)
 
         self.label = Label(self, **label_style)
-        self.label.config(text=self.text, wraplength=260)
+        self.label.config(wraplength=260)
         self.label.place(rely=.35, relx=.5, anchor=CENTER)
 
-        self.register_event("<ButtonPress-1>", self.on_click)
-
-        self.scene_items = []
-        self.scene_items.append(SceneDivider(self.mw.scene_timeline, self, self.mw))
-        self.scene_items[0].index = 0
-
-    def on_click(self, _=None):
-        self.mw.e_selection(self.index, self.parent_period)
-
-    def register_event(self, trigger: str, callback, add=TRUE):
-        super().register_event(trigger, callback, add)
-        self.tone.bind(trigger, callback, add)
-        self.label.bind(trigger, callback, add)
-        self.scene_count.bind(trigger, callback, add)
+    def set_card(self, index: int, item: Event):
+        super().set_card(index, item)
+        self.event = item
+        if self.event.is_dark:
+            self.show(self.tone, image=dark_img)
+        else:
+            self.show(self.tone, image=light_img)
+        self.show(self.label, text=self.event.text)
+        self.update_scene_count()
 
     def press(self, _=None):
         super().press()
@@ -268,49 +219,37 @@ class MEvent(Container):  # This is the reason for the "M" prefix (M=Microscope)
         self.scene_count.config(background=self.bg_color)
 
     def update_scene_count(self):
-        if len(self.scene_items) // 2 > 0:
-            if len(self.scene_items) // 2 == 1:
-                self.scene_count.config(text="1 scene")
-            elif len(self.scene_items) // 2 > 1:
-                self.scene_count.config(text="{} scenes".format(len(self.scene_items) // 2))
-            self.scene_count.place(rely=.85, relx=.25, anchor=W)
-        else:
+        scene_count = len(self.event.scenes)
+        if scene_count > 0:
+            if scene_count == 1:
+                self.show(self.scene_count, text="1 scene")
+            elif scene_count > 1:
+                self.show(self.scene_count, text="{} scenes".format(scene_count))
+            if not self.is_count_placed:
+                self.scene_count.place(rely=.85, relx=.25, anchor=W)
+                self.is_count_placed = True
+        elif self.is_count_placed:
             self.scene_count.place_forget()
+            self.is_count_placed = False
 
 
 class MScene(Container):
-    question: str
-    setting: str
-    answer: str
-    is_dark: bool
-
-    parent_event: MEvent
+    scene: Scene
 
     tone: Label
     question_lbl: Label
     setting_lbl: Label
     answer_lbl: Label
 
-    def __init__(self, parent, question: str, setting: str, answer: str, is_dark: bool,
-                 parent_event: Union[MEvent, None], mw):
+    def __init__(self, parent, mw):
         super().__init__(parent, mw)
 
-        self.question = question
-        self.setting = setting
-        self.answer = answer
-        self.is_dark = is_dark
-        self.parent_event = parent_event
-
         self.tone = Label(self, **label_style)
         self.tone.config(width=30, height=30)
-        if self.is_dark:
-            self.tone.config(image=small_dark_img)
-        else:
-            self.tone.config(image=small_light_img)
         self.tone.place(rely=.91, relx=.88, anchor=CENTER)
 
         self.question_lbl = Label(self, **label_style)
-        self.question_lbl.config(font=small_font, text=self.question, wraplength=220)
+        self.question_lbl.config(font=small_font, wraplength=220)
         self.question_lbl.place(relx=.5, rely=.15, anchor=CENTER)
 
         divider1 = Frame(self, **frame_style)
@@ -318,7 +257,7 @@ class MScene(Container):
         divider1.place(relx=.5, rely=.30, anchor=CENTER)
 
         self.setting_lbl = Label(self, **label_style)
-        self.setting_lbl.config(font=small_font, text=self.setting, wraplength=220)
+        self.setting_lbl.config(font=small_font, wraplength=220)
         self.setting_lbl.place(relx=.5, rely=.45, anchor=CENTER)
 
         divider2 = Frame(self, **frame_style)
@@ -326,20 +265,19 @@ class MScene(Container):
         divider2.place(relx=.5, rely=.60, anchor=CENTER)
 
         self.answer_lbl = Label(self, **label_style)
-        self.answer_lbl.config(font=small_font, text=self.answer, wraplength=220)
+        self.answer_lbl.config(font=small_font, wraplength=220)
         self.answer_lbl.place(relx=.5, rely=.75, anchor=CENTER)
 
-        self.register_event("<ButtonPress-1>", self.on_click)
-
-    def on_click(self, _=None):
-        self.mw.s_selection(self.index, self.parent_event)
-
-    def register_event(self, trigger: str, callback, add=TRUE):
-        super().register_event(trigger, callback, add)
-        self.tone.bind(trigger, callback, add)
-        self.question_lbl.bind(trigger, callback, add)
-        self.setting_lbl.bind(trigger, callback, add)
-        self.answer_lbl.bind(trigger, callback, add)
+    def set_card(self, index: int, item: Scene):
+        super().set_card(index, item)
+        self.scene = item
+        if self.scene.is_dark:
+            self.show(self.tone, image=small_dark_img)
+        else:
+            self.show(self.tone, image=small_light_img)
+        self.show(self.question_lbl, text=self.scene.question)
+        self.show(self.setting_lbl, text=self.scene.setting)
+        self.show(self.answer_lbl, text=self.scene.answer)
 
     def press(self, _=None):
         super().press()
@@ -356,28 +294,636 @@ class MScene(Container):
         self.answer_lbl.config(background=self.bg_color)
 
 
+# How much of a card to draw on the canvas. Zoomed out far enough the text can't be read anyway, so it's left off and
+# the card becomes a block colored by its tone.
+FULL_DETAIL = 2
+TEXT_DETAIL = 1
+BLOCK_DETAIL = 0
+
+dark_block_color = "#141414"
+light_block_color = "#8a8a8a"
+border_color = "#505050"  # Blocks go without, so a zoomed out timeline is all tone
+
+_card_tags = count()
+
+
+def detail_for(zoom: float) -> int:
+    if zoom >= .75:
+        return FULL_DETAIL
+    if zoom >= .35:
+        return TEXT_DETAIL
+    return BLOCK_DETAIL
+
+
+class CanvasCard:
+    # A card drawn straight onto a timeline as canvas items instead of a Frame full of Labels, which is a lot cheaper
+    # for Tk to create, move and hide. All of a card's items share a tag that stands in for a window item's id, so the
+    # pools and strips don't need to know which kind of card they're handling.
+
+    bg_color: str = bg_color
+    depressed_bg_color: str = "#282828"
+
+    id: str  # The tag on every item in this card
+    index: int = None
+    item: Union[Period, Event, Scene, None] = None
+    span: tuple = None
+    is_pressed: bool = False
+    shown: dict  # What each canvas item is currently displaying
+
+    canvas: Canvas
+    mw: "MainWindow"
+    detail: int
+    scale: float
+
+    body: int  # Drawn first, since the canvas lines a tag up by the top left corner of its first item
+    border: int
+    parts: List[tuple]  # (item, relx, rely) for everything placed inside the card
+
+    def __init__(self, canvas: Canvas, mw: "MainWindow", zoom: float = 1):
+        self.canvas = canvas
+        self.mw = mw
+        self.detail = detail_for(zoom)
+        self.scale = zoom
+        self.id = "card{}".format(next(_card_tags))
+        self.shown = {}
+        self.parts = []
+
+    def draw(self, state: str):
+        self.body = self.canvas.create_rectangle(0, 0, 0, 0, fill=self.bg_color, width=0, tags=self.id, state=state)
+        self.border = self.canvas.create_rectangle(0, 0, 0, 0, outline=self.border_outline(), tags=self.id, state=state,
+                                                   width=max(1, round(4 * self.scale)))
+        self.draw_parts(state)
+
+    def draw_parts(self, state: str):
+        pass
+
+    def draw_text(self, state: str, relx: float, rely: float, wraplength: float, font: tuple, anchor=CENTER) -> int:
+        text = self.canvas.create_text(0, 0, fill=fg_color, font=font, width=wraplength * self.scale, anchor=anchor,
+                                       justify=CENTER, tags=self.id, state=state)
+        self.parts.append((text, relx, rely))
+        return text
+
+    def draw_image(self, state: str, relx: float, rely: float) -> int:
+        image = self.canvas.create_image(0, 0, tags=self.id, state=state)
+        self.parts.append((image, relx, rely))
+        return image
+
+    def resize(self, script: "TclScript", width: float, height: float):
+        # Redrawn at the origin. The strip always moves a card to where it goes right after resizing it, and this way
+        # nothing has to ask Tk where the card is now.
+        script.coords(self.canvas, self.body, 0, 0, width, height)
+        script.coords(self.canvas, self.border, 0, 0, width, height)
+        for part, relx, rely in self.parts:
+            script.coords(self.canvas, part, relx * width, rely * height)
+
+    def discard(self):
+        self.canvas.delete(self.id)
+
+    def set_card(self, index: int, item):
+        self.index = index
+        self.item = item
+
+    def show(self, item: int, **options):
+        changed = {}
+        for key, value in options.items():
+            if self.shown.get((item, key)) != value:
+                self.shown[(item, key)] = value
+                changed[key] = value
+        if changed:
+            self.canvas.itemconfig(item, **changed)
+
+    def show_tone(self, tone: int, is_dark: bool, dark_image: PhotoImage, light_image: PhotoImage):
+        if self.detail == FULL_DETAIL:
+            self.show(tone, image=dark_image if is_dark else light_image)
+        else:
+            self.show(self.body, fill=dark_block_color if is_dark else light_block_color)
+
+    def set_pressed(self, pressed: bool):
+        if pressed and not self.is_pressed:
+            self.press()
+        elif not pressed and self.is_pressed:
+            self.release()
+
+    # Below full detail the body is showing the tone, so only the border shows the selection
+    def press(self, _=None):
+        self.is_pressed = True
+        if self.detail == FULL_DETAIL:
+            self.show(self.body, fill=self.depressed_bg_color)
+        self.show(self.border, outline=select_bg)
+
+    def release(self, _=None):
+        self.is_pressed = False
+        if self.detail == FULL_DETAIL:
+            self.show(self.body, fill=self.bg_color)
+        self.show(self.border, outline=self.border_outline())
+
+    def border_outline(self) -> str:
+        return border_color if self.detail != BLOCK_DETAIL else ""
+
+
+class CanvasPeriod(CanvasCard):
+    tone: int = None
+    label: int
+
+    def draw_parts(self, state: str):
+        if self.detail == FULL_DETAIL:
+            self.tone = self.draw_image(state, .5, .85)
+            self.label = self.draw_text(state, .5, .35, 210, default_font)
+        elif self.detail == TEXT_DETAIL:
+            self.label = self.draw_text(state, .5, .5, 210, small_font)
+
+    def set_card(self, index: int, item: Period):
+        super().set_card(index, item)
+        self.show_tone(self.tone, item.is_dark, dark_img, light_img)
+        if self.detail != BLOCK_DETAIL:
+            self.show(self.label, text=item.text)
+
+
+class CanvasEvent(CanvasCard):
+    tone: int = None
+    label: int
+    scene_count: int
+
+    def draw_parts(self, state: str):
+        if self.detail == FULL_DETAIL:
+            self.tone = self.draw_image(state, .125, .85)
+            self.scene_count = self.draw_text(state, .25, .85, 200, large_font, anchor=W)
+            self.label = self.draw_text(state, .5, .35, 260, default_font)
+        elif self.detail == TEXT_DETAIL:
+            self.label = self.draw_text(state, .5, .5, 260, small_font)
+
+    def set_card(self, index: int, item: Event):
+        super().set_card(index, item)
+        self.show_tone(self.tone, item.is_dark, dark_img, light_img)
+        if self.detail != BLOCK_DETAIL:
+            self.show(self.label, text=item.text)
+        self.update_scene_count()
+
+    def update_scene_count(self):
+        if self.detail != FULL_DETAIL:
+            return
+        scene_count = len(self.item.scenes)
+        if scene_count == 0:
+            self.show(self.scene_count, text="")
+        elif scene_count == 1:
+            self.show(self.scene_count, text="1 scene")
+        else:
+            self.show(self.scene_count, text="{} scenes".format(scene_count))
+
+
+class CanvasScene(CanvasCard):
+    tone: int = None
+    question_lbl: int
+    setting_lbl: int
+    answer_lbl: int
+    lines: List[int]
+
+    def draw_parts(self, state: str):
+        self.lines = []
+        if self.detail == BLOCK_DETAIL:
+            return
+        self.tone = self.draw_image(state, .88, .91)
+        self.question_lbl = self.draw_text(state, .5, .15, 220, small_font)
+        self.setting_lbl = self.draw_text(state, .5, .45, 220, small_font)
+        self.answer_lbl = self.draw_text(state, .5, .75, 220, small_font)
+        for _ in range(2):
+            self.lines.append(self.canvas.create_line(0, 0, 0, 0, fill=active_fg, width=2, tags=self.id, state=state))
+
+    def resize(self, script: "TclScript", width: float, height: float):
+        super().resize(script, width, height)
+        for line, rely in zip(self.lines, (.30, .60)):
+            script.coords(self.canvas, line, width / 2 - 110 * self.scale, rely * height,
+                          width / 2 + 110 * self.scale, rely * height)
+
+    def set_card(self, index: int, item: Scene):
+        super().set_card(index, item)
+        if self.detail == BLOCK_DETAIL:
+            self.show_tone(None, item.is_dark, small_dark_img, small_light_img)
+            return
+        self.show(self.tone, image=small_dark_img if item.is_dark else small_light_img)
+        self.show(self.question_lbl, text=item.question)
+        self.show(self.setting_lbl, text=item.setting)
+        self.show(self.answer_lbl, text=item.answer)
+
+
+Card = Union[Container, CanvasCard]
+
+_tcl_special = re.compile(r'[\s"#$;\[\]{}\\]')
+_tcl_escapes = {"\n": "\\n", "\t": "\\t", "\r": "\\r"}
+
+
+def tcl_word(word) -> str:
+    # word as a single word of a Tcl script, that Tcl takes literally. Numbers are the usual case and never need it.
+    if isinstance(word, (int, float)):
+        return str(word)
+    text = str(word)
+    if not text:
+        return "{}"
+    return _tcl_special.sub(lambda match: _tcl_escapes.get(match.group(), "\\" + match.group()), text)
+
+
+class TclScript:
+    # Geometry changes for a layout pass, queued up and sent to Tcl as one script instead of a round trip per call. With
+    # a lot of cards on screen the round trips were most of what a layout pass cost. Nothing here waits on an answer
+    # from Tk, and anything that reads the canvas back has to flush first.
+    tk: object
+    commands: List[str]
+
+    def __init__(self, widget: Misc):
+        self.tk = widget.tk
+        self.commands = []
+
+    def call(self, *words):
+        self.commands.append(" ".join(map(tcl_word, words)))
+
+    def configure(self, widget: Misc, **options):
+        self.call(widget, "configure", *(word for key, value in options.items() for word in ("-" + key, value)))
+
+    def itemconfig(self, canvas: Canvas, tag, **options):
+        self.call(canvas, "itemconfigure", tag,
+                  *(word for key, value in options.items() for word in ("-" + key, value)))
+
+    def coords(self, canvas: Canvas, tag, *coords: float):
+        self.call(canvas, "coords", tag, *coords)
+
+    def moveto(self, canvas: Canvas, tag, x: float, y: float):
+        self.call(canvas, "moveto", tag, x, y)
+
+    def move(self, canvas: Canvas, tag, dx: float, dy: float):
+        self.call(canvas, "move", tag, dx, dy)
+
+    def addtag(self, canvas: Canvas, new_tag: str, tag):
+        self.call(canvas, "addtag", new_tag, "withtag", tag)
+
+    def dtag(self, canvas: Canvas, tag, tag_to_delete: str):
+        self.call(canvas, "dtag", tag, tag_to_delete)
+
+    def flush(self):
+        if self.commands:
+            script = "\n".join(self.commands)
+            self.commands = []
+            self.tk.eval(script)
+
+
+class CardPool:
+    # Cards that scroll out of view get hidden and parked here instead of destroyed, then handed out again to whatever
+    # scrolls into view. This keeps the widget count down to roughly what fits on screen.
+    canvas: Canvas
+    script: TclScript
+    factory: Callable[[], Card]
+    free: List[Card]
+
+    def __init__(self, canvas: Canvas, script: TclScript, factory: Callable[[], Card]):
+        self.canvas = canvas
+        self.script = script
+        self.factory = factory
+        self.free = []
+
+    def acquire(self, state: str = NORMAL) -> Card:
+        if self.free:
+            widget = self.free.pop()
+            if state != HIDDEN:
+                self.script.itemconfig(self.canvas, widget.id, state=state)
+        else:
+            widget = self.factory()
+            widget.draw(state)
+        return widget
+
+    def release(self, widget: Card):
+        widget.set_pressed(False)
+        widget.item = None
+        widget.span = None
+        self.script.itemconfig(self.canvas, widget.id, state=HIDDEN)
+        self.free.append(widget)
+
+    def clear(self):
+        self.script.flush()
+        for widget in self.free:
+            widget.discard()
+        self.free = []
+
+
+class Strip:
+    # One row (or column) of cards. The gaps between them are only worked out from the layout (see GapMarker), so the
+    # strip only has to look after the cards. Only the ones that are in view get a widget, and a widget is only rebound
+    # or moved when the card it shows or where that card sits has actually changed.
+    #
+    # Slots are keyed by card, but a widget's index is still the card's place among the gaps (2k + 1), which is what
+    # the selection handlers take.
+    canvas: Canvas
+    script: TclScript  # The card pool's
+    card_pool: CardPool
+
+    layout: StripLayout
+    breadth: float
+    horizontal: bool
+
+    tag: str  # Every widget in the strip carries this, so the whole strip can slide over (or hide) in one call
+    offset: float = None
+    slots: Dict[int, Card]
+
+    hidden: bool = False
+    view: float = 0  # Scroll position to go back to when a hidden strip is shown again
+
+    def __init__(self, canvas: Canvas, card_pool: CardPool, layout: StripLayout, breadth: float, horizontal: bool):
+        self.canvas = canvas
+        self.script = card_pool.script
+        self.card_pool = card_pool
+        self.layout = layout
+        self.breadth = breadth
+        self.horizontal = horizontal
+        self.tag = "strip{}".format(id(self))
+        self.slots = {}
+
+    def render(self, items: Sequence, selected, offset: float, view_start: float, view_end: float):
+        count = 2 * len(items) + 1
+        visible = self.layout.cards(view_start, view_end, len(items))
+
+        for k in [k for k in self.slots if k not in visible]:
+            self.release(k)
+
+        if self.offset is not None and offset != self.offset:
+            if self.horizontal:
+                self.script.move(self.canvas, self.tag, 0, offset - self.offset)
+            else:
+                self.script.move(self.canvas, self.tag, offset - self.offset, 0)
+        self.offset = offset
+
+        for k in visible:
+            widget = self.slots.get(k)
+            if widget is None:
+                widget = self.acquire(k)
+
+            item = items[k]
+            if widget.item is not item or widget.index != 2 * k + 1:
+                widget.set_card(2 * k + 1, item)
+            widget.set_pressed(item is selected)
+
+            self.place(widget, *self.layout.span(2 * k + 1, count))
+
+    def place(self, widget: Card, start: float, size: float):
+        if widget.span == (start, size):
+            return
+
+        if widget.span is None or widget.span[1] != size:
+            if self.horizontal:
+                widget.resize(self.script, size, self.breadth)
+            else:
+                widget.resize(self.script, self.breadth, size)
+        if self.horizontal:
+            self.script.moveto(self.canvas, widget.id, start, self.offset)
+        else:
+            self.script.moveto(self.canvas, widget.id, self.offset, start)
+        widget.span = (start, size)
+
+    def refresh(self, index: int):
+        # The card at index was edited in place
+        widget = self.slots.get(index)
+        if widget is not None:
+            widget.set_card(widget.index, widget.item)
+
+    def insert(self, index: int):
+        # Everything from index on moves along, so the widgets follow their cards instead of being rebound. The next
+        # render fills in the gap and only has to move the ones that shifted.
+        self.shift(index, 1)
+
+    def remove(self, index: int):
+        if index in self.slots:
+            self.release(index)
+        self.shift(index + 1, -1)
+
+    def shift(self, first: int, delta: int):
+        for k in sorted((k for k in self.slots if k >= first), reverse=delta > 0):
+            widget = self.slots.pop(k)
+            widget.index = 2 * (k + delta) + 1
+            self.slots[k + delta] = widget
+
+    def mark_selection(self, selected):
+        for widget in self.slots.values():
+            widget.set_pressed(widget.item is selected)
+
+    def hide(self):
+        if not self.hidden:
+            self.hidden = True
+            self.script.itemconfig(self.canvas, self.tag, state=HIDDEN)
+
+    def show(self):
+        if self.hidden:
+            self.hidden = False
+            self.script.itemconfig(self.canvas, self.tag, state=NORMAL)
+
+    def acquire(self, index: int) -> Card:
+        widget = self.card_pool.acquire(HIDDEN if self.hidden else NORMAL)
+        self.script.addtag(self.canvas, self.tag, widget.id)
+        self.slots[index] = widget
+        return widget
+
+    def release(self, index: int):
+        widget = self.slots.pop(index)
+        self.script.dtag(self.canvas, widget.id, self.tag)
+        self.card_pool.release(widget)
+
+    def clear(self):
+        for k in list(self.slots):
+            self.release(k)
+
+
+class StripCache:
+    # Laid out strips for the most recently used keys, oldest first. Strips that aren't in use are hidden rather than
+    # torn down, so going back to one is a show/hide instead of rebinding every card in it. Once there are more than
+    # capacity strips, the least recently used one hands its widgets back to the pools.
+    capacity: int
+    factory: Callable[[], Strip]
+    strips: OrderedDict
+
+    def __init__(self, capacity: int, factory: Callable[[], Strip]):
+        self.capacity = capacity
+        self.factory = factory
+        self.strips = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self.strips
+
+    def get(self, key) -> Union[Strip, None]:
+        return self.strips.get(key)
+
+    def use(self, key) -> Strip:
+        strip = self.strips.get(key)
+        if strip is None:
+            strip = self.factory()
+            strip.hide()
+            self.strips[key] = strip
+        self.strips.move_to_end(key)
+
+        while len(self.strips) > self.capacity:
+            _, evicted = self.strips.popitem(last=False)
+            evicted.clear()
+        return strip
+
+    def discard(self, key):
+        strip = self.strips.pop(key, None)
+        if strip is not None:
+            strip.clear()
+
+    def keys(self) -> list:
+        return list(self.strips)
+
+
+class GapMarker:
+    # The "+" that shows where a new card would go. There's nothing in the gaps between cards, so there's one of these
+    # per timeline and it gets moved to whichever gap the pointer is over.
+    canvas: Canvas
+    tag: str
+    box: int
+    plus: int
+    plus_size: int
+
+    gap: tuple = None  # (index, parent) of the gap it's on, or None while it's hidden
+    is_pressed: bool = False
+
+    def __init__(self, canvas: Canvas):
+        self.canvas = canvas
+        self.tag = "marker{}".format(id(self))
+        self.box = canvas.create_rectangle(0, 0, 0, 0, fill=bg_color, outline=border_color, tags=self.tag, state=HIDDEN)
+        self.plus = canvas.create_image(0, 0, image=insert_img, tags=self.tag, state=HIDDEN)
+        self.plus_size = insert_img.width()
+
+    def show(self, index: int, parent, box: tuple):
+        if self.gap == (index, parent):
+            return
+        self.gap = (index, parent)
+
+        x0, y0, x1, y1 = box
+        self.canvas.coords(self.box, x0, y0, x1, y1)
+        self.canvas.coords(self.plus, (x0 + x1) / 2, (y0 + y1) / 2)
+        self.canvas.itemconfig(self.box, state=NORMAL)
+        # Zoomed out, the gaps get too narrow for the "+" so the box has to do
+        fits = min(x1 - x0, y1 - y0) >= self.plus_size
+        self.canvas.itemconfig(self.plus, state=NORMAL if fits else HIDDEN)
+        self.canvas.tag_raise(self.tag)
+
+    def hide(self, _=None):
+        if self.gap is not None:
+            self.gap = None
+            self.release()
+            self.canvas.itemconfig(self.tag, state=HIDDEN)
+
+    def press(self):
+        self.is_pressed = True
+        self.canvas.itemconfig(self.box, fill="#282828")
+
+    def release(self):
+        if self.is_pressed:
+            self.is_pressed = False
+            self.canvas.itemconfig(self.box, fill=bg_color)
+
+
+class Dispatcher:
+    # Every click, hover and wheel event on a timeline comes through here, instead of each card binding its own. Events
+    # on the canvas itself (canvas cards and gaps) are bound on the canvas, and card widgets and their children all
+    # carry one shared bindtag, so there's a fixed handful of bindings per timeline however many cards there are. The
+    # card or gap under the pointer is worked out from the layout by MainWindow.hit().
+    canvas: Canvas
+    mw: "MainWindow"
+    marker: GapMarker
+    tag: str
+    select: Callable[[int, object], None]
+    wheel: Callable = None
+
+    def __init__(self, canvas: Canvas, mw: "MainWindow", select: Callable[[int, object], None], wheel: Callable = None):
+        self.canvas = canvas
+        self.mw = mw
+        self.select = select
+        self.wheel = wheel
+        self.marker = GapMarker(canvas)
+        self.tag = "cards{}".format(id(self))
+
+        canvas.bind("<Leave>", self.marker.hide, TRUE)
+        self.bind("<Motion>", self.on_motion)
+        self.bind("<ButtonPress-1>", self.on_press)
+        self.bind("<ButtonRelease-1>", self.on_release)
+        if wheel is not None:
+            self.bind("<MouseWheel>", wheel)
+
+    def bind(self, trigger: str, callback):
+        self.canvas.bind(trigger, callback, TRUE)
+        self.canvas.bind_class(self.tag, trigger, callback, TRUE)
+
+    def adopt(self, widget: Container) -> Container:
+        # Hands a card widget's events (and its children's) to this dispatcher
+        for child in [widget] + widget.winfo_children():
+            child.bindtags((self.tag,) + tuple(child.bindtags()))
+        return widget
+
+    def hit(self, e):
+        if e.widget is self.canvas:
+            return self.mw.hit(self.canvas, e.x, e.y)
+        return self.mw.hit(self.canvas, e.x_root - self.canvas.winfo_rootx(), e.y_root - self.canvas.winfo_rooty())
+
+    def on_motion(self, e):
+        hit = self.hit(e)
+        if hit is None or hit[0] % 2 == 1:
+            self.marker.hide()
+        else:
+            self.marker.show(*hit)
+
+    def on_press(self, e):
+        hit = self.hit(e)
+        if hit is None:
+            return
+        index, parent, _ = hit
+        if index % 2 == 1:
+            self.select(index, parent)
+        else:
+            # Gaps insert on release, same as the old dividers did
+            self.marker.show(*hit)
+            self.marker.press()
+
+    def on_release(self, e):
+        hit = self.hit(e)
+        if not self.marker.is_pressed or hit is None or hit[:2] != self.marker.gap:
+            self.marker.release()
+            return
+
+        # The gap turns into the new card, so the marker has to go until the pointer finds another one
+        self.marker.hide()
+        index, parent, _ = hit
+        self.select(index, parent)
+
+
 class ControlPanel(Frame):
     mw: "MainWindow"
 
+    profiled = ("set_p_edit", "set_e_edit", "set_s_edit")  # See Profiler
+
     title_label: Label
     cur_frame: Frame = None
 
+    search_entry: Entry
+    search_results: Listbox
+    search_hits: List[int]  # The ids of the cards in search_results, in the same order
+    search_height: int = 6  # Results showing at once
+    search_width: int = 32  # Characters of a card's text shown in the results
+
     p_edit_frame: Frame
     p_edit_text: Text
     p_edit_tone: BooleanVar
 
     e_edit_frame: Frame
-    e_edit_parent_period: MPeriod
     e_edit_text: Text
     e_edit_tone: BooleanVar
 
     s_edit_frame: Frame
-    s_edit_parent_event: MEvent
     s_edit_question: Text
     s_edit_setting: Text
     s_edit_answer: Text
     s_edit_tone: BooleanVar
 
+    save_label: Label
+    save_status: str = None
+    save_texts = {storage.SAVED: "Saved", storage.UNSAVED: "Unsaved changes", storage.SAVING: "Saving...",
+                  storage.FAILED: "Couldn't save"}
+
     def __init__(self, parent, mw):
         super().__init__(parent, **frame_style)
         self.mw = mw
@@ -386,6 +932,33 @@ class ControlPanel(Frame):
         self.title_label.config(text="Controls Panel", width=16, foreground="#f0f0f0")
         self.title_label.pack(side=TOP, fill=X)
 
+        # Searching as the player types. Enter, or clicking a result, goes to it.
+        self.search_hits = []
+        self.search_entry = Entry(self, **text_style)
+        self.search_entry.bind("<KeyRelease>", self.search)
+        self.search_entry.bind("<Return>", lambda _: self.go_to_hit(0))
+        self.search_entry.bind("<FocusIn>", lambda _: self.mw.read_rest())
+        self.search_entry.pack(side=TOP, fill=X, padx=3, pady=3)
+
+        self.search_results = Listbox(self, **listbox_style)
+        self.search_results.config(width=1, height=self.search_height, activestyle=NONE, exportselection=False)
+        self.search_results.bind("<<ListboxSelect>>", lambda _: self.go_to_hit(
+            self.search_results.curselection()[0] if self.search_results.curselection() else None))
+        self.search_results.pack(side=TOP, fill=X, padx=3, pady=3)
+
+        self.save_label = Label(self, **label_style)
+        self.save_label.config(font=small_font)
+        self.save_label.pack(side=BOTTOM, anchor=SW)
+
+        undo_frame = Frame(self, **frame_style)
+        undo_button = Button(undo_frame, **button_style)
+        undo_button.config(text="Undo", command=self.mw.undo)
+        undo_button.pack(side=LEFT, padx=3, pady=3)
+        redo_button = Button(undo_frame, **button_style)
+        redo_button.config(text="Redo", command=self.mw.redo)
+        redo_button.pack(side=LEFT, padx=3, pady=3)
+        undo_frame.pack(side=BOTTOM, anchor=SW)
+
         self.p_edit_frame = Frame(self, **frame_style)
 
         p_edit_label = Label(self.p_edit_frame, **label_style)
@@ -407,17 +980,15 @@ class ControlPanel(Frame):
         self.p_edit_tone.set(False)
 
         p_edit_submit = Button(self.p_edit_frame, **button_style)
-        p_edit_submit.config(text="Edit Period",
-                             command=lambda: self.mw.edit_period(mw.cur_selection.index, MPeriod(
-                                             self.mw.period_timeline,
-                                             self.p_edit_text.get("1.0", END + "- 1 chars"),
-                                             self.p_edit_tone.get(),
-                                             self.mw)))
+        p_edit_submit.config(text="Edit Period", command=lambda:
+                             self.mw.submit(ops.edit_op(mw.cur_selection,
+                                                       {"text": self.p_edit_text.get("1.0", END + "- 1 chars"),
+                                                        "is_dark": self.p_edit_tone.get()})))
         p_edit_submit.pack(side=TOP, anchor=NW)
 
         p_edit_delete = Button(self.p_edit_frame, **button_style)
         p_edit_delete.config(text="Delete Period",
-                             command=lambda: self.mw.delete_period(self.mw.cur_selection))
+                             command=lambda: self.mw.submit(ops.delete_op(mw.cur_selection)))
         p_edit_delete.pack(side=TOP, anchor=NW)
 
         self.e_edit_frame = Frame(self, **frame_style)
@@ -441,17 +1012,15 @@ class ControlPanel(Frame):
         self.e_edit_tone.set(False)
 
         e_edit_submit = Button(self.e_edit_frame, **button_style)
-        e_edit_submit.config(text="Edit Event",
-                             command=lambda: self.mw.edit_event(mw.cur_selection.index, MEvent(
-                                             self.mw.event_timeline,
-                                             self.e_edit_text.get("1.0", END + "- 1 chars"),
-                                             self.e_edit_tone.get(),
-                                             None, self.mw), self.e_edit_parent_period))
+        e_edit_submit.config(text="Edit Event", command=lambda:
+                             self.mw.submit(ops.edit_op(mw.cur_selection,
+                                                       {"text": self.e_edit_text.get("1.0", END + "- 1 chars"),
+                                                        "is_dark": self.e_edit_tone.get()})))
         e_edit_submit.pack(side=TOP, anchor=NW)
 
         e_edit_delete = Button(self.e_edit_frame, **button_style)
         e_edit_delete.config(text="Delete Event",
-                             command=lambda: self.mw.delete_event(self.mw.cur_selection, self.e_edit_parent_period))
+                             command=lambda: self.mw.submit(ops.delete_op(mw.cur_selection)))
         e_edit_delete.pack(side=TOP, anchor=NW)
 
         self.s_edit_frame = Frame(self, **frame_style)
@@ -492,25 +1061,44 @@ class ControlPanel(Frame):
 
         s_edit_submit = Button(self.s_edit_frame, **button_style)
         s_edit_submit.config(text="Edit Scene", command=lambda:
-                             self.mw.edit_scene(mw.scene_selection.index,
-                                                MScene(self.mw.scene_timeline,
-                                                       self.s_edit_question.get("1.0", END + "- 1 chars"),
-                                                       self.s_edit_setting.get("1.0", END + "- 1 chars"),
-                                                       self.s_edit_answer.get("1.0", END + "- 1 chars"),
-                                                       self.s_edit_tone.get(), None, self.mw),
-                                                self.mw.cur_selection))
+                             self.mw.submit(ops.edit_op(mw.scene_selection,
+                                                       {"question": self.s_edit_question.get("1.0", END + "- 1 chars"),
+                                                        "setting": self.s_edit_setting.get("1.0", END + "- 1 chars"),
+                                                        "answer": self.s_edit_answer.get("1.0", END + "- 1 chars"),
+                                                        "is_dark": self.s_edit_tone.get()})))
         s_edit_submit.pack(side=TOP, anchor=NW)
 
         s_edit_delete = Button(self.s_edit_frame, **button_style)
         s_edit_delete.config(text="Delete Scene",
-                             command=lambda: self.mw.delete_scene(self.mw.scene_selection, self.s_edit_parent_event))
+                             command=lambda: self.mw.submit(ops.delete_op(mw.scene_selection)))
         s_edit_delete.pack(side=TOP, anchor=NW)
 
+    def set_save_status(self, status: str):
+        if status != self.save_status:
+            self.save_status = status
+            self.save_label.config(text=self.save_texts.get(status, ""))
+
+    def search(self, _=None):
+        query = self.search_entry.get()
+        hits = self.mw.search(query) if query.strip() else []
+        self.search_hits = [card.id for card in hits]
+        self.search_results.delete(0, END)
+        for card in hits:
+            if isinstance(card, Scene):
+                text = "Scene: " + card.question
+            else:
+                text = ("Period: " if isinstance(card, Period) else "Event: ") + card.text
+            self.search_results.insert(END, " ".join(text.split())[:self.search_width])
+
+    def go_to_hit(self, index: Union[int, None]):
+        if index is not None and index < len(self.search_hits):
+            self.mw.go_to(self.search_hits[index])
+
     def clear_controls(self):
         if self.cur_frame is not None:
             self.cur_frame.pack_forget()
 
-    def set_p_edit(self, p: MPeriod):
+    def set_p_edit(self, p: Period):
         if self.cur_frame is not None:
             self.cur_frame.pack_forget()
         self.cur_frame = self.p_edit_frame
@@ -519,7 +1107,7 @@ class ControlPanel(Frame):
         self.p_edit_text.delete("1.0", END)
         self.p_edit_text.insert("1.0", p.text)
 
-    def set_e_edit(self, e: MEvent):
+    def set_e_edit(self, e: Event):
         if self.cur_frame is not None:
             self.cur_frame.pack_forget()
         self.cur_frame = self.e_edit_frame
@@ -527,9 +1115,8 @@ class ControlPanel(Frame):
         self.e_edit_tone.set(e.is_dark)
         self.e_edit_text.delete("1.0", END)
         self.e_edit_text.insert("1.0", e.text)
-        self.e_edit_parent_period = e.parent_period
 
-    def set_s_edit(self, s: MScene):
+    def set_s_edit(self, s: Scene):
         if self.cur_frame is not None:
             self.cur_frame.pack_forget()
         self.cur_frame = self.s_edit_frame
@@ -541,10 +1128,37 @@ class ControlPanel(Frame):
         self.s_edit_setting.insert("1.0", s.setting)
         self.s_edit_answer.delete("1.0", END)
         self.s_edit_answer.insert("1.0", s.answer)
-        self.s_edit_parent_event = s.parent_event
+
+
+class DebugOverlay(Label):
+    # The profiler's numbers over the top left of the window, kept up to date while it's showing
+    mw: "MainWindow"
+    refresh: int = 500  # ms
+    job: str = None
+
+    def __init__(self, mw: "MainWindow"):
+        super().__init__(mw, **label_style)
+        self.mw = mw
+        self.config(font=small_font, justify=LEFT, anchor=NW, background="#000000")
+
+    def toggle(self):
+        if self.job is not None:
+            self.after_cancel(self.job)
+            self.job = None
+            self.place_forget()
+        else:
+            self.place(x=8, y=8)
+            self.lift()
+            self.show()
+
+    def show(self):
+        self.config(text=self.mw.profiler.summary())
+        self.job = self.after(self.refresh, self.show)
 
 
 class MainWindow(Tk):
+    history: History
+
     controls: ControlPanel
 
     padding_frame: Frame
@@ -572,21 +1186,84 @@ class MainWindow(Tk):
     period_x = card_height
     period_y = card_width
     period_spacing_x = card_width - card_height
-    period_items: List[Union[PeriodDivider, MPeriod]] = []
 
     event_x = card_width
     event_y = card_height
     event_spacing_y = card_width - card_height
 
+    # Zooming out is only for canvas drawn cards, since widgets can't shrink their text
+    canvas_cards: bool
+    zoom_levels = (1, .5, .25, .1, .05, .02, .01)
+    zoom_level: int = 0
+
+    script: TclScript  # Sent at the end of every layout pass
+
+    period_layout: StripLayout
+    event_layout: StripLayout
+    scene_layout: StripLayout  # The scene timeline always stays at full size
+    column_extents: ColumnExtents
+    scroll_regions: Dict[str, tuple]
+
+    period_card_pool: CardPool
+    event_card_pool: CardPool
+
+    period_dispatcher: Dispatcher
+    event_dispatcher: Dispatcher
+    scene_dispatcher: Dispatcher
+
+    period_strip: Strip
+    event_strips: Dict[Period, Strip]  # Only for the period columns that are in view
+    scene_strips: StripCache  # Keyed by event
+    scene_strip: Strip = None  # The one that's showing
+    scene_event: Event = None  # The event whose scenes are in scene_timeline
+    scene_cache_size: int = 8
+
+    prefetch_queue: List[Event]
+    prefetch_job: str = None
+
+    # Layout that's been asked for but not done yet. See batch()
+    batch_depth: int = 0
+    layout_job: str = None
+    pending_canvases: bool = False
+    pending_columns: set
+    pending_scenes: bool = False
+
     primary_scroll: Scrollbar
     scene_scroll: Scrollbar
 
-    cur_selection: Union[MPeriod, MEvent] = None
-    scene_selection: MScene = None
+    cur_selection: Union[Period, Event] = None
+    scene_selection: Scene = None
+
+    search_limit: int = 50  # Most hits shown for a search
+    read_job: str = None  # Reading in the rest of a saved game so all of it can be searched, see read_rest
+    read_time: float = .01  # s, at a time
 
-    def __init__(self):
+    undo_log: UndoLog
+
+    # Only while profiling (see profiling). These are what get timed.
+    profiler: Profiler = None
+    debug_overlay: "DebugOverlay" = None
+    profiled = ("update_canvases", "update_scene_timeline", "p_selection", "e_selection", "s_selection",
+                "insert_period", "edit_period", "delete_period", "insert_event", "edit_event", "delete_event",
+                "insert_scene", "edit_scene", "delete_scene")
+
+    game: Autosave = None  # Where changes get saved, if anywhere
+    save_poll: int = 250  # ms, for showing how saving's going
+
+    # Only while playing over the network
+    client: Client = None
+    connection: ClientThread = None
+    network_poll: int = 15  # ms
+
+    def __init__(self, canvas_cards: bool = False, undo_limit: int = None, profiler: Profiler = None):
         super().__init__()
 
+        # Before any widgets are made or anything's bound, so all of it gets counted
+        if profiler is not None:
+            self.profiler = profiler
+            profiler.count_tcl(self)
+            profiler.instrument(self, self.profiled)
+
         # There's probably a better way to do this, but I don't know it
         global dark_img, small_dark_img, light_img, small_light_img, insert_img, minimize_img, maximize_img
         dark_img = PhotoImage(name="dark", file="Dark.png")
@@ -597,6 +1274,16 @@ class MainWindow(Tk):
         minimize_img = PhotoImage(name="minimize", file="Minimize.png")
         maximize_img = PhotoImage(name="maximize", file="Maximize.png")
 
+        self.history = History()
+        self.history.index = SearchIndex()
+        self.undo_log = UndoLog(undo_limit)
+
+        self.canvas_cards = canvas_cards
+        self.script = TclScript(self)
+        self.scene_layout = StripLayout(self.period_x, self.period_spacing_x)
+        self.column_extents = ColumnExtents()
+        self.scroll_regions = {}
+
         self.config(background=active_bg)
         self.title("Microscope TTRPG")
 
@@ -607,6 +1294,8 @@ class MainWindow(Tk):
         self.upper_frame.config(background=active_bg)
 
         self.controls = ControlPanel(self.upper_frame, self)
+        if profiler is not None:
+            profiler.instrument(self.controls, ControlPanel.profiled, "ControlPanel.")
         self.controls.pack(side=RIGHT, fill=Y, padx=4, pady=4)
 
         self.period_frame = Frame(self.upper_frame, **frame_style)
@@ -617,17 +1306,34 @@ class MainWindow(Tk):
         self.period_timeline = Canvas(self.upper_frame, **canvas_style)
         self.primary_scroll = Scrollbar(self.event_frame)
         self.period_timeline.config(width=800, height=self.period_y, xscrollcommand=self.primary_scroll.set)
+        self.period_timeline.bind("<Configure>", lambda _: self.update_canvases())
         self.period_timeline.pack(side=TOP, expand=FALSE, fill=X, padx=4, pady=4)
 
-        self.period_items.append(PeriodDivider(self.period_timeline, self))
-        self.period_items[0].id = self.period_timeline.create_window(0, 0, window=self.period_items[0])
-        self.period_items[0].index = 0
-
         self.event_timeline = Canvas(self.event_frame, **canvas_style)
         self.event_timeline.config(xscrollcommand=self.primary_scroll.set, yscrollincrement=1)
-        self.event_timeline.bind("<MouseWheel>", self.vertical_scroll)
+        self.event_timeline.bind("<Configure>", lambda _: self.update_event_strips())
         self.event_timeline.pack(side=TOP, expand=TRUE, fill=BOTH)
 
+        self.period_dispatcher = Dispatcher(self.period_timeline, self, lambda index, _: self.p_selection(index))
+        self.event_dispatcher = Dispatcher(self.event_timeline, self, self.e_selection, self.vertical_scroll)
+
+        self.event_strips = {}
+        self.build_timelines()
+
+        if self.canvas_cards:
+            self.period_timeline.bind("<Control-MouseWheel>", self.zoom_scroll)
+            self.event_timeline.bind("<Control-MouseWheel>", self.zoom_scroll)
+            self.bind("<Control-minus>", lambda _: self.set_zoom(self.zoom_level + 1))
+            self.bind("<Control-equal>", lambda _: self.set_zoom(self.zoom_level - 1))
+        self.bind("<Control-z>", self.undo)
+        self.bind("<Control-y>", self.redo)
+        self.bind("<Control-Z>", self.redo)
+        if profiler is not None:
+            self.debug_overlay = DebugOverlay(self)
+            self.bind("<F12>", lambda _: self.debug_overlay.toggle())
+            if profiler.path is not None:
+                self.bind("<Control-F12>", lambda _: profiler.export())
+
         self.primary_scroll.config(orient=HORIZONTAL, command=self.horizontal_scroll)
         self.primary_scroll.pack(side=TOP, expand=FALSE, fill=X)
 
@@ -651,8 +1357,23 @@ class MainWindow(Tk):
         self.scene_scroll = Scrollbar(self.scene_frame)
         self.scene_timeline = Canvas(self.scene_frame, **canvas_style)
         self.scene_timeline.config(height=self.period_y, xscrollcommand=self.scene_scroll.set)
+        self.scene_timeline.bind("<Configure>", lambda _: self.update_scene_timeline(self.scene_event))
         self.scene_timeline.pack(side=TOP, expand=FALSE, fill=X)
 
+        self.scene_dispatcher = Dispatcher(self.scene_timeline, self, self.s_selection)
+
+        if self.canvas_cards:
+            self.scene_card_pool = CardPool(self.scene_timeline, self.script,
+                                            lambda: CanvasScene(self.scene_timeline, self))
+        else:
+            self.scene_card_pool = CardPool(self.scene_timeline, self.script,
+                                            lambda: self.scene_dispatcher.adopt(MScene(self.scene_timeline, self)))
+        self.scene_strips = StripCache(self.scene_cache_size,
+                                       lambda: Strip(self.scene_timeline, self.scene_card_pool, self.scene_layout,
+                                                     self.period_y, True))
+        self.prefetch_queue = []
+        self.pending_columns = set()
+
         self.scene_scroll.config(orient=HORIZONTAL, command=self.scene_timeline_scroll)
         self.scene_scroll.pack(side=TOP, expand=FALSE, fill=X)
 
@@ -663,260 +1384,671 @@ class MainWindow(Tk):
         self.padding_frame.pack(side=TOP, expand=TRUE, fill=BOTH, padx=8, pady=8)
 
         self.update_canvases()
+        if profiler is not None:
+            profiler.watch(self)
+
+    @contextmanager
+    def batch(self):
+        # Any number of inserts, edits and deletes made inside this only lay the timelines out once, in an after_idle
+        # callback after the outermost batch finishes. Use it for anything that changes a lot of cards in one go, like
+        # loading a game or applying a burst of updates from the server. Changes made inside it are saved together, too.
+        game = self.game
+        self.batch_depth += 1
+        try:
+            if game is not None:
+                with game.action():
+                    yield self
+            else:
+                yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0 and self.layout_job is None and self.has_pending_layout():
+                self.layout_job = self.after_idle(self.flush_layout)
+
+    def request_layout(self, column: Period = None, scenes: bool = False):
+        # With no arguments, everything. Otherwise just the one event column and/or the scene strip.
+        if column is not None:
+            self.pending_columns.add(column)
+        elif not scenes:
+            self.pending_canvases = True
+        if scenes:
+            self.pending_scenes = True
+
+        if self.batch_depth == 0:
+            self.flush_layout()
+
+    def has_pending_layout(self) -> bool:
+        return self.pending_canvases or self.pending_scenes or len(self.pending_columns) > 0
+
+    def flush_layout(self):
+        if self.layout_job is not None:
+            self.after_cancel(self.layout_job)
+            self.layout_job = None
+
+        if self.pending_canvases:
+            self.update_canvases()
+        else:
+            for period in self.pending_columns:
+                self.update_event_column(period)
+        if self.pending_scenes:
+            self.update_scene_timeline(self.scene_event)
+
+        self.pending_canvases = False
+        self.pending_columns.clear()
+        self.pending_scenes = False
+        self.script.flush()
+
+    @property
+    def zoom(self) -> float:
+        return self.zoom_levels[self.zoom_level]
+
+    def build_timelines(self):
+        # Lays out the period strip and the event pools at the current zoom. Canvas cards are drawn for one zoom level,
+        # so changing it means starting these over.
+        zoom = self.zoom
+        self.period_layout = StripLayout(self.period_x * zoom, self.period_spacing_x * zoom)
+        self.event_layout = StripLayout(self.event_y * zoom, self.event_spacing_y * zoom)
+
+        # Every event strip draws from the same pool, so a column scrolling out of view frees up cards for the one
+        # scrolling in
+        if self.canvas_cards:
+            self.period_card_pool = CardPool(self.period_timeline, self.script,
+                                             lambda: CanvasPeriod(self.period_timeline, self, zoom))
+            self.event_card_pool = CardPool(self.event_timeline, self.script,
+                                            lambda: CanvasEvent(self.event_timeline, self, zoom))
+        else:
+            self.period_card_pool = CardPool(self.period_timeline, self.script,
+                                             lambda: self.period_dispatcher.adopt(MPeriod(self.period_timeline, self)))
+            self.event_card_pool = CardPool(self.event_timeline, self.script,
+                                            lambda: self.event_dispatcher.adopt(MEvent(self.event_timeline, self)))
+
+        self.period_strip = Strip(self.period_timeline, self.period_card_pool, self.period_layout,
+                                  self.period_y * zoom, True)
+
+    def set_zoom(self, level: int):
+        level = max(0, min(level, len(self.zoom_levels) - 1))
+        if level == self.zoom_level:
+            return
+
+        # Keep whatever is in the middle of the timelines there
+        first, last = self.period_timeline.xview()
+        center = (first + last) / 2
+
+        self.period_dispatcher.marker.hide()
+        self.event_dispatcher.marker.hide()
+        self.period_strip.clear()
+        for strip in self.event_strips.values():
+            strip.clear()
+        self.event_strips = {}
+        self.period_card_pool.clear()
+        self.event_card_pool.clear()
+
+        self.zoom_level = level
+        self.build_timelines()
+        self.period_timeline.config(height=self.period_y * self.zoom)
+        self.update_canvases()
+
+        first, last = self.period_timeline.xview()
+        self.horizontal_scroll("moveto", max(0, center - (last - first) / 2))
+
+    def zoom_scroll(self, e):
+        if e.delta > 0:
+            self.set_zoom(self.zoom_level - 1)
+        else:
+            self.set_zoom(self.zoom_level + 1)
 
-    def horizontal_scroll(self, start, end):
-        self.period_timeline.xview(start, end)
-        self.event_timeline.xview(start, end)
+    def horizontal_scroll(self, *args):
+        self.period_timeline.xview(*args)
+        self.event_timeline.xview(*args)
+        self.update_canvases()
 
     def vertical_scroll(self, e):
         if self.event_timeline.yview() != (0, 1):
             self.event_timeline.yview_scroll(int(-e.delta * .4), "units")
+            self.update_event_strips()
+
+    def scene_timeline_scroll(self, *args):
+        self.scene_timeline.xview(*args)
+        self.update_scene_timeline(self.scene_event)
+
+    def hit(self, canvas: Canvas, x: int, y: int):
+        # What's under (x, y) on one of the timelines. Every strip is a uniform grid of cards and gaps, so this is a bit
+        # of arithmetic on the layouts rather than asking Tk or searching anything. Gives the index among cards and
+        # gaps (even for a gap), the period or event the strip belongs to and the item's box in canvas coordinates, or
+        # None if there's nothing there.
+        x = canvas.canvasx(x)
+        y = canvas.canvasy(y)
+        if canvas is self.period_timeline:
+            parent = None
+            items = self.history.periods
+            layout = self.period_layout
+            breadth = self.period_y * self.zoom
+            left = 0
+        elif canvas is self.event_timeline:
+            column = int(x // self.period_layout.pitch)
+            if not 0 <= column < len(self.history.periods):
+                return None
+            parent = self.history.periods[column]
+            items = parent.events
+            layout = self.event_layout
+            breadth = self.event_x * self.zoom
+            left = column * self.period_layout.pitch
+        elif self.scene_event is not None:
+            parent = self.scene_event
+            items = parent.scenes
+            layout = self.scene_layout
+            breadth = self.period_y
+            left = 0
+        else:
+            return None
+
+        count = 2 * len(items) + 1
+        if canvas is self.event_timeline:
+            position, across = y, x - left
+        else:
+            position, across = x, y
+        if not 0 <= position < layout.length(count) or not 0 <= across < breadth:
+            return None
+
+        index = layout.item_at(position, count)
+        start, size = layout.span(index, count)
+        if canvas is self.event_timeline:
+            return index, parent, (left, start, left + breadth, start + size)
+        return index, parent, (start, 0, start + size, breadth)
+
+    def visible_range(self, canvas: Canvas, horizontal: bool, zoom: float = 1):
+        # Padded by a card on each side so there's something already there when scrolling starts
+        padding = self.card_width * zoom
+        if horizontal:
+            start = canvas.canvasx(0)
+            end = canvas.canvasx(canvas.winfo_width())
+        else:
+            start = canvas.canvasy(0)
+            end = canvas.canvasy(canvas.winfo_height())
+        return start - padding, end + padding
+
+    def submit(self, op: Op):
+        # Every change the player makes goes through here, so it can be undone
+        self.undo_log.record(self.change(op))
+
+    def change(self, op: Op) -> List[Op]:
+        # Playing alone, op is applied. Playing over the network, the client applies it straight away as well and then
+        # sends it off to the server. Gives back the ops that undo it, like ops.apply.
+        if self.client is not None and self.client.id is None:
+            # Still joining. Anything made now would have ids from the wrong site and be wiped by the server's history
+            # anyway, so it's turned down where the player can tell.
+            self.bell()
+            return []
+        if self.client is None:
+            return self.apply_op(op)
+        return self.client.submit(op)
+
+    def undo(self, e=None):
+        if e is not None and isinstance(e.widget, (Entry, Text)):
+            return  # Let text boxes have their own
+        with self.batch():
+            if not self.undo_log.undo(self.change):
+                self.bell()
+
+    def redo(self, e=None):
+        if e is not None and isinstance(e.widget, (Entry, Text)):
+            return
+        with self.batch():
+            if not self.undo_log.redo(self.change):
+                self.bell()
+
+    def apply_op(self, op: Op) -> List[Op]:
+        # Like ops.apply, but through the window's own insert/edit/delete methods so the timelines keep up. Changes from
+        # anywhere (the player, the server, an undo) all come through here, so this is where they're saved.
+        undo = self.make_change(op)
+        if undo and self.game is not None:
+            self.game.record(ops.trimmed(op, undo))
+        return undo
+
+    def make_change(self, op: Op) -> List[Op]:
+        ops.validate(op)
+
+        if op.kind == ops.INSERT:
+            placed = ops.place(self.history, op)
+            if placed is None:
+                return []
+            parent, card, index = placed
+            if op.level == 1:
+                self.insert_period(index, card)
+            elif op.level == 2:
+                self.insert_event(index, card, parent)
+            else:
+                self.insert_scene(index, card, parent)
+            return [ops.delete_op(card)]
+
+        card = ops.target(self.history, op)
+        if card is None:
+            return []
+        if op.kind == ops.EDIT:
+            fields = ops.edited_fields(card, op)
+            index = ops.index_of(self.history, card)
+            if op.level == 1:
+                old = self.edit_period(index, **fields)
+            elif op.level == 2:
+                old = self.edit_event(index, period=card.period, **fields)
+            else:
+                old = self.edit_scene(index, event=card.event, **fields)
+            return [ops.edit_op(card, old)] if old else []
+
+        undo = ops.card_ops(card)
+        if op.level == 1:
+            self.delete_period(card)
+        elif op.level == 2:
+            self.delete_event(card, card.period)
+        else:
+            self.delete_scene(card, card.event)
+        return undo
+
+    def open_game(self, path: str, debounce: float = None, interval: float = None):
+        # Opens the game saved at path, or starts a new one there, and saves every change to it from then on (see
+        # Autosave for debounce and interval). It's an SQLite database if the name ends in .db, .sqlite or .sqlite3.
+        # Only the periods are read in to start with; events and scenes are read as they come into view. Not while
+        # connected to a server (see connect).
+        if self.client is not None:
+            raise RuntimeError("can't open a saved game while connected to a server")
+        game = storage.open_game(path, debounce, interval)
+        with self.batch():
+            game.load(self.history, self.make_change, self.insert_period)
+        self.game = game
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.poll_save()
+
+    def poll_save(self):
+        if self.game is not None:
+            self.controls.set_save_status(self.game.status)
+            self.after(self.save_poll, self.poll_save)
+
+    def close(self):
+        if self.game is not None:
+            self.game.close()
+            self.game = None
+        self.destroy()
+
+    def connect(self, host: str, port: int):
+        # Joins the game on the server at host. Whatever's on the timelines now gets replaced by the server's history,
+        # which would delete everything in a saved game that's open, so there can't be one.
+        if self.game is not None:
+            raise RuntimeError("can't join a game with a saved game open")
+        self.client = Client(self.history, self.apply_op)
+        self.client.on_error = lambda _: self.bell()
+        self.connection = ClientThread(self.client, host, port)
+        self.connection.start()
+        self.title("Microscope TTRPG - connecting to {}:{}".format(host, port))
+        self.after(self.network_poll, self.poll_network)
+
+    def poll_network(self):
+        with self.batch():
+            while True:
+                try:
+                    message = self.connection.messages.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    # Changes made until the connection's back stay pending and get sent then
+                    self.title("Microscope TTRPG - reconnecting to {}:{}".format(self.connection.host,
+                                                                              self.connection.port))
+                    continue
+                if message["type"] in ("snapshot", "resume"):
+                    self.title("Microscope TTRPG - {}:{}".format(self.connection.host, self.connection.port))
+                self.client.receive(message)
+        self.after(self.network_poll, self.poll_network)
+
+    def search(self, query: str) -> list:
+        # The best matches for query, best first. Cards that haven't been read in yet aren't in the index, so this
+        # starts reading them in; the results get updated once that's done.
+        self.read_rest()
+        hits = self.history.index.search(query, self.search_limit)
+        return [self.history.cards[id] for id in hits]
+
+    def read_rest(self):
+        if self.history.deferred and self.read_job is None:
+            self.read_job = self.after_idle(self.read_some)
+
+    def read_some(self):
+        # A few blocks of the saved game per idle callback, so the window keeps up with the player meanwhile
+        self.read_job = None
+        deferred = self.history.deferred
+        end = time.perf_counter() + self.read_time
+        while deferred and time.perf_counter() < end:
+            ops.siblings(self.history, next(iter(deferred.values()))).load()
+        if deferred:
+            self.read_job = self.after_idle(self.read_some)
+        else:
+            self.controls.search()
+
+    def go_to(self, id: int):
+        # Selects the card and scrolls everything so it's in the middle of the view
+        card = self.history.card(id)
+        if card is None:
+            self.bell()
+            return
+        scene = card if isinstance(card, Scene) else None
+        event = card.event if scene is not None else card if isinstance(card, Event) else None
+        period = event.period if event is not None else card
+
+        if self.has_pending_layout():
+            self.flush_layout()
+        periods = self.history.periods
+        start, size = self.period_layout.span(2 * periods.index(period) + 1, 2 * len(periods) + 1)
+        self.horizontal_scroll("moveto", self.centered(self.period_timeline, True, start, size,
+                                                       self.period_layout.length(2 * len(periods) + 1)))
+        if event is None:
+            self.p_selection(2 * periods.index(period) + 1)
+            return
+
+        events = period.events
+        start, size = self.event_layout.span(2 * events.index(event) + 1, 2 * len(events) + 1)
+        self.event_timeline.yview_moveto(self.centered(self.event_timeline, False, start, size,
+                                                       self.event_layout.length(2 * self.column_extents.longest + 1)))
+        self.update_event_strips()
+        self.e_selection(2 * events.index(event) + 1, period)
+        if scene is None:
+            return
 
-    def scene_timeline_scroll(self, start, end):
-        self.scene_timeline.xview(start, end)
+        if self.is_minimized:
+            self.minimize_control()
+        scenes = event.scenes
+        start, size = self.scene_layout.span(2 * scenes.index(scene) + 1, 2 * len(scenes) + 1)
+        self.scene_timeline_scroll("moveto", self.centered(self.scene_timeline, True, start, size,
+                                                           self.scene_layout.length(2 * len(scenes) + 1)))
+        self.s_selection(2 * scenes.index(scene) + 1, event)
+
+    def centered(self, canvas: Canvas, horizontal: bool, start: float, size: float, length: float) -> float:
+        # Where to scroll canvas to (as a fraction of length) to put start..start + size in the middle of it
+        view = canvas.winfo_width() if horizontal else canvas.winfo_height()
+        return max(0., start + (size - view) / 2) / length if length > 0 else 0.
+
+    def mark_selection(self):
+        self.period_strip.mark_selection(self.cur_selection)
+        for strip in self.event_strips.values():
+            strip.mark_selection(self.cur_selection)
+        if self.scene_strip is not None:
+            self.scene_strip.mark_selection(self.scene_selection)
 
     def p_selection(self, index: int):
-        if self.cur_selection is not None:
-            self.cur_selection.release()
-        self.cur_selection = self.period_items[index]
-        if self.scene_selection is not None:
-            self.scene_selection.release()
+        self.scene_selection = None
 
-        self.update_scene_timeline()
-
-        if isinstance(self.cur_selection, PeriodDivider):
-            self.insert_period(index, MPeriod(self.period_timeline, "New Period", False, self))
+        if index % 2 == 0:
+            self.cur_selection = None
+            self.submit(ops.insert_op(self.history, None, index // 2, {"text": "New Period", "is_dark": False}))
             self.controls.clear_controls()
-        elif isinstance(self.cur_selection, MPeriod):
-            self.cur_selection.press()
+        else:
+            self.cur_selection = self.history.periods[index // 2]
+            self.mark_selection()
             self.controls.set_p_edit(self.cur_selection)
 
-    def edit_period(self, index: int, period: MPeriod):
-        self.period_timeline.delete(self.period_items[index].id)
-        old_events = self.period_items[index].event_items
-        self.period_items[index] = period
-        self.period_items[index].id = self.period_timeline.create_window(0, 0, window=self.period_items[index])
-        self.period_items[index].index = index
-        self.period_items[index].event_items = old_events
-
-        self.update_canvases()
-
-    def insert_period(self, index: int, period: MPeriod):
-        self.period_items.insert(index, PeriodDivider(self.period_timeline, self))
-        self.period_items.insert(index+1, period)
-
-        self.period_items[index].id = self.period_timeline.create_window(0, 0, window=self.period_items[index])
-        self.period_items[index+1].id = self.period_timeline.create_window(0, 0, window=self.period_items[index+1])
-
-        self.period_items[index+1].event_items[0].id = \
-            self.event_timeline.create_window(0, 0, window=self.period_items[index+1].event_items[0])
-        self.period_items[index + 1].event_items[0].register_event("<MouseWheel>", self.vertical_scroll)
+        self.update_scene_timeline()
 
-        for i in range(len(self.period_items)):
-            self.period_items[i].index = i
+    def edit_period(self, index: int, text: str, is_dark: bool) -> dict:
+        old = self.history.edit_period(index, text, is_dark)
+        if old:
+            self.period_strip.refresh(index)
+        return old
 
-        self.update_canvases()
+    def insert_period(self, index: int, period: Period):
+        self.history.insert_period(index, period)
 
-    def delete_period(self, period: MPeriod):
-        index = self.period_items.index(period)
-        self.period_timeline.delete(self.period_items[index].id)
-        self.period_timeline.delete(self.period_items[index+1].id)
+        self.period_strip.insert(index)
+        self.column_extents.add(len(period.events))
 
-        period_event_size = len(period.event_items)
-        for i in range(period_event_size):
-            self.event_timeline.delete(period.event_items[i].id)
+        self.request_layout()
 
-        del self.period_items[index:index+2]
+    def delete_period(self, period: Period):
+        index = self.history.periods.index(period)
+        self.history.delete_period(index)
 
-        for i in range(len(self.period_items)):
-            self.period_items[i].index = i
+        self.period_strip.remove(index)
+        self.column_extents.remove(len(period.events))
+        strip = self.event_strips.pop(period, None)
+        if strip is not None:
+            strip.clear()
 
-        self.controls.clear_controls()
+        # Someone else deleting something shouldn't take away what this player has selected, unless it went with it
+        selected = self.cur_selection
+        if selected is period or isinstance(selected, Event) and selected.period is period:
+            self.cur_selection = None
+            self.scene_selection = None
+            self.controls.clear_controls()
+        if self.scene_event is not None and self.scene_event.period is period:
+            self.update_scene_timeline()
+        for event in self.scene_strips.keys():
+            if event.period is period:
+                self.scene_strips.discard(event)
+        self.prefetch_queue.clear()
 
-        self.update_canvases()
+        self.request_layout()
 
-    def e_selection(self, index: int, period: MPeriod):
-        if self.cur_selection is not None:
-            self.cur_selection.release()
-        self.cur_selection = period.event_items[index]
-        if self.scene_selection is not None:
-            self.scene_selection.release()
+    def e_selection(self, index: int, period: Period):
+        self.scene_selection = None
 
-        if isinstance(self.cur_selection, EventDivider):
-            self.insert_event(index, MEvent(self.event_timeline, "New Event", False, period, self), period)
+        if index % 2 == 0:
+            self.cur_selection = None
+            self.submit(ops.insert_op(self.history, period, index // 2, {"text": "New Event", "is_dark": False}))
             self.controls.clear_controls()
             self.update_scene_timeline()
-        elif isinstance(self.cur_selection, MEvent):
-            self.cur_selection.press()
+        else:
+            self.cur_selection = period.events[index // 2]
+            self.mark_selection()
             self.controls.set_e_edit(self.cur_selection)
             self.update_scene_timeline(self.cur_selection)
 
-    def edit_event(self, index: int, event: MEvent, period: MPeriod):
-        event.parent_period = period
-        self.event_timeline.delete(period.event_items[index].id)
-        old_scenes = period.event_items[index].scene_items
-        period.event_items[index] = event
-        period.event_items[index].register_event("<MouseWheel>", self.vertical_scroll)
-        period.event_items[index].id = self.event_timeline.create_window(0, 0, window=period.event_items[index])
-        period.event_items[index].index = index
-        period.event_items[index].scene_items = old_scenes
+    def edit_event(self, index: int, text: str, is_dark: bool, period: Period) -> dict:
+        old = self.history.edit_event(period, index, text, is_dark)
+        if not old:
+            return old
 
-        event.update_scene_count()
+        strip = self.event_strips.get(period)
+        if strip is not None:
+            strip.refresh(index)
+        return old
 
-        self.update_canvases()
+    def insert_event(self, index: int, event: Event, period: Period):
+        self.history.insert_event(period, index, event)
 
-    def insert_event(self, index: int, event: MEvent, period: MPeriod):
-        period.event_items.insert(index, EventDivider(self.event_timeline, period, self))
-        period.event_items.insert(index+1, event)
+        self.column_extents.resize(len(period.events) - 1, len(period.events))
+        strip = self.event_strips.get(period)
+        if strip is not None:
+            strip.insert(index)
 
-        period.event_items[index].id = self.event_timeline.create_window(0, 0, window=period.event_items[index])
-        period.event_items[index+1].id = self.event_timeline.create_window(0, 0, window=period.event_items[index+1])
-        period.event_items[index].register_event("<MouseWheel>", self.vertical_scroll)
-        period.event_items[index+1].register_event("<MouseWheel>", self.vertical_scroll)
+        self.request_layout(column=period)
 
-        for i in range(len(period.event_items)):
-            period.event_items[i].index = i
+    def delete_event(self, event: Event, period: Period):
+        index = period.events.index(event)
+        self.history.delete_event(period, index)
 
-        self.update_canvases()
-
-    def delete_event(self, event: MEvent, period: MPeriod):
-        index = period.event_items.index(event)
-        self.event_timeline.delete(period.event_items[index].id)
-        self.event_timeline.delete(period.event_items[index+1].id)
-
-        del period.event_items[index:index+2]
-
-        for i in range(len(period.event_items)):
-            period.event_items[i].index = i
-
-        self.controls.clear_controls()
-
-        self.update_canvases()
+        self.column_extents.resize(len(period.events) + 1, len(period.events))
+        strip = self.event_strips.get(period)
+        if strip is not None:
+            strip.remove(index)
 
-    def s_selection(self, index: int, event: MEvent):
-        if self.scene_selection is not None:
-            self.scene_selection.release()
-        self.scene_selection = event.scene_items[index]
-
-        if isinstance(self.scene_selection, SceneDivider):
-            self.insert_scene(index, MScene(self.scene_timeline, "New Scene Question", "New Scene Setting",
-                                            "New Scene Answer", False, self.cur_selection, self), self.cur_selection)
+        if self.cur_selection is event:
+            self.cur_selection = None
+            self.scene_selection = None
+            self.controls.clear_controls()
+        if self.scene_event is event:
+            self.update_scene_timeline()
+        self.scene_strips.discard(event)
+        self.prefetch_queue.clear()
+        self.request_layout(column=period)
+
+    def s_selection(self, index: int, event: Event):
+        if index % 2 == 0:
+            self.scene_selection = None
+            self.submit(ops.insert_op(self.history, event, index // 2,
+                                      {"question": "New Scene Question", "setting": "New Scene Setting",
+                                       "answer": "New Scene Answer", "is_dark": False}))
             self.controls.clear_controls()
-        elif isinstance(self.scene_selection, MScene):
-            self.scene_selection.press()
+        else:
+            self.scene_selection = event.scenes[index // 2]
+            self.scene_strip.mark_selection(self.scene_selection)
             self.controls.set_s_edit(self.scene_selection)
-            self.update_scene_timeline(self.cur_selection)
 
-    def edit_scene(self, index: int, scene: MScene, event: MEvent):
-        scene.parent_event = event
-        self.scene_timeline.delete(event.scene_items[index].id)
-        event.scene_items[index] = scene
-        event.scene_items[index].id = self.scene_timeline.create_window(0, 0, window=event.scene_items[index])
-        event.scene_items[index].index = index
+    def edit_scene(self, index: int, question: str, setting: str, answer: str, is_dark: bool, event: Event) -> dict:
+        old = self.history.edit_scene(event, index, question, setting, answer, is_dark)
+        if not old:
+            return old
 
-        if event is self.cur_selection:
-            self.update_scene_timeline(event)
+        strip = self.scene_strips.get(event)
+        if strip is not None:
+            strip.refresh(index)
+        return old
 
-    def insert_scene(self, index: int, scene: MScene, event: MEvent):
-        event.scene_items.insert(index, SceneDivider(self.scene_timeline, event, self))
-        event.scene_items.insert(index + 1, scene)
+    def insert_scene(self, index: int, scene: Scene, event: Event):
+        self.history.insert_scene(event, index, scene)
 
-        for i in range(len(event.scene_items)):
-            event.scene_items[i].index = i
+        strip = self.scene_strips.get(event)
+        if strip is not None:
+            strip.insert(index)
+        if event is self.scene_event:
+            self.request_layout(scenes=True)
+        self.update_scene_count(event)
 
-        if self.cur_selection is event:
-            self.update_scene_timeline(event)
-        event.update_scene_count()
+    def delete_scene(self, scene: Scene, event: Event):
+        index = event.scenes.index(scene)
+        self.history.delete_scene(event, index)
 
-    def delete_scene(self, scene: MScene, event: MEvent):
-        index = event.scene_items.index(scene)
-        self.scene_timeline.delete(event.scene_items[index].id)
-        self.scene_timeline.delete(event.scene_items[index+1].id)
-
-        del event.scene_items[index:index+2]
-
-        for i in range(len(event.scene_items)):
-            event.scene_items[i].index = i
-
-        self.controls.clear_controls()
+        if self.scene_selection is scene:
+            self.scene_selection = None
+            self.controls.clear_controls()
 
-        if event is self.cur_selection:
-            self.update_scene_timeline(event)
-        event.update_scene_count()
+        strip = self.scene_strips.get(event)
+        if strip is not None:
+            strip.remove(index)
+        if event is self.scene_event:
+            self.request_layout(scenes=True)
+        self.update_scene_count(event)
+
+    def update_scene_count(self, event: Event):
+        strip = self.event_strips.get(event.period)
+        if strip is not None:
+            widget = strip.slots.get(event.period.events.index(event))
+            if widget is not None:
+                widget.update_scene_count()
+
+    def set_scroll_region(self, canvas: Canvas, width: float, height: float):
+        region = (0, 0, width, height)
+        if self.scroll_regions.get(str(canvas)) != region:
+            self.scroll_regions[str(canvas)] = region
+            canvas.config(scrollregion=region)
 
     def update_canvases(self):
-        period_item_size = len(self.period_items)
-        running_width = 0
-        for i in range(period_item_size):
-            if i == 0 or i == period_item_size-1:
-                self.period_items[i].config(width=self.period_spacing_x / 2, height=self.period_y)
-                self.period_timeline.moveto(self.period_items[i].id, running_width, 0)
-
-                running_width += self.period_spacing_x / 2
-            elif i % 2 == 0:
-                self.period_items[i].config(width=self.period_spacing_x, height=self.period_y)
-                self.period_timeline.moveto(self.period_items[i].id, running_width, 0)
-
-                running_width += self.period_spacing_x
-            else:
-                self.period_items[i].config(width=self.period_x, height=self.period_y)
-                self.period_timeline.moveto(self.period_items[i].id, running_width, 0)
-
-                running_width += self.period_x
-
-                event_items = self.period_items[i].event_items
-                event_item_size = len(event_items)
-
-                running_height = 0
-                event_x_pos = running_width - self.period_spacing_x / 2 - self.period_x
-
-                for j in range(event_item_size):
-                    if j == 0 or j == event_item_size-1:
-                        event_items[j].config(width=self.event_x, height=self.event_spacing_y / 2)
-                        self.event_timeline.moveto(event_items[j].id, event_x_pos, running_height)
-
-                        running_height += self.event_spacing_y / 2
-                    elif j % 2 == 0:
-                        event_items[j].config(width=self.event_x, height=self.event_spacing_y)
-                        self.event_timeline.moveto(event_items[j].id, event_x_pos, running_height)
-
-                        running_height += self.event_spacing_y
-                    else:
-                        event_items[j].config(width=self.event_x, height=self.event_y)
-                        self.event_timeline.moveto(event_items[j].id, event_x_pos, running_height)
-
-                        running_height += self.event_y
+        periods = self.history.periods
+
+        view_start, view_end = self.visible_range(self.period_timeline, True, self.zoom)
+        self.period_strip.render(periods, self.cur_selection, 0, view_start, view_end)
+        self.set_scroll_region(self.period_timeline, self.period_layout.length(2 * len(periods) + 1),
+                               self.period_y * self.zoom)
+
+        self.update_event_strips()
+
+    def update_event_strips(self):
+        periods = self.history.periods
+
+        # Each period's events go in a column directly underneath it
+        column_width = self.period_layout.pitch
+        view_start, view_end = self.visible_range(self.event_timeline, True, self.zoom)
+        first = max(0, int(view_start // column_width))
+        last = min(len(periods), int(view_end // column_width) + 1)
+        view_top, view_bottom = self.visible_range(self.event_timeline, False, self.zoom)
+
+        visible = set()
+        for k in range(first, last):
+            period = periods[k]
+            strip = self.event_strips.get(period)
+            if strip is None:
+                strip = Strip(self.event_timeline, self.event_card_pool, self.event_layout, self.event_x * self.zoom,
+                              False)
+                self.event_strips[period] = strip
+            strip.render(period.events, self.cur_selection, k * column_width, view_top, view_bottom)
+            visible.add(period)
+
+        for period in [period for period in self.event_strips if period not in visible]:
+            self.event_strips.pop(period).clear()
+
+        self.update_event_scroll_region()
+        self.script.flush()
+
+    def update_event_column(self, period: Period):
+        # Only this period's column changed, so the rest of the event timeline can stay as it is
+        strip = self.event_strips.get(period)
+        if strip is not None:
+            view_top, view_bottom = self.visible_range(self.event_timeline, False, self.zoom)
+            strip.render(period.events, self.cur_selection, strip.offset, view_top, view_bottom)
+
+        self.update_event_scroll_region()
+        self.script.flush()
+
+    def update_event_scroll_region(self):
+        width = len(self.history.periods) * self.period_layout.pitch
+        height = 0
+        if len(self.history.periods) > 0:
+            height = self.event_layout.length(2 * self.column_extents.longest + 1)
+        self.set_scroll_region(self.event_timeline, width, height)
+
+    def update_scene_timeline(self, event: Event = None):
+        if event is not self.scene_event:
+            self.switch_scene_strip(event)
+
+        if event is None:
+            self.set_scroll_region(self.scene_timeline, 0, 0)
+        else:
+            self.set_scroll_region(self.scene_timeline, self.scene_layout.length(2 * len(event.scenes) + 1),
+                                   self.period_y)
+            view_start, view_end = self.visible_range(self.scene_timeline, True)
+            self.scene_strip.render(event.scenes, self.scene_selection, 0, view_start, view_end)
+        self.script.flush()
 
-        self.period_timeline.config(scrollregion=self.period_timeline.bbox("all"))
-        self.event_timeline.config(scrollregion=self.event_timeline.bbox("all"))
+    def switch_scene_strip(self, event: Union[Event, None]):
+        self.scene_dispatcher.marker.hide()
+        if self.scene_strip is not None:
+            self.scene_strip.view = self.scene_timeline.xview()[0]
+            self.scene_strip.hide()
 
-    def update_scene_timeline(self, event: MEvent = None):
-        self.scene_timeline.delete("all")
+        self.scene_event = event
+        self.scene_strip = None
 
         if event is not None:
-            for scene_item in event.scene_items:
-                scene_item.id = self.scene_timeline.create_window(0, 0, window=scene_item)
-
-            running_width = 0
-            scene_item_size = len(event.scene_items)
-            for i in range(scene_item_size):
-                if i == 0 or i == scene_item_size - 1:
-                    event.scene_items[i].config(width=self.period_spacing_x / 2, height=self.period_y)
-                    self.scene_timeline.moveto(event.scene_items[i].id, running_width, 0)
-
-                    running_width += self.period_spacing_x / 2
-                elif i % 2 == 0:
-                    event.scene_items[i].config(width=self.period_spacing_x, height=self.period_y)
-                    self.scene_timeline.moveto(event.scene_items[i].id, running_width, 0)
-
-                    running_width += self.period_spacing_x
-                else:
-                    event.scene_items[i].config(width=self.period_x, height=self.period_y)
-                    self.scene_timeline.moveto(event.scene_items[i].id, running_width, 0)
-
-                    running_width += self.period_x
-
-        self.scene_timeline.config(scrollregion=self.scene_timeline.bbox("all"))
+            self.scene_strip = self.scene_strips.use(event)
+            self.set_scroll_region(self.scene_timeline, self.scene_layout.length(2 * len(event.scenes) + 1),
+                                   self.period_y)
+            self.scene_timeline.xview_moveto(self.scene_strip.view)
+            self.scene_strip.show()
+            self.schedule_prefetch(event)
+
+    def schedule_prefetch(self, event: Event):
+        # Lay out the scenes of the events on either side while Tk is idle, so stepping to them is just a show/hide
+        period = event.period
+        index = period.events.index(event)
+        self.prefetch_queue = [period.events[i] for i in (index + 1, index - 1) if 0 <= i < len(period.events)]
+
+        if self.prefetch_job is None:
+            self.prefetch_job = self.after_idle(self.prefetch_scenes)
+
+    def prefetch_scenes(self):
+        # One strip per idle callback, so a click that comes in meanwhile doesn't have to wait for all of them
+        self.prefetch_job = None
+        if not self.prefetch_queue or self.scene_event is None:
+            return
+
+        event = self.prefetch_queue.pop(0)
+        if event is not self.scene_event:
+            # Keep the strip that's showing the most recently used, so prefetching can't push it out of the cache
+            strip = self.scene_strips.use(event)
+            self.scene_strips.use(self.scene_event)
+
+            length = self.scene_layout.length(2 * len(event.scenes) + 1)
+            view_start = strip.view * length - self.card_width
+            view_end = strip.view * length + self.scene_timeline.winfo_width() + self.card_width
+            strip.render(event.scenes, None, 0, view_start, view_end)
+            self.script.flush()
+
+        if self.prefetch_queue:
+            self.prefetch_job = self.after_idle(self.prefetch_scenes)
 
     def minimize_control(self):
         if self.is_minimized:
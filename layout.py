@@ -0,0 +1,76 @@
+from collections import Counter
+
+
+# Layout math for the timelines, kept free of Tk so it can be worked out without touching the canvases.
+
+
+class StripLayout:
+    # Strips alternate gap, card, gap, ..., gap and the gaps on either end are half width. The gaps are where new cards
+    # get inserted. Every card in a strip is the same size, so the running offset of any item is closed form and nothing
+    # has to be re-summed when something is inserted in front of it.
+    card_size: float
+    spacing: float
+
+    def __init__(self, card_size: float, spacing: float):
+        self.card_size = card_size
+        self.spacing = spacing
+
+    @property
+    def pitch(self) -> float:
+        return self.card_size + self.spacing
+
+    def span(self, index: int, count: int):
+        # Where the item at index starts along the strip and how long it is
+        if index == 0:
+            return 0, self.spacing / 2
+        if index % 2 == 1:
+            return self.spacing / 2 + (index // 2) * self.pitch, self.card_size
+        start = (index // 2) * self.pitch - self.spacing / 2
+        if index == count - 1:
+            return start, self.spacing / 2
+        return start, self.spacing
+
+    def item_at(self, position: float, count: int) -> int:
+        if position < self.spacing / 2:
+            return 0
+        k = int((position - self.spacing / 2) // self.pitch)
+        if position - self.spacing / 2 - k * self.pitch < self.card_size:
+            index = 2 * k + 1
+        else:
+            index = 2 * k + 2
+        return min(index, count - 1)
+
+    def cards(self, start: float, end: float, cards: int) -> range:
+        # Which of the cards (counting only cards, not gaps) overlap start to end
+        count = 2 * cards + 1
+        return range(self.item_at(start, count) // 2, (self.item_at(end, count) + 1) // 2)
+
+    def length(self, count: int) -> float:
+        start, size = self.span(count - 1, count)
+        return start + size
+
+
+class ColumnExtents:
+    # The event timeline is as tall as its longest column. Rather than walk every period to find it after each change,
+    # keep a count of how many columns have each length and nudge the maximum as columns grow and shrink.
+    counts: Counter
+    longest: int
+
+    def __init__(self):
+        self.counts = Counter()
+        self.longest = 0
+
+    def add(self, size: int):
+        self.counts[size] += 1
+        self.longest = max(self.longest, size)
+
+    def remove(self, size: int):
+        self.counts[size] -= 1
+        if self.counts[size] == 0:
+            del self.counts[size]
+        while self.longest > 0 and self.longest not in self.counts:
+            self.longest -= 1
+
+    def resize(self, old_size: int, new_size: int):
+        self.add(new_size)
+        self.remove(old_size)
@@ -1,10 +1,48 @@
+import argparse
+
+import protocol
 from gui import MainWindow
+from profiling import Profiler
+from storage import Autosave
+from undo import UndoLog
 
 
 def main():
-    gui = MainWindow()
+    parser = argparse.ArgumentParser(description="Microscope TTRPG")
+    parser.add_argument("--canvas", action="store_true",
+                        help="draw cards as canvas items instead of widgets, which also lets the timelines zoom out")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="join a game hosted with server.py")
+    parser.add_argument("game", nargs="?",
+                        help="file to save the game to, and load it from if it's already there (an SQLite database "
+                             "if it ends in .db, .sqlite or .sqlite3). Not with --connect.")
+    parser.add_argument("--save-debounce", type=float, metavar="SECONDS",
+                        help="save changes once they've stopped coming for this long (default: %(default)s)",
+                        default=Autosave.debounce)
+    parser.add_argument("--save-interval", type=float, metavar="SECONDS",
+                        help="save changes at least this often while they keep coming (default: %(default)s)",
+                        default=Autosave.interval)
+    parser.add_argument("--undo-limit", type=int, metavar="STEPS",
+                        help="how many changes can be undone (default: %(default)s)", default=UndoLog.limit)
+    parser.add_argument("--profile", metavar="FILE",
+                        help="time the window's hot paths, count Tcl calls and watch for stalls, and write it all to "
+                             "FILE as JSON on the way out (or on Ctrl+F12). F12 shows the numbers over the window.")
+    args = parser.parse_args()
+    if args.game and args.connect:
+        # The server's history would replace the saved game's, and saving that would wipe it
+        parser.error("a saved game can't be opened when joining one with --connect")
+
+    profiler = Profiler(args.profile) if args.profile else None
+    gui = MainWindow(canvas_cards=args.canvas, undo_limit=args.undo_limit, profiler=profiler)
+    if args.game:
+        gui.open_game(args.game, args.save_debounce, args.save_interval)
+    if args.connect:
+        host, _, port = args.connect.partition(":")
+        gui.connect(host, int(port) if port else protocol.DEFAULT_PORT)
     gui.mainloop()
+    if profiler is not None:
+        profiler.stop()
+        profiler.export()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,413 @@
+import random
+from typing import Callable, Dict, Iterator, List, Optional
+
+import positions
+from positions import Key
+
+
+# The game state, kept apart from the widgets so a whole history can be held (and eventually saved, searched and
+# synced) without a display. Records use __slots__ since a long campaign can have thousands of them.
+#
+# Every card has an id that's unique across the game and a position key (see positions) that orders it among its
+# siblings. Sequences are kept sorted by (key, id), so a card inserted by its key lands in the same place whatever
+# else has been inserted around it in the meantime.
+
+_random = random.Random()
+
+
+class _Node:
+    __slots__ = ("item", "priority", "size", "left", "right", "parent")
+
+    def __init__(self, item):
+        self.item = item
+        self.priority = _random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: _Node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    if node.left is not None:
+        node.left.parent = node
+    if node.right is not None:
+        node.right.parent = node
+
+
+def _split(node: Optional[_Node], index: int):
+    # The first index items go left, the rest go right
+    if node is None:
+        return None, None
+    if _size(node.left) >= index:
+        left, node.left = _split(node.left, index)
+        _update(node)
+        return left, node
+    node.right, right = _split(node.right, index - _size(node.left) - 1)
+    _update(node)
+    return node, right
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class Sequence:
+    # Ordered container for cards. It's its own class so what's behind it can change without touching the GUI.
+    #
+    # Behind it is a treap keyed on position (each node knows the size of its subtree), so getting, inserting and
+    # removing at an index are all O(log n). Every item keeps a pointer to its node, which makes finding an item's
+    # position a walk up to the root rather than a scan through the list.
+    #
+    # A sequence can also start out without its items, for a saved game that's only read in as it's looked at (see
+    # History.defer). It knows how long it is, and the first time anything else is asked of it, load is called for the
+    # items.
+    __slots__ = ("_root", "_load", "_length")
+
+    _root: Optional[_Node]
+    _load: Optional[Callable[[], list]]
+    _length: int
+
+    def __init__(self, items=(), load: Callable[[], list] = None, length: int = 0):
+        self._root = None
+        self._load = load
+        self._length = length
+        for item in items:
+            self.insert(len(self), item)
+
+    @property
+    def loaded(self) -> bool:
+        return self._load is None
+
+    def load(self):
+        if self._load is not None:
+            load, self._load = self._load, None
+            for item in load():
+                self.insert(len(self), item)
+
+    def __len__(self) -> int:
+        if self._load is not None:
+            return self._length
+        return _size(self._root)
+
+    def __iter__(self) -> Iterator:
+        self.load()
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.item
+            node = node.right
+
+    def __getitem__(self, index: int):
+        self.load()
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Sequence index out of range")
+
+        node = self._root
+        while True:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.item
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def insert(self, index: int, item):
+        self.load()
+        index = max(0, min(index, len(self)))
+        node = _Node(item)
+        item._node = node
+
+        left, right = _split(self._root, index)
+        self._root = _merge(_merge(left, node), right)
+        self._root.parent = None
+
+    def pop(self, index: int):
+        self.load()
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("pop index out of range")
+
+        left, rest = _split(self._root, index)
+        node, right = _split(rest, 1)
+        self._root = _merge(left, right)
+        if self._root is not None:
+            self._root.parent = None
+
+        node.item._node = None
+        return node.item
+
+    def bisect(self, item) -> int:
+        # The index item belongs at by its key and id
+        self.load()
+        order = item.key, item.id
+        index = 0
+        node = self._root
+        while node is not None:
+            if (node.item.key, node.item.id) < order:
+                index += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return index
+
+    def index(self, item) -> int:
+        node = getattr(item, "_node", None)
+        if node is None:
+            raise ValueError("item is not in Sequence")
+
+        index = _size(node.left)
+        while node.parent is not None:
+            if node is node.parent.right:
+                index += _size(node.parent.left) + 1
+            node = node.parent
+        if node is not self._root:
+            raise ValueError("item is not in Sequence")
+        return index
+
+
+class Scene:
+    __slots__ = ("question", "setting", "answer", "is_dark", "event", "id", "key", "_node")
+
+    question: str
+    setting: str
+    answer: str
+    is_dark: bool
+
+    event: Optional["Event"]
+    id: Optional[int]
+    key: Optional[Key]
+
+    def __init__(self, question: str, setting: str, answer: str, is_dark: bool, id: int = None, key: Key = None):
+        self.question = question
+        self.setting = setting
+        self.answer = answer
+        self.is_dark = is_dark
+        self.event = None
+        self.id = id
+        self.key = key
+        self._node = None
+
+
+class Event:
+    __slots__ = ("text", "is_dark", "period", "scenes", "id", "key", "_node")
+
+    text: str
+    is_dark: bool
+
+    period: Optional["Period"]
+    scenes: Sequence
+    id: Optional[int]
+    key: Optional[Key]
+
+    def __init__(self, text: str, is_dark: bool, scenes: List[Scene] = (), id: int = None, key: Key = None):
+        self.text = text
+        self.is_dark = is_dark
+        self.period = None
+        self.id = id
+        self.key = key
+        self._node = None
+        self.scenes = Sequence(scenes)
+        for scene in self.scenes:
+            scene.event = self
+
+
+class Period:
+    __slots__ = ("text", "is_dark", "events", "id", "key", "_node")
+
+    text: str
+    is_dark: bool
+
+    events: Sequence
+    id: Optional[int]
+    key: Optional[Key]
+
+    def __init__(self, text: str, is_dark: bool, events: List[Event] = (), id: int = None, key: Key = None):
+        self.text = text
+        self.is_dark = is_dark
+        self.id = id
+        self.key = key
+        self._node = None
+        self.events = Sequence(events)
+        for event in self.events:
+            event.period = self
+
+
+def _edit(record, **fields) -> dict:
+    # Sets only the fields that differ and returns what they were before, so callers can tell whether anything changed
+    old = {}
+    for name, value in fields.items():
+        if getattr(record, name) != value:
+            old[name] = getattr(record, name)
+            setattr(record, name, value)
+    return old
+
+
+def _children(card) -> Sequence:
+    if isinstance(card, Period):
+        return card.events
+    if isinstance(card, Event):
+        return card.scenes
+    return Sequence()
+
+
+class History:
+    periods: Sequence
+    cards: Dict[int, object]  # Every card in the history, by id
+    deferred: Dict[int, object]  # The cards whose children haven't been read in yet (see defer), by id
+
+    # For cards that haven't been read in yet, from whatever the history's being read from: the id of the parent of the
+    # card with an id, or None if it hasn't got one there. It's asked as it's needed rather than up front, so opening a
+    # game doesn't cost more the more there is in it that isn't on screen.
+    locate: Callable[[int], Optional[int]] = None
+    highest_unloaded: int = 0  # None of the cards that haven't been read in have a higher id than this
+    index = None  # A search.SearchIndex, if there is one, kept up to date with the cards' text as they change
+
+    # Ids are site << 32 | n, where site is different for everyone who can add cards to the same game (a client gets
+    # its id from the server) and n counts up
+    site: int = 0
+    last_id: int = 0
+
+    def __init__(self, periods: List[Period] = ()):
+        self.periods = Sequence()
+        self.cards = {}
+        self.deferred = {}
+        for period in periods:
+            self.insert_period(len(self.periods), period)
+
+    def new_id(self) -> int:
+        self.last_id += 1
+        return self.site << 32 | self.last_id
+
+    def card(self, id: int):
+        # The card with id, read in first if it hasn't been yet, or None if there isn't one
+        card = self.cards.get(id)
+        if card is None and self.deferred and self.locate is not None:
+            parent = self.locate(id)
+            if parent is not None:
+                children = _children(self.card(parent))
+                if not children.loaded:
+                    children.load()
+                    card = self.cards.get(id)
+        return card
+
+    def defer(self, card, count: int, load: Callable[[], list]):
+        # Leaves card's count children to be read in when something first needs them. load gives them back in order,
+        # with their ids and keys, and with no children of their own or deferred ones. Until then, locate has to be able
+        # to find them, so they can be found by id.
+        def children() -> list:
+            self.deferred.pop(card.id, None)
+            items = load()
+            for item in items:
+                if isinstance(card, Period):
+                    item.period = card
+                else:
+                    item.event = card
+                self.cards[item.id] = item
+                if self.index is not None:
+                    self.index.add(item)
+            return items
+
+        if isinstance(card, Period):
+            card.events = Sequence(load=children, length=count)
+        else:
+            card.scenes = Sequence(load=children, length=count)
+        self.deferred[card.id] = card
+
+    def _place(self, cards: Sequence, index: int, card):
+        # Cards inserted by index rather than by key (and anything already under them) get a key for where they're
+        # put, and an id if they need one
+        if card.key is None:
+            card.key = positions.new_key(cards[index - 1].key if index > 0 else None,
+                                         cards[index].key if index < len(cards) else None, self.site)
+        self._add(card)
+
+    def _edit(self, card, **fields) -> dict:
+        old = _edit(card, **fields)
+        if old and self.index is not None:
+            self.index.add(card)
+        return old
+
+    def _add(self, card):
+        if card.id is None:
+            card.id = self.new_id()
+        self.cards[card.id] = card
+        if self.index is not None:
+            self.index.add(card)
+        if not _children(card).loaded:
+            return
+        previous = None
+        for child in _children(card):
+            if child.key is None:
+                child.key = positions.new_key(previous, None, self.site)
+            previous = child.key
+            self._add(child)
+
+    def _remove(self, card):
+        self.cards.pop(card.id, None)
+        self.deferred.pop(card.id, None)
+        if self.index is not None:
+            self.index.remove(card)
+        for child in _children(card):
+            self._remove(child)
+
+    def insert_period(self, index: int, period: Period):
+        self._place(self.periods, index, period)
+        self.periods.insert(index, period)
+
+    def edit_period(self, index: int, text: str, is_dark: bool) -> dict:
+        return self._edit(self.periods[index], text=text, is_dark=is_dark)
+
+    def delete_period(self, index: int) -> Period:
+        period = self.periods.pop(index)
+        self._remove(period)
+        return period
+
+    def insert_event(self, period: Period, index: int, event: Event):
+        self._place(period.events, index, event)
+        event.period = period
+        period.events.insert(index, event)
+
+    def edit_event(self, period: Period, index: int, text: str, is_dark: bool) -> dict:
+        return self._edit(period.events[index], text=text, is_dark=is_dark)
+
+    def delete_event(self, period: Period, index: int) -> Event:
+        event = period.events.pop(index)
+        self._remove(event)
+        return event
+
+    def insert_scene(self, event: Event, index: int, scene: Scene):
+        self._place(event.scenes, index, scene)
+        scene.event = event
+        event.scenes.insert(index, scene)
+
+    def edit_scene(self, event: Event, index: int, question: str, setting: str, answer: str, is_dark: bool) -> dict:
+        return self._edit(event.scenes[index], question=question, setting=setting, answer=answer, is_dark=is_dark)
+
+    def delete_scene(self, event: Event, index: int) -> Scene:
+        scene = event.scenes.pop(index)
+        self._remove(scene)
+        return scene
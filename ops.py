@@ -0,0 +1,249 @@
+from typing import List, Optional, Tuple
+
+import positions
+from model import Event, History, Period, Scene, Sequence
+from positions import Key
+
+
+# Changes to a History as plain data, so they can be sent over the network, logged and undone. Cards are addressed by
+# id, and inserts say where they go with a position key rather than an index, so changes made at the same time by
+# different players can be applied in either order and come out the same:
+#   - two inserts in the same spot are ordered by key and then id
+#   - a change to a card that's gone (or an insert under one) does nothing, whether it arrives before the delete or
+#     after it would have made no difference
+#   - deletes and inserts of a card that's already there do nothing, so nothing breaks when one arrives twice
+# Only edits to the same field of the same card depend on order, and for those the server's order is the one that
+# counts. An OpError means the op itself makes no sense, not that it came at a bad time.
+
+INSERT = "insert"
+EDIT = "edit"
+DELETE = "delete"
+
+KINDS = (INSERT, EDIT, DELETE)
+
+# The fields of each kind of card, by level: 1 for a period, 2 for an event and 3 for a scene
+FIELDS = {1: ("text", "is_dark"),
+          2: ("text", "is_dark"),
+          3: ("question", "setting", "answer", "is_dark")}
+
+
+class OpError(ValueError):
+    pass
+
+
+class Op:
+    __slots__ = ("kind", "level", "card", "fields", "parent", "key")
+
+    kind: str
+    level: int
+    card: int  # The id of the card it changes
+    fields: dict  # Every field for an insert, only the changed ones for an edit and nothing for a delete
+
+    # Inserts only
+    parent: Optional[int]  # The id of the period or event it goes in, None for a period
+    key: Optional[Key]
+
+    def __init__(self, kind: str, level: int, card: int, fields: dict = None, parent: int = None, key: Key = None):
+        self.kind = kind
+        self.level = level
+        self.card = card
+        self.fields = fields if fields is not None else {}
+        self.parent = parent
+        self.key = tuple(key) if key is not None else None
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Op) and self.kind == other.kind and self.level == other.level and
+                self.card == other.card and self.fields == other.fields and self.parent == other.parent and
+                self.key == other.key)
+
+    def __repr__(self) -> str:
+        if self.kind == INSERT:
+            return "Op({!r}, {!r}, {!r}, {!r}, {!r}, {!r})".format(self.kind, self.level, self.card, self.fields,
+                                                                    self.parent, self.key)
+        return "Op({!r}, {!r}, {!r}, {!r})".format(self.kind, self.level, self.card, self.fields)
+
+
+def level_of(card) -> int:
+    if isinstance(card, Period):
+        return 1
+    if isinstance(card, Event):
+        return 2
+    return 3
+
+
+def parent_of(card):
+    if isinstance(card, Period):
+        return None
+    if isinstance(card, Event):
+        return card.period
+    return card.event
+
+
+def siblings(history: History, parent) -> Sequence:
+    # The sequence that parent's children (or the periods, for None) are in
+    if parent is None:
+        return history.periods
+    if isinstance(parent, Period):
+        return parent.events
+    return parent.scenes
+
+
+def insert_op(history: History, parent, index: int, fields: dict) -> Op:
+    # An insert of a brand new card at index among parent's children
+    cards = siblings(history, parent)
+    key = positions.new_key(cards[index - 1].key if index > 0 else None,
+                            cards[index].key if index < len(cards) else None, history.site)
+    level = level_of(parent) + 1 if parent is not None else 1
+    return Op(INSERT, level, history.new_id(), fields, parent.id if parent is not None else None, key)
+
+
+def edit_op(card, fields: dict) -> Op:
+    return Op(EDIT, level_of(card), card.id, fields)
+
+
+def delete_op(card) -> Op:
+    return Op(DELETE, level_of(card), card.id)
+
+
+def validate(op: Op):
+    # Raises OpError unless op is well formed
+    if op.kind not in KINDS:
+        raise OpError("unknown operation {!r}".format(op.kind))
+    if op.level not in FIELDS:
+        raise OpError("bad level {!r}".format(op.level))
+    if not isinstance(op.card, int):
+        raise OpError("bad card id {!r}".format(op.card))
+
+    names = FIELDS[op.level]
+    unknown = [name for name in op.fields if name not in names]
+    if unknown:
+        raise OpError("unknown fields {}".format(", ".join(unknown)))
+    if op.kind == INSERT:
+        if len(op.fields) != len(names):
+            raise OpError("an insert needs {}".format(", ".join(names)))
+        if not op.key or not all(isinstance(digit, int) for digit in op.key):
+            raise OpError("bad position {!r}".format(op.key))
+        # Digits that don't fit in 64 bits, and keys with no room just ahead of them, like ones ending in a 0 after the
+        # first digit (see positions)
+        if (op.key[0] not in positions.FIRST_DIGITS or not all(digit in positions.DIGITS for digit in op.key[1:]) or
+                len(op.key) > 1 and op.key[-1] == 0 or op.key == (positions.FIRST_DIGITS.start,)):
+            raise OpError("bad position {!r}".format(op.key))
+        if (op.parent is None) != (op.level == 1):
+            raise OpError("a period can't have a parent and nothing else can go without one")
+
+
+def new_card(op: Op):
+    fields = op.fields
+    if op.level == 1:
+        return Period(fields["text"], fields["is_dark"], id=op.card, key=op.key)
+    if op.level == 2:
+        return Event(fields["text"], fields["is_dark"], id=op.card, key=op.key)
+    return Scene(fields["question"], fields["setting"], fields["answer"], fields["is_dark"], id=op.card, key=op.key)
+
+
+def place(history: History, op: Op) -> Optional[Tuple[object, object, int]]:
+    # For an insert, the parent (None for a period), the new card and the index it goes at, or None if the insert
+    # doesn't do anything
+    if history.card(op.card) is not None:
+        return None
+    parent = None
+    if op.parent is not None:
+        parent = history.card(op.parent)
+        if parent is None:
+            return None
+        if level_of(parent) != op.level - 1:
+            raise OpError("card {} can't go in card {}".format(op.card, op.parent))
+    card = new_card(op)
+    return parent, card, siblings(history, parent).bisect(card)
+
+
+def target(history: History, op: Op):
+    # The card an edit or delete is for, or None if it's gone
+    card = history.card(op.card)
+    if card is not None and level_of(card) != op.level:
+        raise OpError("card {} isn't at level {}".format(op.card, op.level))
+    return card
+
+
+def index_of(history: History, card) -> int:
+    return siblings(history, parent_of(card)).index(card)
+
+
+def insert_of(card) -> Op:
+    # The insert that would recreate card on its own
+    parent = parent_of(card)
+    level = level_of(card)
+    return Op(INSERT, level, card.id, {name: getattr(card, name) for name in FIELDS[level]},
+              parent.id if parent is not None else None, card.key)
+
+
+def card_ops(card) -> List[Op]:
+    # The inserts that would recreate card, along with everything under it
+    ops = [insert_of(card)]
+    if isinstance(card, Period):
+        for event in card.events:
+            ops.extend(card_ops(event))
+    elif isinstance(card, Event):
+        ops.extend(insert_of(scene) for scene in card.scenes)
+    return ops
+
+
+def snapshot(history: History) -> List[Op]:
+    ops = []
+    for period in history.periods:
+        ops.extend(card_ops(period))
+    return ops
+
+
+def edited_fields(card, op: Op) -> dict:
+    # Every field of card as it'll be after the edit op
+    return {name: op.fields.get(name, getattr(card, name)) for name in FIELDS[op.level]}
+
+
+def trimmed(op: Op, undo: List[Op]) -> Op:
+    # op cut down to what it changed, given the ops that undo it: an edit only needs the fields that were different
+    if op.kind != EDIT or not undo:
+        return op
+    return Op(EDIT, op.level, op.card, {name: op.fields[name] for name in undo[0].fields})
+
+
+def apply(history: History, op: Op) -> List[Op]:
+    # Applies op and gives back the ops that would undo it, in the order they should be applied (nothing, if op didn't
+    # change anything). Raises OpError if op is malformed.
+    validate(op)
+
+    if op.kind == INSERT:
+        placed = place(history, op)
+        if placed is None:
+            return []
+        parent, card, index = placed
+        if op.level == 1:
+            history.insert_period(index, card)
+        elif op.level == 2:
+            history.insert_event(parent, index, card)
+        else:
+            history.insert_scene(parent, index, card)
+        return [delete_op(card)]
+
+    card = target(history, op)
+    if card is None:
+        return []
+    index = index_of(history, card)
+    if op.kind == EDIT:
+        fields = edited_fields(card, op)
+        if op.level == 1:
+            old = history.edit_period(index, **fields)
+        elif op.level == 2:
+            old = history.edit_event(card.period, index, **fields)
+        else:
+            old = history.edit_scene(card.event, index, **fields)
+        return [edit_op(card, old)] if old else []
+
+    undo = card_ops(card)
+    if op.level == 1:
+        history.delete_period(index)
+    elif op.level == 2:
+        history.delete_event(card.period, index)
+    else:
+        history.delete_scene(card.event, index)
+    return undo
@@ -0,0 +1,66 @@
+from typing import Optional, Tuple
+
+
+# Position keys say where a card goes among its siblings without saying what index it's at, so two players can insert
+# cards at the same time without either insert moving the other. A key is a tuple of ints compared like a decimal
+# fraction: the first digit is any int and the rest are non-negative (under BASE, apart from the site digits below).
+# Between any two different keys there's always room for another one, as long as no key ends in a 0 after its first
+# digit.
+#
+# Two players putting a card in the same spot at the same time would pick the same key, and then there'd be no room
+# between the two cards for anything else. So new keys end with a digit for the site that made them (see
+# History.new_id), which keeps them apart. Card ids break any ties that are left, so everyone still agrees on the
+# order.
+
+Key = Tuple[int, ...]
+
+BASE = 1 << 16
+
+# What a key's digits can be at all, so they fit in 64 bits wherever they're stored (see storage.key_blob). (A key of
+# just the lowest first digit would leave no room ahead of it, so that's not a key either.)
+FIRST_DIGITS = range(-1 << 63, 1 << 63)
+DIGITS = range(0, 1 << 64)
+STEP = 1 << 16  # Between first digits of cards added at the ends, so the middles have room before keys get longer
+
+
+def _after(digits: Key) -> list:
+    # The shortest digits (after the first) that come after digits, with nothing in the way above
+    if not digits:
+        return [BASE // 2]
+    if BASE - digits[0] > 1:
+        return [(digits[0] + BASE) // 2]
+    return [digits[0]] + _after(digits[1:])
+
+
+def between(before: Optional[Key], after: Optional[Key]) -> Key:
+    # A key that sorts after before and ahead of after. Either can be None for the start or end of the line.
+    if before is None and after is None:
+        return 0,
+    if after is None:
+        if before[0] + STEP in FIRST_DIGITS:
+            return before[0] + STEP,
+        return (before[0],) + tuple(_after(before[1:]))  # Out of first digits, so it has to get longer instead
+    if before is None:
+        if after[0] - STEP in FIRST_DIGITS:
+            return after[0] - STEP,
+        before = FIRST_DIGITS.start,  # Which nothing can come ahead of, so there's no key that's just that
+    if not before < after:
+        raise ValueError("{} doesn't come before {}".format(before, after))
+
+    key = []
+    for i, high in enumerate(after):
+        low = before[i] if i < len(before) else 0
+        if low == high:
+            key.append(low)
+        elif high - low > 1:
+            key.append((low + high) // 2)
+            return tuple(key)
+        else:
+            key.append(low)
+            return tuple(key + _after(before[i + 1:]))
+    # after can't run out first, since it'd have to be a prefix of before (and so come ahead of it)
+    raise ValueError("{} doesn't come before {}".format(before, after))
+
+
+def new_key(before: Optional[Key], after: Optional[Key], site: int) -> Key:
+    return between(before, after) + (site + 1,)
@@ -0,0 +1,188 @@
+import functools
+import json
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List
+
+
+# Opt-in numbers on how the window's doing, for when a player says it's slow (main.py --profile). Nothing here runs
+# unless a Profiler is given to the MainWindow, which then has it
+#   - time the hot paths (MainWindow.profiled and ControlPanel.profiled) into a histogram each
+#   - count the Tcl calls made during each of them, by putting a counter in front of the Tcl interpreter
+#   - watch for the main loop stalling, and grab the Python stack when it does
+# All of which goes to a JSON file with export, or into a small overlay on the window (F12). Times are for the whole
+# call, including any other profiled calls made inside it, and so are Tcl call counts.
+
+BUCKETS = 25  # The last one, from 2 ** 23 µs (about 8 s), takes everything longer
+
+
+class Histogram:
+    # Call times in buckets that double in size: bucket i has the calls that took under 2 ** i µs but not under half
+    # that
+    buckets: List[int]
+    count: int = 0
+    total: float = 0  # s
+    longest: float = 0
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds: float):
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        # In ms. The top of the bucket it falls in, so it's an upper bound.
+        rank = fraction * self.count
+        seen = 0
+        for i, calls in enumerate(self.buckets):
+            seen += calls
+            if calls and seen >= rank:
+                return min(2 ** i / 1000, self.longest * 1000)
+        return self.longest * 1000
+
+    def report(self) -> dict:
+        return {"calls": self.count, "total_ms": self.total * 1000,
+                "mean_ms": self.total * 1000 / self.count if self.count else 0,
+                "p50_ms": self.percentile(.5), "p90_ms": self.percentile(.9), "p99_ms": self.percentile(.99),
+                "max_ms": self.longest * 1000, "buckets_us": {2 ** i: calls for i, calls in enumerate(self.buckets)
+                                                              if calls}}
+
+
+class TclCounter:
+    # Stands in for a Tk interpreter (what tkinter keeps in widget.tk), counting the calls that run Tcl. Widgets get
+    # their interpreter from their master when they're made, so this has to go in before any are.
+    calls: int = 0
+
+    def __init__(self, tk):
+        self._tk = tk
+
+    def call(self, *args):
+        self.calls += 1
+        return self._tk.call(*args)
+
+    def eval(self, script: str):
+        self.calls += 1
+        return self._tk.eval(script)
+
+    def __getattr__(self, name: str):
+        return getattr(self._tk, name)
+
+
+class Profiler:
+    path: str = None  # Where export writes to by default
+    frame: float = 1 / 60  # s. The main loop taking longer than this to get back to its events is a stall.
+    max_stalls: int = 100  # The latest ones are kept
+
+    started: float
+    histograms: Dict[str, Histogram]
+    tcl_calls: Dict[str, int]  # By what was running when they were made
+    tcl: TclCounter = None
+
+    stalls: Deque[dict]
+    stall_count: int = 0
+    stall: dict = None  # The one going on, if any
+    beat: float  # When the main loop last got round to the watchdog's timer
+    thread: int = None  # The main loop's
+    stopped: threading.Event
+
+    def __init__(self, path: str = None, frame: float = None):
+        if path is not None:
+            self.path = path
+        if frame is not None:
+            self.frame = frame
+        self.started = time.perf_counter()
+        self.histograms = {}
+        self.tcl_calls = {}
+        self.stalls = deque(maxlen=self.max_stalls)
+        self.stopped = threading.Event()
+
+    def count_tcl(self, widget):
+        self.tcl = widget.tk = TclCounter(widget.tk)
+
+    def instrument(self, obj, names: Iterable[str], prefix: str = ""):
+        # Swaps each of obj's methods for one that's timed. Only calls that look the method up after this are counted,
+        # so it wants doing before anything's bound to them.
+        for name in names:
+            setattr(obj, name, self.timed(prefix + name, getattr(obj, name)))
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        histogram = self.histograms.setdefault(name, Histogram())
+        self.tcl_calls.setdefault(name, 0)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            calls = self.tcl.calls if self.tcl is not None else 0
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.add(time.perf_counter() - start)
+                if self.tcl is not None:
+                    self.tcl_calls[name] += self.tcl.calls - calls
+        return wrapper
+
+    def watch(self, widget):
+        # Starts the watchdog on widget's main loop. It has to be called from that thread.
+        self.thread = threading.get_ident()
+        self.beat = time.perf_counter()
+        interval = max(1, int(self.frame * 1000))
+
+        def beat():
+            now = time.perf_counter()
+            if self.stall is not None:
+                self.stall["length_ms"] = (now - self.beat) * 1000
+                self.stall = None
+            self.beat = now
+            if not self.stopped.is_set():
+                widget.after(interval, beat)
+
+        widget.after(interval, beat)
+        threading.Thread(target=self.watchdog, daemon=True).start()
+
+    def watchdog(self):
+        while not self.stopped.wait(self.frame / 2):
+            beat = self.beat
+            waited = time.perf_counter() - beat
+            if waited < 2 * self.frame or self.stall is not None:
+                continue  # The timer's due every frame, so it's only stalled once it's a frame late
+            frame = sys._current_frames().get(self.thread)
+            self.stall = {"at_s": beat - self.started, "length_ms": waited * 1000,
+                          "stack": traceback.format_stack(frame) if frame is not None else []}
+            self.stalls.append(self.stall)
+            self.stall_count += 1
+
+    def stop(self):
+        self.stopped.set()
+
+    def report(self) -> dict:
+        return {"seconds": time.perf_counter() - self.started,
+                "frame_ms": self.frame * 1000,
+                "tcl_calls": self.tcl.calls if self.tcl is not None else None,
+                "calls": {name: dict(histogram.report(), tcl_calls=self.tcl_calls[name])
+                          for name, histogram in self.histograms.items() if histogram.count},
+                "stall_count": self.stall_count,
+                "stalls": list(self.stalls)}
+
+    def export(self, path: str = None):
+        with open(path if path is not None else self.path, "w") as file:
+            json.dump(self.report(), file, indent=1)
+
+    def summary(self, lines: int = 10) -> str:
+        # A few lines of the most important numbers, slowest paths first
+        worst = max((stall["length_ms"] for stall in list(self.stalls)), default=0)
+        text = ["stalls {} (worst {:.0f}ms)  tcl calls {}".format(
+            self.stall_count, worst, self.tcl.calls if self.tcl is not None else "-"),
+            "{:<24} {:>6} {:>7} {:>7} {:>7} {:>8}".format("", "calls", "p50 ms", "p99 ms", "max ms", "tcl/call")]
+        busiest = sorted((item for item in self.histograms.items() if item[1].count),
+                         key=lambda item: item[1].total, reverse=True)
+        for name, histogram in busiest[:lines]:
+            text.append("{:<24} {:>6} {:>7.2f} {:>7.2f} {:>7.1f} {:>8}".format(
+                name[-24:], histogram.count, histogram.percentile(.5), histogram.percentile(.99),
+                histogram.longest * 1000, self.tcl_calls[name] // histogram.count))
+        return "\n".join(text)
@@ -0,0 +1,325 @@
+import asyncio
+import struct
+import zlib
+from typing import Callable, Dict, List, Union
+
+from ops import FIELDS, INSERT, KINDS, Op
+
+
+# Messages between the server and its clients. Each one is a dict with a "type":
+#   hello     client -> server  {"client": int, "version": int} the first thing a client sends: its id and the version
+#                               of the history it has, or 0 and 0 if it's new
+#   snapshot  server -> client  {"client": int, "version": int, "acked": int, "ops": [Op, ...]} the client's id, the
+#                               history's version, the last of the client's changes the server got (see op) and the
+#                               inserts that build the whole history
+#   resume    server -> client  {"client": int, "acked": int} sent instead of a snapshot to a client coming back, after
+#                               the op messages it missed
+#   op        client -> server  {"op": Op, "seq": int} a change the client wants made, numbered by the client
+#             server -> client  {"op": Op, "client": int, "seq": int, "version": int} a change that was made, who asked
+#                               for it, the number they gave it and the version of the history it made (0 for an
+#                               answer to a change that didn't do anything, which only goes to the asker)
+#   error     server -> client  {"message": str, "seq": int} the number of a change that couldn't be made, and why
+#
+# On the wire, messages travel in frames:
+#   length   4 bytes, big endian, of everything after it
+#   version  1 byte
+#   flags    1 byte, COMPRESSED if the rest is zlib compressed
+#   payload  a varint count of messages, then the messages
+#
+# Numbers are unsigned LEB128 varints. A message is its type code followed by its fields. An op is its kind code, its
+# level byte, the card's id, a byte with one bit for each field that's present (in FIELDS order), then those fields.
+# Inserts add the parent's id (0 for none) and the position key: a varint count of digits, the first digit zigzag
+# encoded (it can be negative) and the rest as they are.
+#
+# Strings are interned per frame: the first time a string appears it's written out in full (varint 2 * length, then
+# UTF-8) and after that it's a varint 2 * index + 1 into the frame's strings so far. Cards tend to repeat a lot of text
+# ("New Event" and so on), and a snapshot or a burst of edits is where that adds up. Saved games (see storage) use the
+# same Encoder and Decoder for their ops.
+
+DEFAULT_PORT = 5115
+
+VERSION = 4
+COMPRESSED = 0x01
+
+COMPRESS_THRESHOLD = 512  # Payloads smaller than this aren't worth compressing
+MAX_FRAME = 1 << 26
+
+_header = struct.Struct(">IBB")
+
+SNAPSHOT = 1
+OP = 2
+ERROR = 3
+HELLO = 4
+RESUME = 5
+
+_type_codes = {"snapshot": SNAPSHOT, "op": OP, "error": ERROR, "hello": HELLO, "resume": RESUME}
+_kind_codes = {kind: code for code, kind in enumerate(KINDS)}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+class Encoder:
+    out: bytearray
+    strings: Dict[str, int]
+
+    def __init__(self):
+        self.out = bytearray()
+        self.strings = {}
+
+    def varint(self, value: int):
+        if value < 0:
+            raise ProtocolError("can't send negative number {}".format(value))
+        while value >= 0x80:
+            self.out.append(value & 0x7f | 0x80)
+            value >>= 7
+        self.out.append(value)
+
+    def string(self, value: str):
+        index = self.strings.get(value)
+        if index is not None:
+            self.varint(2 * index + 1)
+            return
+        self.strings[value] = len(self.strings)
+        data = value.encode()
+        self.varint(2 * len(data))
+        self.out += data
+
+    def op(self, op: Op):
+        names = FIELDS[op.level]
+        self.out.append(_kind_codes[op.kind])
+        self.out.append(op.level)
+        self.varint(op.card)
+
+        present = 0
+        for bit, name in enumerate(names):
+            if name in op.fields:
+                present |= 1 << bit
+        self.out.append(present)
+        for name in names:
+            if name in op.fields:
+                value = op.fields[name]
+                if name == "is_dark":
+                    self.out.append(1 if value else 0)
+                else:
+                    self.string(value)
+
+        if op.kind == INSERT:
+            self.varint(op.parent if op.parent is not None else 0)  # Ids are never 0
+            self.varint(len(op.key))
+            first = op.key[0]
+            self.varint(first << 1 if first >= 0 else (-first << 1) - 1)
+            for digit in op.key[1:]:
+                self.varint(digit)
+
+    def message(self, message: dict):
+        kind = message["type"]
+        self.out.append(_type_codes[kind])
+        if kind == "snapshot":
+            self.varint(message["client"])
+            self.varint(message["version"])
+            self.varint(message["acked"])
+            self.varint(len(message["ops"]))
+            for op in message["ops"]:
+                self.op(op)
+        elif kind == "op":
+            self.op(message["op"])
+            self.varint(message.get("client", 0))  # Ids start at 1, so 0 is from nobody in particular
+            self.varint(message.get("seq", 0))
+            self.varint(message.get("version", 0))
+        elif kind == "hello":
+            self.varint(message["client"])
+            self.varint(message["version"])
+        elif kind == "resume":
+            self.varint(message["client"])
+            self.varint(message["acked"])
+        else:
+            self.string(message["message"])
+            self.varint(message.get("seq", 0))
+
+
+class Decoder:
+    data: bytes
+    position: int = 0
+    strings: List[str]
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.strings = []
+
+    def byte(self) -> int:
+        if self.position >= len(self.data):
+            raise ProtocolError("frame ends too soon")
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def varint(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+            if shift > 63:
+                raise ProtocolError("number too long")
+
+    def string(self) -> str:
+        tag = self.varint()
+        if tag & 1:
+            try:
+                return self.strings[tag >> 1]
+            except IndexError:
+                raise ProtocolError("unknown string {}".format(tag >> 1))
+
+        end = self.position + (tag >> 1)
+        if end > len(self.data):
+            raise ProtocolError("frame ends too soon")
+        try:
+            value = self.data[self.position:end].decode()
+        except UnicodeDecodeError as e:
+            raise ProtocolError(str(e))
+        self.position = end
+        self.strings.append(value)
+        return value
+
+    def op(self) -> Op:
+        code = self.byte()
+        if code >= len(KINDS):
+            raise ProtocolError("unknown operation {}".format(code))
+        level = self.byte()
+        if level not in FIELDS:
+            raise ProtocolError("bad level {}".format(level))
+        card = self.varint()
+
+        present = self.byte()
+        fields = {}
+        for bit, name in enumerate(FIELDS[level]):
+            if present & 1 << bit:
+                if name == "is_dark":
+                    fields[name] = self.byte() != 0
+                else:
+                    fields[name] = self.string()
+        if KINDS[code] != INSERT:
+            return Op(KINDS[code], level, card, fields)
+
+        parent = self.varint() or None
+        length = self.varint()
+        if not 0 < length <= len(self.data) - self.position:
+            raise ProtocolError("bad position length {}".format(length))
+        first = self.varint()
+        key = [first >> 1 if not first & 1 else -((first + 1) >> 1)]
+        key += [self.varint() for _ in range(length - 1)]
+        return Op(INSERT, level, card, fields, parent, key)
+
+    def message(self) -> dict:
+        code = self.byte()
+        if code == SNAPSHOT:
+            message = {"type": "snapshot", "client": self.varint(), "version": self.varint(), "acked": self.varint()}
+            message["ops"] = [self.op() for _ in range(self.varint())]
+            return message
+        if code == OP:
+            message = {"type": "op", "op": self.op()}
+            client = self.varint()
+            if client:
+                message["client"] = client
+            message["seq"] = self.varint()
+            message["version"] = self.varint()
+            return message
+        if code == HELLO:
+            return {"type": "hello", "client": self.varint(), "version": self.varint()}
+        if code == RESUME:
+            return {"type": "resume", "client": self.varint(), "acked": self.varint()}
+        if code == ERROR:
+            return {"type": "error", "message": self.string(), "seq": self.varint()}
+        raise ProtocolError("unknown message type {}".format(code))
+
+
+def encode(messages: List[dict]) -> bytes:
+    # One whole frame, length and all
+    encoder = Encoder()
+    encoder.varint(len(messages))
+    for message in messages:
+        encoder.message(message)
+
+    payload = bytes(encoder.out)
+    flags = 0
+    if len(payload) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags |= COMPRESSED
+    return _header.pack(len(payload) + 2, VERSION, flags) + payload
+
+
+def decode(body: bytes) -> List[dict]:
+    # A frame without its length
+    if len(body) < 2:
+        raise ProtocolError("frame too short")
+    version, flags = body[0], body[1]
+    if version != VERSION:
+        raise ProtocolError("unsupported protocol version {}".format(version))
+
+    payload = body[2:]
+    if flags & COMPRESSED:
+        # No bigger than a frame can be, so a small frame can't make us inflate it into gigabytes
+        decompressor = zlib.decompressobj()
+        try:
+            payload = decompressor.decompress(payload, MAX_FRAME)
+        except zlib.error as e:
+            raise ProtocolError(str(e))
+        if decompressor.unconsumed_tail:
+            raise ProtocolError("frame too long once decompressed")
+        if not decompressor.eof:
+            raise ProtocolError("compressed frame ends too soon")
+        if decompressor.unused_data:
+            raise ProtocolError("junk at the end of the frame")
+
+    decoder = Decoder(payload)
+    messages = [decoder.message() for _ in range(decoder.varint())]
+    if decoder.position != len(payload):
+        raise ProtocolError("junk at the end of the frame")
+    return messages
+
+
+async def read_messages(reader: asyncio.StreamReader) -> Union[List[dict], None]:
+    # The next frame's worth of messages, or None once the other end has gone
+    try:
+        length = int.from_bytes(await reader.readexactly(4), "big")
+        if length > MAX_FRAME:
+            raise ProtocolError("frame too long")
+        return decode(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def write_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(encode([message]))
+
+
+class Outbox:
+    # Messages queued up while the event loop is busy go out together as one frame on its next pass, so a burst of
+    # changes costs one frame (and one compression) instead of one each
+    send: Callable[[bytes], None]
+    messages: List[dict]
+    scheduled: bool = False
+
+    def __init__(self, send: Callable[[bytes], None]):
+        self.send = send
+        self.messages = []
+
+    def add(self, message: dict):
+        self.messages.append(message)
+        if not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.scheduled = False
+        if self.messages:
+            messages = self.messages
+            self.messages = []
+            self.send(encode(messages))
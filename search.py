@@ -0,0 +1,117 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, List
+
+from model import Event, Period, Scene
+
+
+# Full-text search over the cards. It's an inverted index: for each word, the cards it's in and how many times. A
+# History keeps it up to date as cards are inserted, edited, deleted and read in (see History.index), so it's never
+# built from scratch and a search only has to look at the words it's for.
+#
+# A hit has every word in the search, except that the last one only has to start a word, since it's probably still
+# being typed. Hits are ranked by tf-idf: the more often a card uses the words the better, and words that are rare
+# across the game count for more than ones every card has.
+
+FIELDS = {Period: ("text",), Event: ("text",), Scene: ("question", "setting", "answer")}
+
+PREFIX_WEIGHT = .5  # For words that only start with the last word searched for, against ones that match it exactly
+
+_word = re.compile(r"\w+")
+
+
+def words(text: str) -> List[str]:
+    return _word.findall(text.lower())
+
+
+class SearchIndex:
+    postings: Dict[str, Dict[int, int]]  # Word -> {card id: times the card has it}
+    cards: Dict[int, Dict[str, int]]  # Card id -> its words and how many times, so it can be taken out again without
+    # going by its text
+    vocabulary: List[str]  # The words in postings, sorted, for finding the ones that start with something
+
+    def __init__(self):
+        self.postings = {}
+        self.cards = {}
+        self.vocabulary = []
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def add(self, card):
+        # Also for a card that's been edited, in which case only the words it has a different number of now are touched
+        found = Counter()
+        for name in FIELDS[type(card)]:
+            found.update(words(getattr(card, name)))
+        had = self.cards.get(card.id)
+        if had == found:
+            return
+        self.cards[card.id] = found
+        had = had or {}
+        for word in had.keys() - found.keys():
+            self.drop(word, card.id)
+        for word, times in found.items():
+            if had.get(word) == times:
+                continue
+            counts = self.postings.get(word)
+            if counts is None:
+                counts = self.postings[word] = {}
+                insort(self.vocabulary, word)
+            counts[card.id] = times
+
+    def remove(self, card):
+        for word in self.cards.pop(card.id, ()):
+            self.drop(word, card.id)
+
+    def drop(self, word: str, card: int):
+        counts = self.postings[word]
+        del counts[card]
+        if not counts:
+            del self.postings[word]
+            del self.vocabulary[bisect_left(self.vocabulary, word)]
+
+    def starting_with(self, prefix: str) -> List[str]:
+        matches = []
+        for i in range(bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            if not self.vocabulary[i].startswith(prefix):
+                break
+            matches.append(self.vocabulary[i])
+        return matches
+
+    def score(self, word: str, scores: Dict[int, float], weight: float = 1):
+        # Adds word's share to each card's score in scores
+        counts = self.postings.get(word)
+        if not counts:
+            return
+        idf = weight * math.log(1 + len(self.cards) / len(counts))
+        get = scores.get
+        for id, count in counts.items():
+            scores[id] = get(id, 0) + count * idf
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        # The ids of the best limit cards for query, best first
+        terms = words(query)
+        if not terms:
+            return []
+
+        found = None
+        for i, term in enumerate(terms):
+            scores = {}
+            if i < len(terms) - 1:
+                self.score(term, scores)
+            else:
+                for word in self.starting_with(term):
+                    self.score(word, scores, 1 if word == term else PREFIX_WEIGHT)
+            if found is None:
+                found = scores
+            else:
+                # Going through the smaller of the two
+                if len(scores) < len(found):
+                    found, scores = scores, found
+                found = {id: score + scores[id] for id, score in found.items() if id in scores}
+            if not found:
+                return []
+        return [id for id, _ in heapq.nlargest(limit, found.items(), key=lambda hit: hit[1])]
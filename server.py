@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+from itertools import chain, count
+from typing import Dict, List
+
+import ops
+import protocol
+from model import History
+from ops import OpError
+import storage
+from storage import Autosave
+
+
+# Runs a game without a window. The server's History is the real one: clients ask for changes, the server applies the
+# ones that make sense and tells everyone (the asker included) what changed. Joining gets you the whole history once,
+# and from then on only the individual changes.
+#
+# Every change a client asks for gets exactly one answer back to that client, in the order it asked: the change as it
+# was made, or an error. Clients that have already applied their own changes rely on that to know which ones stuck.
+#
+# Each change that's made bumps the history's version, and the last log_size or so of them are kept. A client that
+# drops and comes back says which version it has and gets just the changes since then, or a snapshot if they're not
+# all in the log any more. It keeps its id, and it's told the last of its own changes the server got (acked) so it
+# knows which ones to send again. Changes sent twice are ignored the second time.
+
+
+class GameServer:
+    history: History
+    clients: Dict[int, asyncio.StreamWriter]
+    outbox: protocol.Outbox = None  # Changes on their way to everyone
+
+    # A client that's let this much pile up unsent is too far behind to catch up, so it gets dropped
+    max_backlog: int = 1 << 22
+
+    version: int = 0
+    log: List[dict]  # The op messages that made versions log_start to version
+    log_start: int = 1
+    log_size: int = 10000
+    acked: Dict[int, int]  # The last seq each client's had answered, for every client there's been
+
+    game: Autosave = None  # Where changes get saved, if anywhere
+
+    def __init__(self, history: History = None):
+        self.history = history if history is not None else History()
+        self.clients = {}
+        self.log = []
+        self.acked = {}
+        # Client ids double as the site part of the card ids they make up (see History.new_id), so they have to be
+        # new to the history too
+        ids = chain(self.history.cards, [self.history.highest_unloaded])
+        self.client_ids = count(max(card >> 32 for card in ids) + 1)
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.outbox is None:
+            self.outbox = protocol.Outbox(self.write_all)
+
+        client = None
+        try:
+            messages = await protocol.read_messages(reader)
+            if not messages or messages[0]["type"] != "hello":
+                raise protocol.ProtocolError("expected a hello")
+            client = self.join(writer, messages[0])
+            for message in messages[1:]:
+                self.receive(client, message)
+
+            await writer.drain()
+            while True:
+                messages = await protocol.read_messages(reader)
+                if messages is None:
+                    break
+                for message in messages:
+                    self.receive(client, message)
+        except (ConnectionError, protocol.ProtocolError):
+            pass
+        finally:
+            if client is not None:
+                self.disconnect(client, writer)
+            else:
+                writer.close()
+
+    def join(self, writer: asyncio.StreamWriter, hello: dict) -> int:
+        # Anything still waiting to go out is already in the history (and the log), so it has to go before this
+        # client's catch up does or the client would get it twice
+        self.outbox.flush()
+
+        client = hello["client"]
+        since = hello["version"]
+        if client in self.acked:
+            old = self.clients.get(client)
+            if old is not None:
+                # The same client on a new connection, so the old one's dead and just hasn't noticed yet
+                self.disconnect(client, old)
+        else:
+            client = next(self.client_ids)
+            self.acked[client] = 0
+            since = None
+
+        if since is not None and self.log_start <= since + 1 and since <= self.version:
+            reply = self.log[since + 1 - self.log_start:]
+            reply.append({"type": "resume", "client": client, "acked": self.acked[client]})
+        else:
+            reply = [{"type": "snapshot", "client": client, "version": self.version, "acked": self.acked[client],
+                      "ops": ops.snapshot(self.history)}]
+        writer.write(protocol.encode(reply))
+        self.clients[client] = writer
+        return client
+
+    def receive(self, client: int, message: dict):
+        if message["type"] != "op":
+            raise protocol.ProtocolError("clients can't send {!r}".format(message["type"]))
+
+        op = message["op"]
+        seq = message.get("seq", 0)
+        if seq:
+            if seq <= self.acked[client]:
+                return  # Sent again after a reconnect, but it got here the first time
+            if seq != self.acked[client] + 1:
+                # Changes in between went missing. Acking this one would have the client think they'd been answered,
+                # so drop the connection instead: on coming back it's told what got here and sends the rest again.
+                raise protocol.ProtocolError("change {} came after {}".format(seq, self.acked[client]))
+            self.acked[client] = seq
+        try:
+            undo = ops.apply(self.history, op)
+        except OpError as e:
+            self.send(client, {"type": "error", "message": str(e), "seq": seq})
+            return
+
+        op = ops.trimmed(op, undo)  # Only pass on the fields that actually changed
+        if not undo:
+            # Nothing changed, so nobody else needs to hear about it, but the asker still gets its answer
+            self.send(client, {"type": "op", "op": op, "client": client, "seq": seq, "version": 0})
+            return
+
+        if self.game is not None:
+            self.game.record(op)
+        self.version += 1
+        message = {"type": "op", "op": op, "client": client, "seq": seq, "version": self.version}
+        self.log.append(message)
+        if len(self.log) > 2 * self.log_size:
+            # Trimmed in big bites so it's not a copy every time
+            drop = len(self.log) - self.log_size
+            del self.log[:drop]
+            self.log_start += drop
+        self.broadcast(message)
+
+    def send(self, client: int, message: dict):
+        writer = self.clients.get(client)
+        if writer is None:
+            return
+        # Whatever's already been broadcast happened first, so it has to arrive first
+        self.outbox.flush()
+        if writer.transport.get_write_buffer_size() > self.max_backlog:
+            self.disconnect(client, writer)
+            return
+        protocol.write_message(writer, message)
+
+    def broadcast(self, message: dict):
+        self.outbox.add(message)
+
+    def write_all(self, data: bytes):
+        # Encoded once for everybody rather than once per client
+        for client, writer in list(self.clients.items()):
+            if writer.transport.get_write_buffer_size() > self.max_backlog:
+                self.disconnect(client, writer)
+            else:
+                writer.write(data)
+
+    def disconnect(self, client: int, writer: asyncio.StreamWriter):
+        # Only if writer's still the client's connection; it might have come back on another one since
+        if self.clients.get(client) is writer:
+            del self.clients[client]
+        writer.close()
+
+
+async def serve(host: str, port: int, path: str = None):
+    # Hosts the game saved at path (a new one if there's nothing there yet), or a game that isn't saved
+    history = History()
+    game = None
+    if path is not None:
+        game = storage.open_game(path)
+        game.load(history)
+    game_server = GameServer(history)
+    game_server.game = game
+    server = await game_server.start(host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if game is not None:
+            game.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host a game of Microscope")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=protocol.DEFAULT_PORT)
+    parser.add_argument("game", nargs="?", help="file to save the game to, and load it from if it's already there")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.game))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
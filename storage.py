@@ -0,0 +1,830 @@
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import partial
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+import ops
+from model import Event, History, Period, Scene
+from ops import Op
+from positions import Key
+from protocol import Decoder, Encoder, ProtocolError
+
+
+# Saved games. Rewriting the whole history on every change would get slower the longer a campaign runs, so a game is
+# saved as a snapshot of the history at some point plus journals of the changes made since then. Changes are appended
+# to the current journal as they're made, which costs the same however big the game is. Once the journal has
+# grown as big as the snapshot, a new journal is started and a thread folds the old ones into a new snapshot from the
+# files on disk, so the window never waits for it.
+#
+# The files for a game saved at path are:
+#   path                       the snapshot
+#   path.<generation>.journal  journals, numbered in the order they were started
+#   path.<generation>.snapshot a newer snapshot from a compaction, until the game's next opened and it's moved to path
+#
+# A snapshot with generation g has everything from the journals before g in it, so loading reads the newest snapshot
+# and then replays the journals from g on. A snapshot is written to a temporary file and renamed into place, and old
+# journals and snapshots are only deleted after that, so a crash at any point leaves a snapshot and journals that load.
+# Compaction never renames over the snapshot the open game has mapped, which Windows wouldn't allow.
+#
+# Both kinds of file start with MAGIC, a byte for the kind and a FORMAT byte. Numbers and ops are encoded like they are
+# on the wire (see protocol).
+#
+# A journal is then a run of records, each a 4 byte big endian length, a 4 byte CRC-32 of the payload and the payload,
+# which is one op. A crash in the middle of writing one leaves a record that's short or doesn't match its CRC; loading
+# stops there and the journal is cut back to before it.
+#
+# A snapshot is a tree of blocks, each a flags byte (COMPRESSED if the rest is zlib compressed) and a payload. After
+# the header come the offset (8 bytes) and length (4 bytes) of the root block and then of the index block. The root
+# block has the generation, the last id given out (see History.new_id), a count of periods and then, for each one, its
+# insert op, the offset and length of the block with its events (both 0 if it hasn't got any) and how many there are.
+# An events block is a count of events followed by the same again for each event and its scenes, and a scenes block is
+# a count of scenes followed by their inserts.
+#
+# Keeping each period's events and each event's scenes in blocks of their own means a big game can be opened without
+# reading most of it. Only the root block is read up front; the rest is read as the history needs it (see
+# History.defer), through an mmap of the file that's kept open as long as the game is. The index block is so that
+# changes to cards that haven't been read in yet can still find them (see History.locate): it's never compressed, and
+# it has an 8 byte id and 8 byte parent id for every event and scene, sorted by id, so a card can be looked up with a
+# binary search in the mmap without the index being read in.
+
+MAGIC = b"MSCOPE"
+FORMAT = 3
+SNAPSHOT = b"S"
+JOURNAL = b"J"
+
+COMPRESSED = 0x01
+COMPRESS_THRESHOLD = 512
+
+_header = struct.Struct(">6scB")
+_pointers = struct.Struct(">QIQI")
+_record = struct.Struct(">II")
+_entry = struct.Struct(">QQ")  # In the index
+
+
+# GameFile.status
+SAVED = "saved"
+UNSAVED = "unsaved"  # Changes are waiting to be written
+SAVING = "saving"
+FAILED = "failed"  # The last write didn't work, see GameFile.error. It'll be tried again.
+
+
+class StorageError(ValueError):
+    pass
+
+
+def journal_path(path: str, generation: int) -> str:
+    return "{}.{}.journal".format(path, generation)
+
+
+def snapshot_path(path: str, generation: int) -> str:
+    return "{}.{}.snapshot".format(path, generation)
+
+
+def _generations(path: str, suffix: str) -> List[int]:
+    directory, name = os.path.split(os.path.abspath(path))
+    generations = []
+    for entry in os.listdir(directory):
+        if entry.startswith(name + ".") and entry.endswith(suffix):
+            generation = entry[len(name) + 1:-len(suffix)]
+            if generation.isdigit():
+                generations.append(int(generation))
+    return sorted(generations)
+
+
+def journals(path: str) -> List[int]:
+    # The generations of the journals there are for the game at path, in order
+    return _generations(path, ".journal")
+
+
+def snapshots(path: str) -> List[int]:
+    # The generations of the compacted snapshots for the game at path that haven't been moved to path yet, in order
+    return _generations(path, ".snapshot")
+
+
+def latest_snapshot(path: str) -> str:
+    # Where the game at path's newest snapshot is
+    found = snapshots(path)
+    return snapshot_path(path, found[-1]) if found else path
+
+
+def promote_snapshot(path: str):
+    # Moves the newest compacted snapshot to path, where the game's opened from, if there's one that's newer. Nothing
+    # can have path open while it does, which on Windows means before the game's opened.
+    found = snapshots(path)
+    if not found:
+        return
+    os.replace(snapshot_path(path, found[-1]), path)
+    _sync_directory(path)
+    for generation in found[:-1]:
+        try:
+            os.remove(snapshot_path(path, generation))
+        except OSError:
+            pass
+
+
+def _check_header(data, kind: bytes, path: str):
+    if len(data) < _header.size:
+        raise StorageError("{} is too short to be a saved game".format(path))
+    magic, found, version = _header.unpack_from(data)
+    if magic != MAGIC or found != kind:
+        raise StorageError("{} isn't a saved game {}".format(path, "snapshot" if kind == SNAPSHOT else "journal"))
+    if version != FORMAT:
+        raise StorageError("{} is in an unsupported format ({})".format(path, version))
+
+
+def _write_block(file: BinaryIO, encoder: Encoder) -> Tuple[int, int]:
+    payload = bytes(encoder.out)
+    flags = 0
+    if len(payload) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags |= COMPRESSED
+    offset = file.tell()
+    file.write(bytes([flags]))
+    file.write(payload)
+    return offset, len(payload) + 1
+
+
+def _sync_directory(path: str):
+    # So a rename survives a crash. Not every system can open a directory for this, and there it just doesn't happen.
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_snapshot(path: str, history: History, generation: int):
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        file.write(_header.pack(MAGIC, SNAPSHOT, FORMAT))
+        file.write(_pointers.pack(0, 0, 0, 0))  # Filled in at the end, since the root and the index go last
+
+        root = Encoder()
+        root.varint(generation)
+        root.varint(history.last_id)
+        root.varint(len(history.periods))
+        index = []
+        for period in history.periods:
+            events = Encoder()
+            events.varint(len(period.events))
+            for event in period.events:
+                scenes = (0, 0)
+                index.append((event.id, period.id))
+                if len(event.scenes):
+                    block = Encoder()
+                    block.varint(len(event.scenes))
+                    for scene in event.scenes:
+                        block.op(ops.insert_of(scene))
+                        index.append((scene.id, event.id))
+                    scenes = _write_block(file, block)
+                events.op(ops.insert_of(event))
+                events.varint(scenes[0])
+                events.varint(scenes[1])
+                events.varint(len(event.scenes))
+            block = _write_block(file, events) if len(period.events) else (0, 0)
+            root.op(ops.insert_of(period))
+            root.varint(block[0])
+            root.varint(block[1])
+            root.varint(len(period.events))
+
+        # The index isn't compressed, so it can be searched where it is
+        index.sort()
+        pointers = _write_block(file, root) + (file.tell(), 1 + _entry.size * len(index))
+        file.write(b"\0")
+        file.write(b"".join(_entry.pack(*entry) for entry in index))
+        file.seek(_header.size)
+        file.write(_pointers.pack(*pointers))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+    _sync_directory(path)
+
+
+class Snapshot:
+    # A snapshot file, open for reading as its history needs it
+    path: str
+    file: BinaryIO
+    data: mmap.mmap
+
+    generation: int = 0
+    last_id: int = 0
+    index_start: int = 0  # Where the index's entries start in the file
+    index_count: int = 0
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            if os.fstat(self.file.fileno()).st_size == 0:
+                raise StorageError("{} is empty".format(path))
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.file.close()
+            raise
+
+    def load(self, history: History, insert_period: Callable[[int, Period], None] = None):
+        # Puts the periods into history (through insert_period, if it's given) and leaves the rest to be read in later
+        insert_period = insert_period if insert_period is not None else history.insert_period
+        _check_header(self.data, SNAPSHOT, self.path)
+        try:
+            root_offset, root_length, index_offset, index_length = _pointers.unpack_from(self.data, _header.size)
+
+            if index_length < 1 or index_offset + index_length > len(self.data) or self.data[index_offset] or \
+                    (index_length - 1) % _entry.size:
+                raise StorageError("{}: bad index".format(self.path))
+            self.index_start = index_offset + 1
+            self.index_count = (index_length - 1) // _entry.size
+            periods = []
+            root = self.block(root_offset, root_length)
+            self.generation = root.varint()
+            self.last_id = root.varint()
+            for _ in range(root.varint()):
+                period = ops.new_card(root.op())
+                offset, length, count = root.varint(), root.varint(), root.varint()
+                if count:
+                    history.defer(period, count, partial(self.events, history, offset, length))
+                periods.append(period)
+        except (ProtocolError, struct.error) as e:
+            raise StorageError("{}: {}".format(self.path, e))
+
+        history.locate = self.locate
+        if self.index_count:
+            history.highest_unloaded = _entry.unpack_from(self.data, self.index_start + (self.index_count - 1) *
+                                                          _entry.size)[0]
+
+        for i, period in enumerate(periods):
+            insert_period(i, period)
+
+    def locate(self, id: int) -> Optional[int]:
+        # See History.locate
+        low, high = 0, self.index_count
+        while low < high:
+            middle = (low + high) // 2
+            found, parent = _entry.unpack_from(self.data, self.index_start + middle * _entry.size)
+            if found < id:
+                low = middle + 1
+            elif found > id:
+                high = middle
+            else:
+                return parent
+        return None
+
+    def block(self, offset: int, length: int) -> Decoder:
+        if length < 1 or offset + length > len(self.data):
+            raise StorageError("{}: block at {} runs past the end of the file".format(self.path, offset))
+        payload = self.data[offset + 1:offset + length]
+        if self.data[offset] & COMPRESSED:
+            try:
+                payload = zlib.decompress(payload)
+            except zlib.error as e:
+                raise StorageError("{}: {}".format(self.path, e))
+        return Decoder(payload)
+
+    def events(self, history: History, offset: int, length: int) -> List[Event]:
+        block = self.block(offset, length)
+        events = []
+        try:
+            for _ in range(block.varint()):
+                event = ops.new_card(block.op())
+                offset, length, count = block.varint(), block.varint(), block.varint()
+                if count:
+                    history.defer(event, count, partial(self.scenes, offset, length))
+                events.append(event)
+        except ProtocolError as e:
+            raise StorageError("{}: {}".format(self.path, e))
+        return events
+
+    def scenes(self, offset: int, length: int) -> List[Scene]:
+        block = self.block(offset, length)
+        try:
+            return [ops.new_card(block.op()) for _ in range(block.varint())]
+        except ProtocolError as e:
+            raise StorageError("{}: {}".format(self.path, e))
+
+    def close(self):
+        # Anything that hasn't been read in by now can't be
+        self.data.close()
+        self.file.close()
+
+
+def journal_record(op: Op) -> bytes:
+    encoder = Encoder()
+    encoder.op(op)
+    payload = bytes(encoder.out)
+    return _record.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_journal(path: str) -> Tuple[List[Op], int]:
+    # The ops in the journal at path, and how much of the file they take up. Anything after that is a record that was
+    # only partly written.
+    with open(path, "rb") as file:
+        data = file.read()
+    _check_header(data, JOURNAL, path)
+
+    changes = []
+    position = _header.size
+    while position + _record.size <= len(data):
+        length, crc = _record.unpack_from(data, position)
+        start = position + _record.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        decoder = Decoder(payload)
+        try:
+            op = decoder.op()
+        except ProtocolError:
+            break
+        changes.append(op)
+        position = start + length
+    return changes, position
+
+
+def compact(path: str, generation: int, last_id: int):
+    # Folds the newest snapshot and the journals before generation into a new snapshot. That gets a name of its own
+    # (snapshot_path) rather than replacing the one at path, which the game that's open has mapped and which Windows
+    # won't let go of until it's closed. It's moved to path the next time the game's opened (see promote_snapshot).
+    history = History()
+    start = 0
+    latest = latest_snapshot(path)
+    if os.path.exists(latest):
+        snapshot = Snapshot(latest)
+        snapshot.load(history)
+        start = snapshot.generation
+    else:
+        snapshot = None
+    try:
+        for journal in journals(path):
+            if start <= journal < generation:
+                for op in read_journal(journal_path(path, journal))[0]:
+                    try:
+                        ops.apply(history, op)
+                    except ops.OpError:
+                        pass  # Skipped by loading too
+        history.last_id = last_id
+        write_snapshot(snapshot_path(path, generation), history, generation)
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+
+    for journal in journals(path):
+        if journal < generation:
+            try:
+                os.remove(journal_path(path, journal))
+            except OSError:
+                pass  # Loading skips it anyway, and the next compaction will try again
+    for older in snapshots(path):
+        if older < generation:
+            try:
+                os.remove(snapshot_path(path, older))
+            except OSError:
+                pass
+
+
+class Autosave(ABC):
+    # Saves the changes recorded with it on a writer thread of its own, so recording a change doesn't touch the disk and
+    # can't hold up whoever made it (an Op isn't changed once it's been made, so the thread can have it as it is).
+    # Once changes stop coming for debounce seconds they're written, in one go, and if they keep coming they're written
+    # every interval seconds anyway. Changes recorded inside an action() all go in the same write.
+    #
+    # Subclasses load the game, say where the changes go with write and call start once they're ready for them.
+    debounce: float = .5  # s
+    interval: float = 5
+    writer: threading.Thread = None
+    condition: threading.Condition
+    pending: List[Op]  # Recorded but not written yet
+    first_change: float = 0  # When the oldest of the pending changes was recorded, by time.monotonic()
+    last_change: float = 0
+    actions: int = 0  # How many action()s are open
+    closing: bool = False
+
+    status: str = SAVED
+    error: Exception = None  # Why the last write failed, if it did
+
+    def __init__(self, debounce: float = None, interval: float = None):
+        if debounce is not None:
+            self.debounce = debounce
+        if interval is not None:
+            self.interval = interval
+        self.condition = threading.Condition()
+        self.pending = []
+
+    def start(self):
+        self.writer = threading.Thread(target=self.write_changes, daemon=True)
+        self.writer.start()
+
+    def record(self, op: Op):
+        # Saves a change that's been made to the history, soon
+        with self.condition:
+            now = time.monotonic()
+            if not self.pending:
+                self.first_change = now
+            self.last_change = now
+            self.pending.append(op)
+            if self.status != FAILED:
+                self.status = UNSAVED
+            self.condition.notify()
+
+    @contextmanager
+    def action(self):
+        with self.condition:
+            self.actions += 1
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.actions -= 1
+                self.condition.notify()
+
+    def write_changes(self):
+        # The writer thread
+        while True:
+            with self.condition:
+                while not self.closing:
+                    timeout = None
+                    if self.pending and not self.actions:
+                        due = min(self.last_change + self.debounce, self.first_change + self.interval)
+                        timeout = due - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    self.condition.wait(timeout)
+                changes = self.pending
+                self.pending = []
+                closing = self.closing
+                if changes:
+                    self.status = SAVING
+
+            if changes:
+                try:
+                    self.write(changes)
+                except Exception as e:
+                    # Not just disk errors: anything this thread doesn't catch would kill it, and then nothing would get
+                    # saved again without so much as a FAILED
+                    with self.condition:
+                        self.pending[:0] = changes
+                        self.status = FAILED
+                        self.error = e
+                        if not self.closing:
+                            self.condition.wait(self.interval)  # Before trying again
+                else:
+                    with self.condition:
+                        self.status = UNSAVED if self.pending else SAVED
+            if closing:
+                return
+
+    @abstractmethod
+    def write(self, changes: List[Op]):
+        # On the writer thread. Should leave things as they were if it raises.
+        pass
+
+    def close(self):
+        # Saves anything that's still pending first
+        if self.writer is None:
+            return
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.writer.join()
+        self.writer = None
+
+
+class GameFile(Autosave):
+    # A game saved at path, open for changes. Load it into a history, then record every change made to that history.
+    # The writer thread appends changes to the journal and fsyncs it, and starts compactions.
+    path: str
+    history: History = None
+
+    snapshot: Snapshot = None  # The one the history was loaded from, which it reads the rest of itself from as it goes
+    generation: int = 0  # Of the journal being written
+    journal: BinaryIO = None
+    journal_size: int = 0
+    snapshot_size: int = 0
+
+    compact_size: int = 1 << 16  # The journal's allowed to grow to this even while the snapshot's smaller
+    compactor: threading.Thread = None
+    compact_error: Exception = None  # Why the last compaction failed, if it did
+
+    def __init__(self, path: str, debounce: float = None, interval: float = None):
+        super().__init__(debounce, interval)
+        self.path = path
+
+    def load(self, history: History, apply: Callable[[Op], object] = None,
+             insert_period: Callable[[int, Period], None] = None):
+        # Opens the saved game in history. Only the periods are put in straight away, through insert_period, and then
+        # the changes in the journals are made through apply (by default, history.insert_period and ops.apply).
+        self.history = history
+        apply = apply if apply is not None else lambda op: ops.apply(history, op)
+
+        start = 0
+        try:
+            promote_snapshot(self.path)
+            latest = self.path
+        except OSError:
+            latest = latest_snapshot(self.path)  # Something else has the one at path open, so this time it's not moved
+        if os.path.exists(latest):
+            self.snapshot = Snapshot(latest)
+            self.snapshot.load(history, insert_period)
+            start = self.snapshot.generation
+            history.last_id = self.snapshot.last_id
+            self.snapshot_size = os.path.getsize(latest)
+
+        self.generation = start
+        size = 0
+        for journal in journals(self.path):
+            if journal < start:
+                continue
+            changes, size = read_journal(journal_path(self.path, journal))
+            for op in changes:
+                try:
+                    apply(op)
+                except ops.OpError:
+                    continue  # Saved by a version that didn't check for it, and it'd break things to make it now
+                if op.kind == ops.INSERT and op.card >> 32 == history.site:
+                    # Made after the snapshot was, so last_id doesn't cover it
+                    history.last_id = max(history.last_id, op.card & 0xffffffff)
+            self.generation = journal
+
+        # Only the last journal can have a record that was cut off, and that's where writing picks up
+        journal = journal_path(self.path, self.generation)
+        if size:
+            self.journal = open(journal, "r+b")
+            self.journal.truncate(size)
+            self.journal.seek(size)
+            self.journal_size = size
+        else:
+            self.start_journal()
+        self.maybe_compact()
+        self.start()
+
+    def start_journal(self):
+        self.journal = open(journal_path(self.path, self.generation), "wb")
+        self.journal.write(_header.pack(MAGIC, JOURNAL, FORMAT))
+        self.journal.flush()
+        self.journal_size = _header.size
+
+    def write(self, changes: List[Op]):
+        data = b"".join(journal_record(op) for op in changes)
+        try:
+            self.journal.write(data)
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+        except OSError:
+            # Cut off whatever did get written, so the next try doesn't leave a broken record in the middle of the
+            # journal
+            try:
+                self.journal.truncate(self.journal_size)
+                self.journal.seek(self.journal_size)
+            except OSError:
+                pass
+            raise
+        self.journal_size += len(data)
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        if self.journal_size <= max(self.compact_size, self.snapshot_size):
+            return
+        if self.compactor is not None and self.compactor.is_alive():
+            return  # The journal can grow a bit more while the last one finishes
+
+        # Changes from now on go to a new journal, which the compactor doesn't touch
+        self.journal.close()
+        self.generation += 1
+        self.start_journal()
+        self.compactor = threading.Thread(target=self.compact, args=(self.generation, self.history.last_id),
+                                          daemon=True)
+        self.compactor.start()
+
+    def compact(self, generation: int, last_id: int):
+        try:
+            compact(self.path, generation, last_id)
+            self.snapshot_size = os.path.getsize(snapshot_path(self.path, generation))
+        except (OSError, StorageError) as e:
+            # Don't try again until the journal's twice the size
+            self.compact_error = e
+            self.compact_size = 2 * self.journal_size
+
+    def close(self):
+        super().close()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.compactor is not None:
+            self.compactor.join()
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+
+# SQLite has no tuple type, so position keys are stored as blobs that sort the same way: 8 bytes per digit, big endian,
+# with the first digit's sign bit flipped so negative ones come first. Blobs compare byte by byte and a shorter one
+# comes first when they match as far as it goes, just like the tuples.
+_digit = struct.Struct(">Q")
+
+
+def key_blob(key: Key) -> bytes:
+    return _digit.pack((key[0] + (1 << 63)) & 0xffffffffffffffff) + b"".join(_digit.pack(digit) for digit in key[1:])
+
+
+def blob_key(blob: bytes) -> Key:
+    digits = [digit for digit, in _digit.iter_unpack(blob)]
+    return (digits[0] - (1 << 63),) + tuple(digits[1:])
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS periods (
+    id INTEGER PRIMARY KEY,
+    key BLOB NOT NULL,
+    text TEXT NOT NULL,
+    is_dark INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS periods_order ON periods (key, id);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    period INTEGER NOT NULL REFERENCES periods (id) ON DELETE CASCADE,
+    key BLOB NOT NULL,
+    text TEXT NOT NULL,
+    is_dark INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_order ON events (period, key, id);
+
+CREATE TABLE IF NOT EXISTS scenes (
+    id INTEGER PRIMARY KEY,
+    event INTEGER NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+    key BLOB NOT NULL,
+    question TEXT NOT NULL,
+    setting TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    is_dark INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scenes_order ON scenes (event, key, id);
+
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Where each level's cards go and what their parent column is called
+_tables = {1: ("periods", None), 2: ("events", "period"), 3: ("scenes", "event")}
+
+DATABASE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class Database(Autosave):
+    # A game saved in an SQLite database at path instead, with a table for each kind of card. Like with a GameFile,
+    # only the periods are read in when it's opened, and each period's events and each event's scenes are read when
+    # something first needs them, which is a lookup in the index on their parent and key. The writer thread makes each
+    # write a transaction of its own.
+    #
+    # SQLite connections belong to the thread that made them, so there are two: one for reading on the thread that
+    # loads the game and one for the writer thread. The database is in WAL mode, which lets them both go at once.
+    path: str
+    history: History = None
+    reader: sqlite3.Connection = None
+    connection: sqlite3.Connection = None  # The writer thread's
+    last_id: int = 0  # The highest of this site's ids in the database, which is what's saved as last_id
+
+    def __init__(self, path: str, debounce: float = None, interval: float = None):
+        super().__init__(debounce, interval)
+        self.path = path
+
+    @staticmethod
+    def connect(path: str) -> sqlite3.Connection:
+        # Each connection is only used by one thread at a time, but the writer's gets closed by whoever closes the game
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript(_schema)
+        return connection
+
+    def load(self, history: History, apply: Callable[[Op], object] = None,
+             insert_period: Callable[[int, Period], None] = None):
+        # Like GameFile.load. There are no changes to replay, so apply isn't used, but it's taken so either can be
+        # opened the same way.
+        self.history = history
+        insert_period = insert_period if insert_period is not None else history.insert_period
+        self.reader = self.connect(self.path)
+
+        last_id = self.reader.execute("SELECT value FROM settings WHERE name = 'last_id'").fetchone()
+        self.last_id = last_id[0] if last_id is not None else 0
+        # Databases written before last_id kept up with recorded inserts can have ids past it, so take those into
+        # account too
+        for table, _ in _tables.values():
+            highest = self.reader.execute("SELECT MAX(id & 4294967295) FROM {} WHERE id >> 32 = ?".format(table),
+                                          (history.site,)).fetchone()[0]
+            self.last_id = max(self.last_id, highest or 0)
+        history.last_id = max(history.last_id, self.last_id)
+        history.locate = self.locate
+        history.highest_unloaded = max(self.reader.execute("SELECT MAX(id) FROM {}".format(table)).fetchone()[0] or 0
+                                       for table in ("events", "scenes"))
+
+        rows = self.reader.execute("SELECT id, key, text, is_dark,"
+                                   " (SELECT COUNT(*) FROM events WHERE period = periods.id)"
+                                   " FROM periods ORDER BY key, id").fetchall()
+        for index, (id, key, text, is_dark, count) in enumerate(rows):
+            period = Period(text, bool(is_dark), id=id, key=blob_key(key))
+            if count:
+                history.defer(period, count, partial(self.events, period.id))
+            insert_period(index, period)
+        self.start()
+
+    def locate(self, id: int) -> Optional[int]:
+        # See History.locate. Ids are the tables' primary keys, so these are lookups in their indexes.
+        for table, parent in (("events", "period"), ("scenes", "event")):
+            row = self.reader.execute("SELECT {} FROM {} WHERE id = ?".format(parent, table), (id,)).fetchone()
+            if row is not None:
+                return row[0]
+        return None
+
+    def events(self, period: int) -> List[Event]:
+        events = []
+        for id, key, text, is_dark, count in self.reader.execute(
+                "SELECT id, key, text, is_dark, (SELECT COUNT(*) FROM scenes WHERE event = events.id) FROM events"
+                " WHERE period = ? ORDER BY key, id", (period,)):
+            event = Event(text, bool(is_dark), id=id, key=blob_key(key))
+            if count:
+                self.history.defer(event, count, partial(self.scenes, event.id))
+            events.append(event)
+        return events
+
+    def scenes(self, event: int) -> List[Scene]:
+        return [Scene(question, setting, answer, bool(is_dark), id=id, key=blob_key(key))
+                for id, key, question, setting, answer, is_dark in self.reader.execute(
+                    "SELECT id, key, question, setting, answer, is_dark FROM scenes WHERE event = ? ORDER BY key, id",
+                    (event,))]
+
+    def write(self, changes: List[Op]):
+        if self.connection is None:
+            self.connection = self.connect(self.path)
+        last_id = max(self.last_id, self.history.last_id)
+        with self.connection:
+            for op in changes:
+                table, parent = _tables[op.level]
+                if op.kind == ops.INSERT:
+                    names = ("id", "key") + ops.FIELDS[op.level]
+                    values = (op.card, key_blob(op.key)) + tuple(op.fields[name] for name in ops.FIELDS[op.level])
+                    if parent is not None:
+                        names += (parent,)
+                        values += (op.parent,)
+                    self.connection.execute("INSERT OR IGNORE INTO {} ({}) VALUES ({})".format(
+                        table, ", ".join(names), ", ".join("?" * len(names))), values)
+                    if op.card >> 32 == self.history.site:
+                        # Ops can be recorded with ids that didn't come from new_id, so last_id doesn't cover them
+                        last_id = max(last_id, op.card & 0xffffffff)
+                elif op.kind == ops.EDIT:
+                    names = [name for name in ops.FIELDS[op.level] if name in op.fields]
+                    if names:
+                        self.connection.execute("UPDATE {} SET {} WHERE id = ?".format(
+                            table, ", ".join(name + " = ?" for name in names)),
+                            [op.fields[name] for name in names] + [op.card])
+                else:
+                    self.connection.execute("DELETE FROM {} WHERE id = ?".format(table), (op.card,))
+            self.connection.execute("INSERT OR REPLACE INTO settings VALUES ('last_id', ?)", (last_id,))
+        self.last_id = last_id
+
+    def close(self):
+        super().close()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+def open_game(path: str, debounce: float = None, interval: float = None) -> Autosave:
+    # A Database for paths with one of DATABASE_SUFFIXES on the end, otherwise a GameFile. Either still needs loading.
+    if path.lower().endswith(DATABASE_SUFFIXES):
+        return Database(path, debounce, interval)
+    return GameFile(path, debounce, interval)
+
+
+def save_as(history: History, path: str):
+    # Writes the whole of history out to path, which shouldn't have a game saved at it already, in the format
+    # open_game would open it as
+    if not path.lower().endswith(DATABASE_SUFFIXES):
+        write_snapshot(path, history, 0)
+        return
+    game = Database(path)
+    saved = History()
+    saved.site = history.site
+    game.load(saved)
+    saved.last_id = history.last_id  # Ids that were given out and went again still can't be used again
+    with game.action():
+        for op in ops.snapshot(history):
+            game.record(op)
+    game.close()
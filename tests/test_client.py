@@ -0,0 +1,63 @@
+import asyncio
+
+import ops
+from client import Client
+from server import GameServer
+
+
+def test_changes_made_while_rejoining_go_out_in_order():
+    async def main():
+        game = GameServer()
+        server = await game.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        client = Client()
+        for message in await client.connect("127.0.0.1", port):
+            client.receive(message)
+        running = asyncio.ensure_future(client.run())
+        client.submit(ops.insert_op(client.history, None, 0, {"text": "first", "is_dark": False}))
+        await asyncio.sleep(.1)
+        await client.close()
+        await running
+
+        # One change while the connection's down, and another after it's back but before the server's said where it's
+        # up to
+        client.submit(ops.insert_op(client.history, None, 1, {"text": "offline", "is_dark": False}))
+        messages = await client.connect("127.0.0.1", port)
+        client.submit(ops.insert_op(client.history, None, 2, {"text": "rejoining", "is_dark": False}))
+        for message in messages:
+            client.receive(message)
+        running = asyncio.ensure_future(client.run())
+        await asyncio.sleep(.2)
+
+        assert client.pending == []
+        assert ops.snapshot(game.history) == ops.snapshot(client.history)
+        assert [period.text for period in game.history.periods] == ["first", "offline", "rejoining"]
+
+        await client.close()
+        await running
+        server.close()
+
+    asyncio.run(main())
+
+
+def test_server_drops_a_client_that_skips_a_change():
+    async def main():
+        game = GameServer()
+        server = await game.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        client = Client()
+        for message in await client.connect("127.0.0.1", port):
+            client.receive(message)
+        running = asyncio.ensure_future(client.run())
+        op = ops.insert_op(client.history, None, 0, {"text": "skipped ahead", "is_dark": False})
+        client.outbox.add({"type": "op", "op": op, "seq": 2})
+        await asyncio.wait_for(running, 1)  # The server hangs up rather than answering
+
+        assert game.acked[client.id] == 0
+        assert len(game.history.periods) == 0
+        await client.close()
+        server.close()
+
+    asyncio.run(main())
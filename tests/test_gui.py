@@ -0,0 +1,15 @@
+import tkinter
+
+import pytest
+
+from gui import TclScript
+
+
+@pytest.mark.parametrize("word", ["a b", "{x", "x}", "$y", "[exit]", "", "tab\there", "new\nline", "back\\slash", "\\",
+                                  'q"uote', ";", "#c", "é雪", "plain", ".!canvas"])
+def test_script_words_are_taken_literally(word):
+    tcl = tkinter.Tcl()
+    script = TclScript(tcl)
+    script.call("lappend", "result", word, 1.5, 3)
+    script.flush()
+    assert tcl.call("set", "result") == (word, "1.5", "3")
@@ -0,0 +1,208 @@
+import random
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+import pytest
+
+import ops
+from benchmarks.merge import random_change
+from client import Client
+from model import History
+from ops import Op
+from server import GameServer
+
+
+PLAYERS = 4
+CHANGES = 60
+ORDERINGS = 20
+
+
+def copy(history: History) -> History:
+    result = History()
+    for op in ops.snapshot(history):
+        ops.apply(result, op)
+    result.site = history.site
+    result.last_id = history.last_id
+    return result
+
+
+def start(rng: random.Random) -> History:
+    base = History()
+    for _ in range(rng.randint(0, 30)):
+        ops.apply(base, random_change(rng, base))
+    return base
+
+
+def interleave(rng: random.Random, streams: List[List[Op]]) -> List[Op]:
+    # Each stream's ops stay in their order, like they would over a connection
+    streams = [list(reversed(stream)) for stream in streams if stream]
+    result = []
+    while streams:
+        stream = rng.choice(streams)
+        result.append(stream.pop())
+        if not stream:
+            streams.remove(stream)
+    return result
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_inserts_and_deletes_in_any_order(seed):
+    # Concurrent inserts and deletes have to come out the same whatever order they arrive in. A few players start off
+    # from the same history and make changes without hearing about anyone else's, and then all of them are applied to
+    # copies of the starting history in different orders. Every copy has to end up the same, and every player's cards
+    # have to keep the order that player gave them.
+    rng = random.Random(seed)
+    base = start(rng)
+
+    streams = []
+    for player in range(1, PLAYERS + 1):
+        history = copy(base)
+        history.site = player
+        stream = []
+        for _ in range(rng.randint(0, CHANGES)):
+            op = random_change(rng, history)
+            ops.apply(history, op)
+            stream.append(op)
+        streams.append((history, stream))
+
+    expected = None
+    for _ in range(ORDERINGS):
+        merged = copy(base)
+        for op in interleave(rng, [stream for _, stream in streams]):
+            ops.apply(merged, op)
+        result = ops.snapshot(merged)
+        if expected is None:
+            expected = result
+        assert result == expected, "orderings disagree"
+
+        # Whatever survived of each player's cards is still in the order that player saw
+        for history, _ in streams:
+            for cards in [merged.periods] + [card.events if ops.level_of(card) == 1 else card.scenes
+                                             for card in merged.cards.values() if ops.level_of(card) < 3]:
+                theirs = [card.id for card in cards if card.id in history.cards]
+                assert theirs == sorted(theirs, key=lambda card: ops.index_of(history, history.cards[card]))
+
+
+class Relay(GameServer):
+    # A server whose messages go into an inbox for each client instead of over a connection
+    inboxes: Dict[int, Deque[dict]]
+
+    def __init__(self, history: History):
+        super().__init__(history)
+        self.inboxes = {}
+
+    def add(self, client: int):
+        self.acked[client] = 0
+        self.inboxes[client] = deque()
+
+    def send(self, client: int, message: dict):
+        self.inboxes[client].append(message)
+
+    def broadcast(self, message: dict):
+        for inbox in self.inboxes.values():
+            inbox.append(message)
+
+
+def play(rng: random.Random, base: History, edits: float) -> Tuple[Relay, List[Client]]:
+    # Players make changes, the server gets them and players hear back, all in a random order until everything's got
+    # everywhere
+    server = Relay(copy(base))
+    clients = []
+    for player in range(1, PLAYERS + 1):
+        client = Client(copy(base))
+        client.id = client.history.site = player
+        server.add(player)
+        clients.append(client)
+    sent = {client.id: 0 for client in clients}  # The last seq the server's been given from each
+    made = {client.id: 0 for client in clients}
+
+    def unsent(client: Client) -> list:
+        return [entry for entry in client.pending if entry[0] > sent[client.id]]
+
+    while True:
+        moves = []
+        for client in clients:
+            if made[client.id] < CHANGES:
+                moves.append((0, client))
+            if unsent(client):
+                moves.append((1, client))
+            if server.inboxes[client.id]:
+                moves.append((2, client))
+        if not moves:
+            break
+        move, client = rng.choice(moves)
+        if move == 0:
+            client.submit(random_change(rng, client.history, edits))
+            made[client.id] += 1
+        elif move == 1:
+            seq, op, _ = unsent(client)[0]
+            server.receive(client.id, {"type": "op", "op": op, "seq": seq})
+            sent[client.id] = seq
+        else:
+            client.receive(server.inboxes[client.id].popleft())
+    return server, clients
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_edits_come_out_the_same_everywhere(seed):
+    # Edits don't come out the same in any order: the last one the server makes wins. So what has to hold is that every
+    # player ends up with what the server has, whatever they did while their changes were on their way.
+    rng = random.Random(seed)
+    server, clients = play(rng, start(rng), .5)
+    expected = ops.snapshot(server.history)
+    for client in clients:
+        assert client.pending == []
+        assert ops.snapshot(client.history) == expected
+
+
+@pytest.mark.parametrize("edit_first", [True, False])
+def test_edit_against_delete(edit_first):
+    # One player edits a card while another deletes it. Whichever the server gets first, the card's gone everywhere.
+    base = History()
+    ops.apply(base, ops.insert_op(base, None, 0, {"text": "Dawn", "is_dark": False}))
+    period = base.periods[0]
+    ops.apply(base, ops.insert_op(base, period, 0, {"text": "The first city", "is_dark": False}))
+    event = period.events[0]
+
+    server = Relay(copy(base))
+    editor, deleter = Client(copy(base)), Client(copy(base))
+    for player, client in enumerate((editor, deleter), 1):
+        client.id = client.history.site = player
+        server.add(player)
+
+    editor.submit(ops.edit_op(event, {"text": "The first city burns"}))
+    deleter.submit(ops.delete_op(period))
+    order = [editor, deleter] if edit_first else [deleter, editor]
+    for client in order:
+        seq, op, _ = client.pending[0]
+        server.receive(client.id, {"type": "op", "op": op, "seq": seq})
+    for client in (editor, deleter):
+        while server.inboxes[client.id]:
+            client.receive(server.inboxes[client.id].popleft())
+
+    assert len(server.history.periods) == 0
+    for client in (editor, deleter):
+        assert client.pending == []
+        assert len(client.history.periods) == 0
+        assert event.id not in client.history.cards
+
+
+@pytest.mark.parametrize("key", [(5, 0), (5, 3, 0), (1 << 63, 1), ((-1 << 63) - 1, 1), (-1 << 63,), (1, 1 << 64),
+                                 (1, -1), ()])
+def test_bad_positions_are_rejected(key):
+    history = History()
+    op = ops.Op(ops.INSERT, 1, 7, {"text": "Dawn", "is_dark": False}, None, key)
+    with pytest.raises(ops.OpError):
+        ops.apply(history, op)
+    assert len(history.periods) == 0
+
+
+def test_room_after_every_key_that_gets_in():
+    # The ones that are allowed always leave room next to them
+    history = History()
+    for key in [(5,), (5, 1), (5, 0, 1), (-1 << 63, 1), (-1 << 63, (1 << 64) - 1), ((1 << 63) - 1, 1)]:
+        ops.apply(history, ops.Op(ops.INSERT, 1, history.new_id(), {"text": "", "is_dark": False}, None, key))
+    for index in range(len(history.periods) + 1):
+        ops.apply(history, ops.insert_op(history, None, index, {"text": "", "is_dark": False}))
+    keys = [period.key for period in history.periods]
+    assert keys == sorted(keys) and len(set(keys)) == len(keys)
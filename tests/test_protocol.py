@@ -0,0 +1,101 @@
+import asyncio
+import random
+import zlib
+
+import pytest
+
+import protocol
+from benchmarks.wire import random_messages
+from ops import EDIT, INSERT, Op
+
+
+def body(payload: bytes, flags: int = 0) -> bytes:
+    # A frame without its length
+    return bytes((protocol.VERSION, flags)) + payload
+
+
+@pytest.mark.parametrize("messages", [
+    [],
+    [{"type": "error", "message": "", "seq": 0}],
+    [{"type": "snapshot", "client": 1, "version": 0, "acked": 0, "ops": []}],
+    [{"type": "op", "op": Op(EDIT, 1, 1, {}), "seq": 1, "version": 0}],
+    [{"type": "op", "op": Op(INSERT, 3, 1 << 40, {"question": "", "setting": "\x00", "answer": "🐉", "is_dark": True},
+                             1, (-1 << 40, 1)), "seq": 1 << 40, "version": 1}],
+])
+def test_round_trip(messages):
+    frame = protocol.encode(messages)
+    assert int.from_bytes(frame[:4], "big") == len(frame) - 4
+    assert protocol.decode(frame[4:]) == messages
+
+
+def test_round_trip_random():
+    rng = random.Random(1)
+    compressed = 0
+    for _ in range(500):
+        messages = random_messages(rng, rng.randint(1, 64))
+        frame = protocol.encode(messages)
+        if frame[5] & protocol.COMPRESSED:
+            compressed += 1
+        assert int.from_bytes(frame[:4], "big") == len(frame) - 4
+        assert protocol.decode(frame[4:]) == messages
+    assert compressed  # Both kinds of frame got tried
+
+
+def test_bad_varint():
+    # More continuation bytes than a 64 bit number has room for
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(body(b"\xff" * 11 + b"\x01"))
+
+
+@pytest.mark.parametrize("cut", [1, 2, 5, 10])
+def test_truncated_payload(cut):
+    message = {"type": "error", "message": "the empire falls", "seq": 7}
+    frame = protocol.encode([message])
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(frame[4:-cut])
+
+
+def test_junk_after_payload():
+    frame = protocol.encode([{"type": "hello", "client": 0, "version": 0}])
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(frame[4:] + b"\x00")
+
+
+def test_unknown_version():
+    frame = protocol.encode([])
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(bytes((protocol.VERSION + 1,)) + frame[5:])
+
+
+def test_oversized_length():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data((protocol.MAX_FRAME + 1).to_bytes(4, "big") + body(b"\x00"))
+        reader.feed_eof()
+        await protocol.read_messages(reader)
+
+    with pytest.raises(protocol.ProtocolError):
+        asyncio.run(main())
+
+
+def test_corrupt_zlib():
+    frame = protocol.encode(random_messages(random.Random(2), 64))
+    assert frame[5] & protocol.COMPRESSED
+    corrupt = bytearray(frame[4:])
+    corrupt[2:6] = b"\xff\xff\xff\xff"
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(bytes(corrupt))
+
+
+def test_truncated_zlib():
+    frame = protocol.encode(random_messages(random.Random(2), 64))
+    assert frame[5] & protocol.COMPRESSED
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(frame[4:-10])
+
+
+def test_compressed_frame_too_long_once_decompressed():
+    # Well under a MB, but it would inflate to past MAX_FRAME
+    payload = zlib.compress(bytes(protocol.MAX_FRAME + 1))
+    with pytest.raises(protocol.ProtocolError, match="decompressed"):
+        protocol.decode(body(payload, protocol.COMPRESSED))
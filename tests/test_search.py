@@ -0,0 +1,34 @@
+from model import Event, Period
+from search import SearchIndex
+
+
+def test_edits_keep_the_index_up_to_date():
+    index = SearchIndex()
+    period = Period("The empire falls", False, id=1)
+    event = Event("The empire falls and falls", False, id=2)
+    index.add(period)
+    index.add(event)
+    assert index.postings["falls"] == {1: 1, 2: 2}
+
+    event.text = "The empire rises"
+    index.add(event)
+    assert index.postings["falls"] == {1: 1}
+    assert index.postings["rises"] == {2: 1}
+    assert sorted(index.search("empire")) == [1, 2]
+
+    period.text = "Dawn"
+    index.add(period)
+    assert "falls" not in index.postings
+    assert "falls" not in index.vocabulary
+    assert index.search("fal") == []
+    assert index.vocabulary == sorted(index.postings)
+
+
+def test_cards_without_words_still_count():
+    index = SearchIndex()
+    index.add(Period("", False, id=1))
+    index.add(Period("Dawn", False, id=2))
+    assert len(index) == 2
+    index.remove(Period("", False, id=1))
+    assert len(index) == 1
+    assert index.search("dawn") == [2]
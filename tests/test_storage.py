@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import time
+from typing import Tuple
+
+import pytest
+
+import ops
+import storage
+from benchmarks.campaign import generate
+from model import Event, History, Period
+
+
+def load(path: str) -> Tuple[History, storage.Autosave]:
+    history = History()
+    game = storage.open_game(path)
+    game.load(history)
+    return history, game
+
+
+def test_database_ids_carry_on_after_recorded_inserts(tmp_path):
+    # Ops recorded with their ids already made, like a game copied in from elsewhere
+    original = History()
+    original.insert_period(0, Period("Dawn", False, [Event("The first city", False)]))
+    original.insert_period(1, Period("Dusk", True))
+    path = os.path.join(tmp_path, "game.db")
+
+    history, game = load(path)
+    with game.action():
+        for op in ops.snapshot(original):
+            game.record(op)
+    game.close()
+
+    history, game = load(path)
+    assert history.last_id >= original.last_id
+    op = ops.insert_op(history, None, 2, {"text": "Night", "is_dark": False})
+    assert op.card not in original.cards
+    ops.apply(history, op)
+    game.record(op)
+    game.close()
+
+    history, game = load(path)
+    assert [period.text for period in history.periods] == ["Dawn", "Dusk", "Night"]
+    game.close()
+
+
+def test_database_ids_carry_on_past_a_stale_last_id(tmp_path):
+    # Saved before last_id kept up with recorded inserts
+    path = os.path.join(tmp_path, "game.db")
+    history, game = load(path)
+    game.record(ops.insert_op(history, None, 0, {"text": "Dawn", "is_dark": False}))
+    game.close()
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE settings SET value = 0 WHERE name = 'last_id'")
+    connection.close()
+
+    history, game = load(path)
+    op = ops.insert_op(history, None, 1, {"text": "Dusk", "is_dark": False})
+    ops.apply(history, op)
+    game.record(op)
+    game.close()
+
+    history, game = load(path)
+    assert [period.text for period in history.periods] == ["Dawn", "Dusk"]
+    game.close()
+
+
+def test_autosave_needs_write():
+    class Forgetful(storage.Autosave):
+        pass
+
+    with pytest.raises(TypeError):
+        Forgetful()
+
+
+@pytest.mark.parametrize("name", ["game.mscope", "game.db"])
+def test_save_as(tmp_path, name):
+    original = generate(0, 3, 2, 2)
+    path = os.path.join(tmp_path, name)
+    storage.save_as(original, path)
+
+    history, game = load(path)
+    assert ops.snapshot(history) == ops.snapshot(original)
+    op = ops.insert_op(history, None, 0, {"text": "Dawn", "is_dark": False})
+    assert op.card not in original.cards
+    ops.apply(history, op)
+    game.record(op)
+    game.close()
+
+    history, game = load(path)
+    assert len(history.periods) == len(original.periods) + 1
+    assert history.periods[0].text == "Dawn"
+    game.close()
+
+
+def test_autosave_keeps_going_after_a_write_fails():
+    class Flaky(storage.Autosave):
+        def __init__(self):
+            super().__init__(debounce=0, interval=.01)
+            self.written = []
+
+        def write(self, changes):
+            if any(op.key[-1] == 0 for op in changes):
+                raise ValueError("can't save that")
+            self.written += changes
+
+    game = Flaky()
+    game.start()
+    bad = ops.Op(ops.INSERT, 1, 7, {"text": "Dawn", "is_dark": False}, None, (1, 0))
+    game.record(bad)
+    end = time.monotonic() + 5
+    while game.error is None and time.monotonic() < end:
+        time.sleep(.01)
+    assert game.writer.is_alive()
+    assert isinstance(game.error, ValueError)
+
+    with game.condition:
+        game.pending.remove(bad)
+    good = ops.Op(ops.INSERT, 1, 8, {"text": "Dusk", "is_dark": False}, None, (2,))
+    game.record(good)
+    game.close()
+    assert game.written == [good]
+
+
+@pytest.mark.parametrize("name", ["game.mscope", "game.db"])
+def test_cards_are_found_without_reading_everything_in(tmp_path, name):
+    original = generate(0, 4, 5, 6)
+    path = os.path.join(tmp_path, name)
+    storage.save_as(original, path)
+
+    history, game = load(path)
+    assert len(history.cards) == len(original.periods)
+    assert history.highest_unloaded == max(original.cards)
+
+    # A change to a scene reads in its event's scenes and its period's events, and nothing else
+    scene = original.periods[2].events[3].scenes[4]
+    ops.apply(history, ops.edit_op(scene, {"answer": "Nobody"}))
+    assert history.cards[scene.id].answer == "Nobody"
+    assert len(history.cards) == len(original.periods) + 5 + 6
+    assert history.card(history.new_id()) is None
+
+    # Deleting a period that's not been read in takes its cards with it
+    period = original.periods[0]
+    ops.apply(history, ops.delete_op(period))
+    assert history.card(period.events[0].scenes[0].id) is None
+    assert period.id not in history.deferred
+
+    while history.deferred:
+        ops.siblings(history, next(iter(history.deferred.values()))).load()
+    assert len(history.cards) == len(original.cards) - 1 - 5 - 5 * 6
+    game.close()
+
+
+def test_compaction_leaves_the_open_snapshot_alone(tmp_path):
+    path = os.path.join(tmp_path, "game.mscope")
+    storage.save_as(generate(0, 2, 2, 2), path)
+    opened = os.stat(path)
+
+    history = History()
+    game = storage.GameFile(path, debounce=0)
+    game.compact_size = 1024
+    game.load(history)
+    for i in range(200):
+        op = ops.edit_op(history.periods[0], {"text": "Edit {}".format(i)})
+        ops.apply(history, op)
+        game.record(op)
+        if game.compactor is not None:
+            break
+        time.sleep(.005)
+    game.close()
+
+    # The one that was open never got replaced, and the new one's there to switch to
+    assert game.compactor is not None and game.compact_error is None
+    assert os.stat(path).st_ino == opened.st_ino
+    assert storage.snapshots(path)
+
+    history, game = load(path)
+    assert history.periods[0].text == "Edit {}".format(i)
+    assert storage.snapshots(path) == []
+    game.close()
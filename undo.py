@@ -0,0 +1,77 @@
+from collections import deque
+from typing import Callable, Deque, List
+
+from ops import INSERT, Op
+
+
+# Undo and redo for the player's own changes. A step is kept as the ops that reverse it, which is what ops.apply gives
+# back anyway, rather than as a copy of anything: an insert is undone by a delete, an edit by an edit back to the old
+# values of just the fields it changed, and a delete by inserts for the card and everything that was under it. So a
+# step costs about as much as the change it undoes, however big the game is.
+#
+# Undoing a step applies its ops, and what applying them gives back is the step that redoes it, and the other way
+# around. Other players' changes aren't in here. Undoing after someone else has changed the same cards works the same
+# as any other change would then: edits put back the old text, and ops for cards that have gone since don't do anything.
+
+
+class UndoLog:
+    limit: int = 100  # Steps kept, undo and redo together. The oldest go first.
+    max_ops: int = 100_000  # Ops kept, for when a few steps are big ones like deleting whole periods
+
+    undo_steps: Deque[List[Op]]
+    redo_steps: Deque[List[Op]]
+    size: int = 0  # Ops in both
+
+    def __init__(self, limit: int = None, max_ops: int = None):
+        if limit is not None:
+            self.limit = limit
+        if max_ops is not None:
+            self.max_ops = max_ops
+        self.undo_steps = deque()
+        self.redo_steps = deque()
+
+    def record(self, undo: List[Op]):
+        # A new change, given the ops that undo it. Anything that could have been redone can't be any more.
+        if not undo:
+            return
+        self.size -= sum(len(step) for step in self.redo_steps)
+        self.redo_steps.clear()
+        self.push(self.undo_steps, undo)
+
+    def undo(self, apply: Callable[[Op], List[Op]]) -> bool:
+        # Undoes the last step, applying ops with apply (which gives back the ops that undo each, like ops.apply).
+        # False if there wasn't one.
+        return self.move(self.undo_steps, self.redo_steps, apply)
+
+    def redo(self, apply: Callable[[Op], List[Op]]) -> bool:
+        return self.move(self.redo_steps, self.undo_steps, apply)
+
+    def move(self, source: Deque[List[Op]], target: Deque[List[Op]], apply: Callable[[Op], List[Op]]) -> bool:
+        if not source:
+            return False
+        step = source.pop()
+        self.size -= len(step)
+
+        # Put back in reverse, so the last thing the step did is the first thing undone. Cards that went in under a card
+        # that went in with them go when it does, so they don't need their own deletes.
+        inserted = set()
+        parts = []
+        for op in step:
+            undo = apply(op)
+            if op.kind == INSERT and undo:
+                inserted.add(op.card)
+                if op.parent in inserted:
+                    continue
+            parts.append(undo)
+        self.push(target, [op for part in reversed(parts) for op in part])
+        return True
+
+    def push(self, steps: Deque[List[Op]], step: List[Op]):
+        if not step:
+            return
+        steps.append(step)
+        self.size += len(step)
+        while len(self.undo_steps) + len(self.redo_steps) > self.limit or self.size > self.max_ops:
+            # The bottoms of the stacks are the furthest steps from how things are now, undo's first
+            oldest = self.undo_steps if self.undo_steps else self.redo_steps
+            self.size -= len(oldest.popleft())